@@ -7,6 +7,8 @@ from flask_moment import Moment
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from sqlalchemy import MetaData
+from app.json_provider import FastJSONProvider
+from app.tenancy import TenantSession
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -25,13 +27,14 @@ moment = Moment()
 login = LoginManager()
 login.login_view = 'auth.login'
 migrate = Migrate()
-db = SQLAlchemy(metadata=metadata)
+db = SQLAlchemy(metadata=metadata, session_options={'class_': TenantSession})
 
 
 def create_app(config_name):
     # Application factory
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = FastJSONProvider(app)
     
     bootstrap.init_app(app)
     moment.init_app(app)
@@ -39,6 +42,14 @@ def create_app(config_name):
     login.init_app(app)
     migrate.init_app(app, db, render_as_batch=True)
     
+    from app import sqlstats, engine, tenancy
+    tenancy.init_app(app)
+    sqlstats.init_app(app)
+    engine.init_app(app)
+    
+    from app import directory # registers the users_fts full-text index DDL on users_table
+    from app import postings # registers the trigger filling postings_table from transactions_table
+    
     from app.api import api as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
     
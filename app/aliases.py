@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db, tenancy
+from app.models import PaymentAlias
+
+
+class AliasIndex:
+    """In-memory LRU of alias -> account number lookups
+        - Lookups that do not move money are resolved without a database round trip. Transfers always read the
+        database and refresh the entry, see resolve()
+        - Entries expire after ttl seconds so changes made by other processes are picked up
+        - Changes made by this process invalidate the affected aliases straight away
+
+    Args:
+        capacity (int): maximum number of aliases kept in memory
+        ttl (float): seconds an entry is trusted before it is read again
+    """
+
+    def __init__(self, capacity, ttl):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, alias):
+        # Returns the cached account number of alias, None when it is not cached or has expired
+        with self._lock:
+            entry = self._entries.get(alias)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(alias)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, alias, account_num):
+        with self._lock:
+            self._entries[alias] = (account_num, time.monotonic())
+            self._entries.move_to_end(alias)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def discard(self, *aliases):
+        with self._lock:
+            for alias in aliases:
+                self._entries.pop(alias, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def metrics(self):
+        return {'entries': len(self), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses}
+
+
+def get_index():
+    # One index per application and tenant, so each app (and each test app) sees only its own database
+    index = tenancy.extensions().get('payment_aliases')
+    if index is None:
+        index = tenancy.extensions().setdefault('payment_aliases', AliasIndex(
+            current_app.config['PAYMENT_ALIAS_CACHE_SIZE'], current_app.config['PAYMENT_ALIAS_CACHE_TTL']))
+    return index
+
+
+def resolve(value, fresh=False):
+    """Account number receiving transfers sent to an email address or phone number
+
+    Args:
+        value (str): alias as typed by the payer
+        fresh (bool): read the database rather than the in-memory index. Transfers must: other processes only
+            invalidate their own index, an entry can name an alias' previous account for up to
+            PAYMENT_ALIAS_CACHE_TTL seconds after it moved
+
+    Raises:
+        ValueError: when value is neither an email address nor a phone number
+
+    Returns:
+        int: account number, None when no account uses the alias
+    """
+    _, alias = PaymentAlias.normalize(value)
+    index = get_index()
+    account_num = None if fresh else index.get(alias)
+    if account_num is None:
+        account_num = db.session.execute(db.select(PaymentAlias.account_num).where(PaymentAlias.alias == alias)).scalar()
+        if account_num is not None:
+            index.put(alias, account_num)
+        else:
+            index.discard(alias)
+    return account_num
+
+
+def rename_email(user_id, old_email, new_email):
+    """Moves a user's email alias to their new email address
+        - Call before committing the email change, the alias update joins the same transaction
+
+    Args:
+        user_id (int): ID of user changing email
+        old_email (str): previous email address
+        new_email (str): new email address
+    """
+    try:
+        _, old_alias = PaymentAlias.normalize(old_email)
+        _, new_alias = PaymentAlias.normalize(new_email)
+    except ValueError:
+        return
+    table = PaymentAlias.__table__
+    owned = (table.c.alias == old_alias) & (table.c.user_id == user_id) & (table.c.kind == 'email')
+    # OR IGNORE leaves the row alone when another user holds the new alias, even one taken since any check here
+    if not db.session.execute(db.update(table).where(owned).values(alias=new_alias).prefix_with('OR IGNORE')).rowcount:
+        # Emails differing only in case belong to different users, the first one keeps the alias
+        db.session.execute(db.delete(table).where(owned))
+    get_index().discard(old_alias, new_alias)
+
+
+def add_email_alias(account):
+    """Registers the owner's email address as an alias of a newly opened account
+        - Skipped when the alias is taken, by a user whose email differs only in case. The insert ignores
+        conflicts, so registrations racing for the alias never fail on the unique constraint
+
+    Args:
+        account (Accounts): saved account, its owner's email becomes the alias
+    """
+    try:
+        kind, alias = PaymentAlias.normalize(account.account_owner.email)
+    except ValueError:
+        return
+    db.session.execute(sqlite_insert(PaymentAlias).values(alias=alias, kind=kind, account_num=account.account_num,
+                                                          user_id=account.owner).on_conflict_do_nothing())
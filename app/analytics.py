@@ -0,0 +1,414 @@
+import json
+import os
+import shutil
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from app import db, archive, tenancy
+from app.models import Transactions, TransactionType
+
+
+# Columnar snapshot of the transaction journal, so analytics are answered with vectorized NumPy operations rather
+# than queries over transactions_table.
+# - One raw file per column in ANALYTICS_SNAPSHOT_DIR (a subdirectory per tenant), memory-mapped read-only by every
+# process that reads it.
+# - refresh() appends the transactions recorded since the previous refresh: journal rows never change and ids only
+# grow. It then replaces the manifest holding the row count, readers map that many rows. Bytes appended past it by
+# an interrupted refresh are ignored, and cut by the next one.
+# - Archived months are read from their archive files when the snapshot does not cover them yet.
+# - Each refresh also rebuilds an index of the rows of every account, so per-account reads (insights()) only touch
+# that account's rows. It is written to a new directory named in the manifest, the previous one is kept for readers
+# still opening it.
+
+COLUMNS = (('id', '<i8'), ('sender', '<i8'), ('receiver', '<i8'), ('amount', '<f8'), ('timestamp', '<i8'),
+           ('type_id', '<i4'))
+ROW = np.dtype(list(COLUMNS))
+
+# Journal rows after id lo, oldest first, with epoch seconds computed by SQLite
+SNAPSHOT_ROWS = (db.select(Transactions.id, Transactions.sender, Transactions.receiver,
+                           db.func.coalesce(Transactions.amount, 0),
+                           db.func.coalesce(db.cast(db.func.strftime('%s', Transactions.date_time), db.Integer), 0),
+                           db.func.coalesce(Transactions.transaction_type_id, 0))
+                 .where(Transactions.id > db.bindparam('lo'))
+                 .order_by(Transactions.id).limit(db.bindparam('limit')))
+# Transactions of some accounts recorded after id lo, not in the snapshot yet
+ACCOUNT_TAIL_ROWS = (SNAPSHOT_ROWS.limit(None)
+                     .where(Transactions.sender.in_(db.bindparam('accounts', expanding=True))
+                            | Transactions.receiver.in_(db.bindparam('accounts', expanding=True))))
+
+PERIODS = ('day', 'week', 'month')
+
+
+class Snapshot:
+    """Columns of the journal as of one refresh, memory-mapped read-only
+
+    Args:
+        directory (str): snapshot directory
+        manifest (dict): its manifest, row count, last transaction ID, transaction type names and refresh time
+    """
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.rows = manifest['rows']
+        self.last_id = manifest['last_id']
+        self.types = {int(type_id): name for type_id, name in manifest['types'].items()}
+        self.refreshed_at = manifest['refreshed_at']
+        self.columns = {name: _map(os.path.join(directory, name), dtype, self.rows) for name, dtype in COLUMNS}
+        self._months = None
+        index = os.path.join(directory, manifest.get('index') or '')
+        self.positions = _map(os.path.join(index, 'positions'), '<i8', manifest.get('indexed', 0))
+        self.offsets = _map(os.path.join(index, 'offsets'), '<i8', manifest.get('accounts', 0))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def type_id(self, name):
+        return next((type_id for type_id, type_name in self.types.items() if type_name == name), -1)
+
+    def months(self):
+        # Months since January 1970 of every row
+        if self._months is None:
+            self._months = self['timestamp'].astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+        return self._months
+
+    def account_rows(self, account_nums):
+        # Row numbers of the transactions involving any of account_nums, from the account index
+        parts = [self.positions[self.offsets[account_num]:self.offsets[account_num + 1]]
+                 for account_num in account_nums if 0 <= account_num < len(self.offsets) - 1]
+        if len(parts) == 1:
+            return parts[0]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def debits(self):
+        # Rows debiting their sender: withdrawals and transactions between two accounts
+        return (self['sender'] != self['receiver']) | (self['type_id'] == self.type_id('Withdrawal'))
+
+    def metrics(self):
+        return {
+            'rows': self.rows,
+            'last_txn_id': self.last_id,
+            'bytes': self.rows * ROW.itemsize,
+            'refreshed_at': self.refreshed_at,
+        }
+
+
+def snapshot_directory():
+    # ANALYTICS_SNAPSHOT_DIR, in a subdirectory per tenant
+    tenant = tenancy.current()
+    directory = current_app.config['ANALYTICS_SNAPSHOT_DIR']
+    return directory if tenant is None else os.path.join(directory, tenant)
+
+
+def get_snapshot():
+    """Snapshot of the latest refresh
+        - Cached per process until the manifest changes, reads cost no query
+
+    Returns:
+        Snapshot: the snapshot, None until the first refresh
+    """
+    directory = snapshot_directory()
+    try:
+        stat = os.stat(os.path.join(directory, 'manifest.json'))
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = tenancy.extensions().get('analytics_snapshot')
+    if cached is None or cached[0] != stamp:
+        cached = tenancy.extensions()['analytics_snapshot'] = (stamp, Snapshot(directory, _read_manifest(directory)))
+    return cached[1]
+
+
+def refresh(chunk_size=None) -> int:
+    """Appends the transactions recorded since the last refresh to the snapshot
+        - Rows are read in chunks of chunk_size transactions, archived months first when the snapshot does not
+        cover them, and appended to the column files as they come
+        - Files are synced before the manifest is replaced. One refresh at a time, run it from a single scheduled job
+        and not while flask archive-transactions moves months out of transactions_table
+
+    Args:
+        chunk_size (int, optional): transactions per chunk, ANALYTICS_CHUNK_SIZE by default
+
+    Returns:
+        int: number of transactions appended
+    """
+    chunk_size = chunk_size or current_app.config['ANALYTICS_CHUNK_SIZE']
+    directory = snapshot_directory()
+    os.makedirs(directory, exist_ok=True)
+    manifest = _read_manifest(directory)
+    rows, last = manifest['rows'], manifest['last_id']
+    files = {}
+    try:
+        for name, dtype in COLUMNS:
+            files[name] = open(os.path.join(directory, name), 'ab')
+            files[name].truncate(rows * np.dtype(dtype).itemsize)
+        # Archived months and the hot table may interleave ids (backdated rows), each one is read from the
+        # previous refresh's last ID on
+        start = last
+        sources = [[partition] for partition in archive.partitions(descending=False) if partition.max_txn_id > start]
+        for months in sources + [None]:
+            lo = start
+            while True:
+                params = {'lo': lo, 'limit': chunk_size}
+                batch = (archive.execute(SNAPSHOT_ROWS, months, params) if months is not None
+                         else db.session.execute(SNAPSHOT_ROWS, params).all())
+                if not batch:
+                    break
+                chunk = np.array([tuple(row) for row in batch], dtype=ROW)
+                for name, file in files.items():
+                    file.write(chunk[name].tobytes())
+                rows += len(chunk)
+                lo = int(chunk['id'][-1])
+                last = max(last, lo)
+                if len(batch) < chunk_size:
+                    break
+        for file in files.values():
+            file.flush()
+            os.fsync(file.fileno())
+    finally:
+        for file in files.values():
+            file.close()
+    appended = rows - manifest['rows']
+    types = {str(type_id): name for type_id, name in db.session.execute(db.select(TransactionType.id, TransactionType.name))}
+    index = {key: manifest[key] for key in ('index', 'indexed', 'accounts') if key in manifest}
+    if appended or 'index' not in manifest:
+        index = _build_index(directory, rows)
+    _write_manifest(directory, {'rows': rows, 'last_id': last, 'types': types,
+                                'refreshed_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z', **index})
+    for name in os.listdir(directory):
+        if name.startswith('index-') and name not in (index['index'], manifest.get('index')):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return appended
+
+
+def group_by(keys, weights):
+    """Distinct keys with the sum of their weights and their number of rows
+
+    Args:
+        keys (ndarray): integer keys
+        weights (ndarray): values summed per key
+
+    Returns:
+        tuple: distinct keys (sorted), sums and counts, as arrays
+    """
+    if len(keys) and int(keys.max()) - int(keys.min()) <= 2 * len(keys) + 65536:
+        # Dense keys (months, types, account numbers) are counted straight into a table, without sorting
+        low = keys.min()
+        sums = np.bincount(keys - low, weights=weights)
+        counts = np.bincount(keys - low)
+        present = np.flatnonzero(counts)
+        return present + low, sums[present], counts[present]
+    distinct, inverse = np.unique(keys, return_inverse=True)
+    return (distinct, np.bincount(inverse, weights=weights, minlength=len(distinct)),
+            np.bincount(inverse, minlength=len(distinct)))
+
+
+def month_name(month):
+    # YYYY-MM of a month counted since January 1970
+    return str(np.datetime64(int(month), 'M'))
+
+
+def spending_by_month(snapshot, months):
+    """Amounts debited per month and transaction type, over the last months
+
+    Args:
+        snapshot (Snapshot): snapshot to read
+        months (int): months covered, the current one included
+
+    Returns:
+        list: {"month", "type", "amount", "transactions"} dictionaries, oldest month first
+    """
+    current = np.datetime64(datetime.utcnow(), 'M').astype(np.int64)
+    mask = snapshot.debits() & (snapshot.months() > current - months)
+    if not mask.any():
+        return []
+    type_ids = snapshot['type_id'][mask].astype(np.int64)
+    stride = int(type_ids.max()) + 1
+    keys, amounts, counts = group_by(snapshot.months()[mask] * stride + type_ids, snapshot['amount'][mask])
+    return [{'month': month_name(key // stride), 'type': snapshot.types.get(int(key % stride), 'Other'),
+             'amount': round(float(amount), 2), 'transactions': int(count)}
+            for key, amount, count in zip(keys, amounts, counts)]
+
+
+def top_counterparties(snapshot, limit):
+    """Accounts receiving the most from transfers between two accounts
+
+    Args:
+        snapshot (Snapshot): snapshot to read
+        limit (int): accounts returned
+
+    Returns:
+        list: {"account_num", "amount", "transactions"} dictionaries, largest amount first
+    """
+    mask = snapshot['sender'] != snapshot['receiver']
+    if not mask.any():
+        return []
+    accounts, amounts, counts = group_by(snapshot['receiver'][mask], snapshot['amount'][mask])
+    top = np.argsort(-amounts, kind='stable')[:limit]
+    return [{'account_num': int(accounts[index]), 'amount': round(float(amounts[index]), 2),
+             'transactions': int(counts[index])} for index in top]
+
+
+def account_columns(snapshot, account_nums, since=0):
+    """Columns of the transactions involving any of account_nums
+        - Snapshot rows are found through the account index, the transactions recorded since the last refresh are
+        read with one indexed query
+        - Timestamps are read first, the other columns only for the rows from since on
+
+    Args:
+        snapshot (Snapshot): snapshot to read
+        account_nums (list): account numbers
+        since (int, optional): epoch seconds of the oldest transaction returned
+
+    Returns:
+        dict: column name -> array, in no particular row order
+    """
+    rows = snapshot.account_rows(account_nums)
+    if since:
+        rows = rows[snapshot['timestamp'][rows] >= since]
+    parts = [{name: snapshot[name][rows] for name, _ in COLUMNS}]
+    tail = db.session.execute(ACCOUNT_TAIL_ROWS, {'lo': snapshot.last_id, 'accounts': list(account_nums)}).all()
+    if tail:
+        chunk = np.array([tuple(row) for row in tail], dtype=ROW)
+        chunk = chunk[chunk['timestamp'] >= since]
+        parts.append({name: chunk[name] for name, _ in COLUMNS})
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([part[name] for part in parts]) for name, _ in COLUMNS}
+
+
+def period_index(timestamps, period):
+    # Days, weeks (from Monday) or months since January 1970 of epoch seconds
+    if period == 'month':
+        return timestamps.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    days = timestamps // 86400
+    # 1 January 1970 was a Thursday
+    return days if period == 'day' else (days + 3) // 7
+
+
+def period_start(index, period):
+    # Epoch seconds at which periods (as counted by period_index) start
+    if period == 'month':
+        return np.asarray(index).astype('datetime64[M]').astype('datetime64[s]').astype(np.int64)
+    return (index if period == 'day' else np.asarray(index) * 7 - 3) * 86400
+
+
+def period_name(index, period):
+    # YYYY-MM for months, date of the first day for days and weeks
+    if period == 'month':
+        return month_name(index)
+    return str(np.datetime64(int(index if period == 'day' else index * 7 - 3), 'D'))
+
+
+def insights(snapshot, account_nums, period, periods, limit):
+    """Inflow and outflow per transaction type, transfers and top counterparties of some accounts, over the last
+    periods
+        - Computed with vectorized group-bys over the accounts' columns (account_columns), no row is turned into a
+        Python object
+        - Inflows are credits to the accounts, outflows the debits: withdrawals and transfers they send. Transfers
+        are transactions between two accounts, counterparties the other accounts, ranked by amount exchanged
+
+    Args:
+        snapshot (Snapshot): snapshot to read
+        account_nums (list): account numbers of one user
+        period (str): "day", "week" or "month"
+        periods (int): periods covered, the current one included
+        limit (int): counterparties returned
+
+    Returns:
+        dict: "periods" (oldest first), "top_counterparties" and "average_transfer" over all periods
+    """
+    current = int(period_index(np.array([int((datetime.utcnow() - datetime(1970, 1, 1)).total_seconds())]), period)[0])
+    first = current - periods + 1
+    # Rows are placed in periods through a table of the window's days, cheaper than converting every timestamp
+    days = period_start(np.arange(first, current + 2), period) // 86400
+    columns = account_columns(snapshot, account_nums, since=int(days[0]) * 86400)
+    day = columns['timestamp'] // 86400 - days[0]
+    window = (day >= 0) & (day < days[-1] - days[0])
+    if not window.all():
+        # Only transactions dated in the future fall outside, the others were left out by account_columns
+        columns = {name: values[window] for name, values in columns.items()}
+        day = day[window]
+    offset = np.searchsorted(days - days[0], np.arange(days[-1] - days[0]), side='right')[day] - 1
+    sender, receiver, amount = columns['sender'], columns['receiver'], columns['amount']
+    type_ids = columns['type_id'].astype(np.int64)
+    # A user has a handful of accounts, comparing with each is cheaper than np.isin
+    sends = np.logical_or.reduce([sender == account_num for account_num in account_nums] or [sender < 0])
+    receives = np.logical_or.reduce([receiver == account_num for account_num in account_nums] or [receiver < 0])
+    withdrawal = type_ids == snapshot.type_id('Withdrawal')
+    transfer = sender != receiver
+    stride = int(type_ids.max()) + 1 if len(type_ids) else 1
+
+    # One bincount per flow over (period, type) keys, rows outside the flow weigh 0 rather than being copied out
+    keys = offset * stride + type_ids
+    data = [{'period': period_name(first + position, period), 'inflow': {}, 'outflow': {}, 'transfers': 0,
+             'average_transfer': None} for position in range(periods)]
+    for flow, mask in (('inflow', receives & ~withdrawal), ('outflow', sends & (transfer | withdrawal))):
+        sums = np.bincount(keys, weights=np.where(mask, amount, 0), minlength=periods * stride)
+        counts = np.bincount(keys, weights=mask, minlength=periods * stride)
+        for key in np.flatnonzero(counts):
+            data[key // stride][flow][snapshot.types.get(int(key % stride), 'Other')] = round(float(sums[key]), 2)
+    sums = np.bincount(offset, weights=np.where(transfer, amount, 0), minlength=periods)
+    counts = np.bincount(offset, weights=transfer, minlength=periods)
+    for position in np.flatnonzero(counts):
+        data[position]['transfers'] = int(counts[position])
+        data[position]['average_transfer'] = round(float(sums[position] / counts[position]), 2)
+
+    # Transfers with another user's account, between the user's own accounts left out
+    external = transfer & (sends != receives)
+    counterparty = np.where(sends, receiver, sender)[external]
+    sent = np.where(sends, amount, 0)[external]
+    received = amount[external] - sent
+    parties, sent_sums, counts = group_by(counterparty, sent)
+    _, received_sums, _ = group_by(counterparty, received)
+    top = np.argsort(-(sent_sums + received_sums), kind='stable')[:limit]
+    return {
+        'periods': data,
+        'top_counterparties': [{'account_num': int(parties[position]), 'sent': round(float(sent_sums[position]), 2),
+                                'received': round(float(received_sums[position]), 2),
+                                'transactions': int(counts[position])} for position in top],
+        'average_transfer': round(float(sums.sum() / counts.sum()), 2) if counts.any() else None,
+    }
+
+
+def _build_index(directory, rows):
+    # Row numbers grouped by account, as sender and as receiver, and each account's offset into them
+    sender = _map(os.path.join(directory, 'sender'), '<i8', rows)
+    receiver = _map(os.path.join(directory, 'receiver'), '<i8', rows)
+    between = np.flatnonzero(sender != receiver)
+    keys = np.concatenate([sender, receiver[between]])
+    order = np.argsort(keys, kind='stable')
+    positions = np.concatenate([np.arange(rows, dtype=np.int64), between])[order]
+    offsets = np.searchsorted(keys[order], np.arange(int(keys.max()) + 2 if rows else 1))
+    name = 'index-{}'.format(rows)
+    os.makedirs(os.path.join(directory, name), exist_ok=True)
+    for file_name, values in (('positions', positions), ('offsets', offsets)):
+        with open(os.path.join(directory, name, file_name), 'wb') as file:
+            file.write(values.astype('<i8').tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+    return {'index': name, 'indexed': len(positions), 'accounts': len(offsets)}
+
+
+def _map(path, dtype, rows):
+    # Read-only mapping of the first rows values of a column file, NumPy cannot map empty files.
+    # A plain ndarray view keeps the memmap subclass out of every array derived from it
+    if not rows:
+        return np.zeros(0, dtype=dtype)
+    return np.asarray(np.memmap(path, dtype=dtype, mode='r', shape=(rows,)))
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return {'rows': 0, 'last_id': 0, 'types': {}, 'refreshed_at': None}
+
+
+def _write_manifest(directory, manifest):
+    # Tells every process to map the new rows
+    with open(os.path.join(directory, 'manifest.json.tmp'), 'w') as file:
+        json.dump(manifest, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(os.path.join(directory, 'manifest.json.tmp'), os.path.join(directory, 'manifest.json'))
@@ -0,0 +1,97 @@
+from flask import jsonify, request
+from app.api import api
+from app.api.auth import token_auth, admin_required
+from app.bloom import get_filters
+from flask import current_app
+from app import aliases, recent, fragments, sqlstats, engine, shards, analytics
+from app.api.errors import error_response
+
+
+@api.route('/admin/metrics', methods=['GET'])
+@token_auth.login_required
+@admin_required
+def get_metrics():
+    """Operational metrics of the in-process caches, for administrators
+        - Token authentication, administrator role required
+
+    Returns:
+        response 200 (JSON): per cache statistics
+        401: Token authentication fails
+        403: User is not an administrator
+
+    Example:
+        >>> get_metrics()
+        {
+            "bloom_filters": {
+                "accounts": {"built": true, "capacity": 100000, "items": 2, "size_bytes": 119814, ...},
+                "emails": {"built": false}
+            },
+            "payment_aliases": {"capacity": 100000, "entries": 12, "hits": 40, "misses": 12},
+            "recent_transactions": {"accounts": 3, "budget_bytes": 67108864, "bytes": 5120, "entries_per_account": 20, ...},
+            "transaction_fragments": {"bytes": 2048, "capacity_bytes": 33554432, "fragments": 20, "hits": 60, ...},
+            "sql_compiled_cache": {"cache_capacity": 500, "cached_statements": 41, "hits": 9812, "misses": 41, "top_misses": [...], ...},
+            "ledger_engine": {"accounts": 3, "flushed_seq": 120, "lock_stripes": 64, "logged_seq": 124, "pending": 4},
+            "ledger_shards": {"shards": [{"accounts": 2, "journal": 40, "prepared": 0}, ...], "transfers": {"local": 12, "two_phase": 28}},
+            "tenant_engines": {"capacity": 32, "created": 5, "engines": 5, "evictions": 0},
+            "analytics_snapshot": {"bytes": 4400, "last_txn_id": 100, "refreshed_at": "2023-10-01T12:00:00Z", "rows": 100}
+        }
+        ledger_engine is null unless LEDGER_ENGINE_ENABLED is on, ledger_shards unless LEDGER_SHARDS is set,
+        tenant_engines unless TENANTS is set and analytics_snapshot until the first flask refresh-analytics. Cache
+        metrics are the ones of the requesting tenant
+    """
+    snapshot = analytics.get_snapshot()
+    return jsonify({
+        'bloom_filters': {name: f.metrics() for name, f in get_filters().items()},
+        'payment_aliases': aliases.get_index().metrics(),
+        'recent_transactions': recent.get_cache().metrics(),
+        'transaction_fragments': fragments.get_cache().metrics(),
+        'sql_compiled_cache': sqlstats.get_stats().metrics(),
+        'ledger_engine': engine.get_engine().metrics() if engine.enabled() else None,
+        'ledger_shards': shards.get_router().metrics() if shards.enabled() else None,
+        'tenant_engines': current_app.extensions['tenant_engines'].metrics() if current_app.config['TENANTS'] else None,
+        'analytics_snapshot': snapshot.metrics() if snapshot is not None else None,
+    })
+
+
+@api.route('/admin/analytics', methods=['GET'])
+@token_auth.login_required
+@admin_required
+def get_analytics():
+    """Bank wide spending per month and transaction type, and the accounts receiving the most from transfers
+        - Token authentication, administrator role required
+        - Computed with vectorized NumPy operations over the columnar snapshot of the journal (app.analytics), no
+        query on transactions_table. Covers transactions up to the last flask refresh-analytics
+        
+        Query parameters
+        - "months": months of spending, the current one included, 12 by default
+        - "limit": accounts returned, 10 by default
+
+    Returns:
+        response 200 (JSON): spending, top counterparties and the snapshot they were computed from
+        401: Token authentication fails
+        403: User is not an administrator
+        503: The snapshot was never refreshed
+
+    Example:
+        >>> get_analytics() months=2 limit=1
+        {
+            "spending": [
+                {"amount": 120.0, "month": "2023-09", "transactions": 3, "type": "Transfer"},
+                {"amount": 40.0, "month": "2023-10", "transactions": 1, "type": "Withdrawal"}
+            ],
+            "top_counterparties": [
+                {"account_num": 2, "amount": 100.0, "transactions": 2}
+            ],
+            "_meta": {"last_txn_id": 100, "refreshed_at": "2023-10-01T12:00:00Z"}
+        }
+    """
+    snapshot = analytics.get_snapshot()
+    if snapshot is None:
+        return error_response(503, 'The analytics snapshot is not built yet, run flask refresh-analytics')
+    months = max(1, request.args.get('months', 12, type=int))
+    limit = max(1, request.args.get('limit', 10, type=int))
+    return jsonify({
+        'spending': analytics.spending_by_month(snapshot, months),
+        'top_counterparties': analytics.top_counterparties(snapshot, limit),
+        '_meta': {'last_txn_id': snapshot.last_id, 'refreshed_at': snapshot.refreshed_at},
+    })
@@ -1,7 +1,11 @@
+from functools import wraps
+from flask import abort
 from flask_httpauth import HTTPBasicAuth
 from flask_httpauth import HTTPTokenAuth
 from app.models import User
+from app.queries import load_user_by_email
 from app.api.errors import error_response
+from app import tenancy
 
 
 # Basic verification with Flask's HTTPBasicAuth
@@ -19,7 +23,7 @@ token_auth = HTTPTokenAuth()
 def verify_password(email, password):
     # Requirement 1 for basic verification with Flask's HTTPBasicAuth
     # Authentication flow configured with the decorator
-    user = User.query.filter_by(email=email).first()
+    user = load_user_by_email(email)
     if user and user.check_password(password):
         return user
 
@@ -34,10 +38,21 @@ def basic_auth_error(status):
 @token_auth.verify_token
 def verify_token(token):
     # Requirement 1 for token verification with Flask's HTTPTokenAuth
-    return User.check_token(token) if token else None
+    # The tenant prefix was already used to pick the database (app.tenancy)
+    return User.check_token(tenancy.token_secret(token)) if token else None
 
 
 @token_auth.error_handler
 def token_auth_error(status):
     # Requirement 2 for token verification with Flask's HTTPTokenAuth
-    return error_response(status)
\ No newline at end of file
+    return error_response(status)
+
+
+def admin_required(f):
+    # Restricts a token authenticated route to administrators. Apply below @token_auth.login_required
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not token_auth.current_user().is_administrator():
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated
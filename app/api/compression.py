@@ -0,0 +1,76 @@
+import zlib
+from flask import current_app, request
+from app.api import api
+
+
+# Content-Encoding -> zlib window bits. HTTP "deflate" is the zlib format, not raw deflate
+ENCODINGS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+
+def negotiate_encoding():
+    """Picks the Content-Encoding to use from the request's Accept-Encoding header
+
+    Returns:
+        str: 'gzip' or 'deflate', whichever the client weighs highest (gzip on ties), or None
+    """
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_stream(chunks, encoding, level):
+    # Compresses a streamed body chunk by chunk so the payload is never held in memory as a whole
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@api.after_request
+def compress_response(response):
+    """Negotiated gzip / deflate compression for API responses
+        - Disabled when API_COMPRESSION_LEVEL is 0
+        - Buffered bodies smaller than API_COMPRESSION_MIN_SIZE bytes are sent as is
+        - Streamed bodies are always compressed, incrementally, and lose their Content-Length
+        - Strong ETags are weakened since the compressed bytes differ from the identity representation
+
+    Args:
+        response (Response): response produced by the API route
+
+    Returns:
+        Response: the same response, compressed when worthwhile
+    """
+    level = current_app.config['API_COMPRESSION_LEVEL']
+    if not level or response.status_code < 200 or response.status_code in (204, 304) \
+            or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['API_COMPRESSION_MIN_SIZE']:
+            return response
+        compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+        response.set_data(compressor.compress(data) + compressor.flush())
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
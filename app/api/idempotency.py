@@ -0,0 +1,261 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, request, make_response
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import db, tenancy, engine, shards
+from app.models import IdempotencyKey
+from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+
+
+# Outcome of a completed request, kept in the in-memory LRU and mirrored in idempotency_keys_table
+Record = namedtuple('Record', ['fingerprint', 'status_code', 'body', 'created_at'])
+
+# Returned by _claim_or_wait when another worker still holds the key after the wait timeout
+IN_FLIGHT = object()
+
+# Returned by _claim_or_wait when the worker holding the key committed the route's changes but died before
+# recording the response, so the request must not run again
+LOST = object()
+
+# Session.info key naming the (user_id, key) claimed by the route currently running on the session
+CLAIM = 'idempotency_claim'
+
+
+class IdempotencyStore:
+    """In-memory LRU of completed idempotent requests plus per-key locks
+        - Replays of recently used keys are answered from memory without a database round trip
+        - Concurrent duplicates in the same process queue up on the key's lock and replay the first request's outcome
+        - Duplicates in other processes are serialised by the unique (user_id, key) row instead
+
+    Args:
+        capacity (int): maximum number of records kept in memory
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._records = OrderedDict()
+        self._holds = {}
+        self._lock = threading.Lock()
+
+    def get(self, ident):
+        # Returns the cached record for (user_id, key) and marks it as most recently used
+        with self._lock:
+            record = self._records.get(ident)
+            if record is not None:
+                self._records.move_to_end(ident)
+            return record
+
+    def put(self, ident, record):
+        # Caches a completed record, evicting the least recently used one when full
+        with self._lock:
+            self._records[ident] = record
+            self._records.move_to_end(ident)
+            while len(self._records) > self.capacity:
+                self._records.popitem(last=False)
+
+    def discard(self, ident):
+        with self._lock:
+            self._records.pop(ident, None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+    @contextmanager
+    def hold(self, ident):
+        """Serialises requests sharing the same (user_id, key) within this process
+
+        Args:
+            ident (tuple): (user_id, key) pair
+        """
+        with self._lock:
+            entry = self._holds.get(ident)
+            if entry is None:
+                entry = self._holds[ident] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._holds[ident]
+
+
+def get_store():
+    # One store per application so test apps and tenants never share cached responses
+    store = tenancy.extensions().get('idempotency')
+    if store is None:
+        store = tenancy.extensions().setdefault(
+            'idempotency', IdempotencyStore(current_app.config['IDEMPOTENCY_CACHE_SIZE']))
+    return store
+
+
+def request_fingerprint():
+    # Hash of everything that makes two requests "the same request"
+    digest = hashlib.sha256()
+    digest.update(request.method.encode('utf-8'))
+    digest.update(request.path.encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _is_expired(created_at):
+    ttl = current_app.config['IDEMPOTENCY_KEY_TTL']
+    return created_at is not None and created_at < datetime.utcnow() - timedelta(seconds=ttl)
+
+
+def _is_abandoned(row):
+    # In-flight rows outlive IDEMPOTENCY_LEASE only when the worker that claimed them crashed
+    lease = current_app.config['IDEMPOTENCY_LEASE']
+    return (row.status_code is None and row.created_at is not None
+            and row.created_at < datetime.utcnow() - timedelta(seconds=lease))
+
+
+def _commits_outside_session():
+    # The in-memory engine and the shards make postings durable in their own logs, not in the route's transaction
+    return engine.enabled() or shards.enabled()
+
+
+@event.listens_for(Session, 'before_commit')
+def _stamp_claim(session):
+    # Marks the claimed key as committed in the same transaction as the route's changes, so a crash before the
+    # response is recorded leaves a key that is refused instead of reclaimed
+    ident = session.info.get(CLAIM)
+    if ident is not None:
+        session.execute(db.update(IdempotencyKey)
+                        .where(IdempotencyKey.user_id == ident[0], IdempotencyKey.key == ident[1],
+                               IdempotencyKey.committed_at.is_(None))
+                        .values(committed_at=datetime.utcnow()))
+
+
+def _claim_or_wait(ident, fingerprint):
+    """Claims the key for this request or waits for the request that already holds it
+        - Inserts an in-flight row (status_code NULL) if the key is unused; the unique constraint decides the winner
+        - If a completed row exists, returns its record for replay
+        - If an in-flight row exists, polls until it completes or IDEMPOTENCY_WAIT_TIMEOUT elapses
+        - Expired rows and in-flight rows older than IDEMPOTENCY_LEASE (left behind by a crashed worker) are
+        deleted and reclaimed, unless the crashed worker had already committed the route's changes
+
+    Args:
+        ident (tuple): (user_id, key) pair
+        fingerprint (str): fingerprint of the current request
+
+    Returns:
+        None if the key was claimed, a Record to replay, IN_FLIGHT on timeout or LOST if the request already ran
+        but its response was never recorded
+    """
+    user_id, key = ident
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_TIMEOUT']
+    while True:
+        row = IdempotencyKey.query.filter_by(user_id=user_id, key=key).populate_existing().first()
+        if row is not None and row.committed_at is not None and _is_abandoned(row) and not _is_expired(row.created_at):
+            return LOST
+        if row is not None and (_is_expired(row.created_at) or _is_abandoned(row)):
+            db.session.delete(row)
+            db.session.commit()
+            row = None
+        if row is None:
+            db.session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint))
+            try:
+                db.session.commit()
+                return None
+            except IntegrityError:
+                db.session.rollback()
+                continue
+        if row.status_code is not None:
+            return Record(row.fingerprint, row.status_code, row.body, row.created_at)
+        if time.monotonic() >= deadline:
+            return IN_FLIGHT
+        time.sleep(current_app.config['IDEMPOTENCY_POLL_INTERVAL'])
+
+
+def _release(ident):
+    # Frees the key after a failed request so the client can retry it, unless the route already committed changes
+    db.session.info.pop(CLAIM, None)
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(user_id=ident[0], key=ident[1]).filter(
+        IdempotencyKey.committed_at.is_(None)).delete()
+    db.session.commit()
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return error_response(422, 'Idempotency-Key has already been used for a different request')
+    response = current_app.response_class(record.body, status=record.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(f):
+    """Makes a token authenticated POST route safe to retry with an Idempotency-Key header
+        - Requests without the header run as before
+        - The first request with a given key runs the route and stores its status code and body
+        - Later requests with the same key replay the stored response without running the route
+        - Reusing a key for a different request body or path returns 422
+        - Responses with status 5xx and raised exceptions (abort included) are not stored, the key is released instead
+        unless the route already committed changes
+        - The key is marked as committed in the route's own transaction; if the worker dies before the response is
+        stored, retries are refused with 409 rather than running the route again
+
+        Must be applied below @token_auth.login_required so the current user is known.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > 255:
+            return bad_request('Idempotency-Key must be between 1 and 255 characters')
+
+        ident = (token_auth.current_user().id, key)
+        fingerprint = request_fingerprint()
+        store = get_store()
+        with store.hold(ident):
+            record = store.get(ident)
+            if record is not None and _is_expired(record.created_at):
+                store.discard(ident)
+                record = None
+            if record is None:
+                record = _claim_or_wait(ident, fingerprint)
+            if record is IN_FLIGHT:
+                return error_response(409, 'A request with this Idempotency-Key is still being processed')
+            if record is LOST:
+                return error_response(409, 'A request with this Idempotency-Key was processed but its response was lost')
+            if record is not None:
+                store.put(ident, record)
+                return _replay(record, fingerprint)
+
+            db.session.info[CLAIM] = ident
+            try:
+                if _commits_outside_session():
+                    db.session.commit()
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                _release(ident)
+                raise
+            finally:
+                db.session.info.pop(CLAIM, None)
+            if response.status_code >= 500:
+                _release(ident)
+                return response
+
+            record = Record(fingerprint, response.status_code, response.get_data(), datetime.utcnow())
+            IdempotencyKey.query.filter_by(user_id=ident[0], key=ident[1]).update(
+                {'status_code': record.status_code, 'body': record.body})
+            db.session.commit()
+            store.put(ident, record)
+            return response
+    return decorated
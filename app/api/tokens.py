@@ -1,5 +1,5 @@
 from flask import jsonify
-from app import db
+from app import db, tenancy
 from app.api import api
 from app.api.auth import basic_auth, token_auth
 
@@ -9,7 +9,8 @@ def get_token():
     # Produce a token after verification authentication.
     # Decorated with @basic_auth from HTTPBasicAuth instance.
     # Instructs Flask-HTTPAuth to verify authentication and only allow the function to run when the provided credentials are valid. 
-    token = basic_auth.current_user().get_token()
+    # Tenants' tokens carry the tenant's name, so API clients need nothing else to reach their bank
+    token = tenancy.qualify_token(basic_auth.current_user().get_token())
     db.session.commit()
     return jsonify({'token': token})
 
@@ -1,10 +1,33 @@
 from app.api import api
-from flask import jsonify, request, url_for, abort
-from app.models import User, Accounts, Transactions, TransactionType
-from datetime import datetime
+from flask import jsonify, request, url_for, abort, current_app
+from sqlalchemy.exc import IntegrityError
+from app.models import User, Accounts, Transactions, PaymentAlias
 from app import db
-from app.api.errors import bad_request
-from app.api.auth import token_auth
+from app.api.errors import bad_request, error_response
+from app.api.auth import token_auth, admin_required
+from app.api.idempotency import idempotent
+from app.conditional import ledger_etag, conditional
+from app.encoders import USER_FIELDS, ACCOUNT_FIELDS, TRANSACTION_FIELDS
+from app.filters import TransactionSearch, parse_end
+from app.recent import recent_transactions
+from app import directory, aliases, ledger, fragments, queries, engine, archive, shards, clearing, analytics
+from app.bloom import email_may_exist, account_may_exist, add_email
+
+
+def requested_fields(fieldset):
+    # Parses the sparse fieldset (?fields=a,b) of the request for fieldset, aborting with 400 on unknown fields
+    try:
+        return fieldset.parse(request.args.get('fields'))
+    except ValueError as e:
+        abort(bad_request(str(e)))
+
+
+def user_or_404(id):
+    # Reads the user as an app.queries.UserRow, without hydrating the ORM model. Aborts with 404 when it does not exist
+    user = queries.user(id)
+    if user is None:
+        abort(404)
+    return user
 
 
 @api.route('/users/<int:id>', methods=['GET'])
@@ -14,11 +37,15 @@ def get_user(id):
 
     Args:
         id (int): ID of user
+    
+    Query parameters:
+        fields (str, optional): comma separated subset of id, first_name, last_name, email, accounts, transactions
 
     Returns:
         JSON: A JSON object containing the informaiton about the user
         404: When user does not exist
         403: When token authentication fails
+        400: Unknown field requested
     
     Example:
         >>> get_user(1)
@@ -33,7 +60,11 @@ def get_user(id):
     """
     if token_auth.current_user().id != id:
         abort(403)
-    return jsonify(User.query.get_or_404(id).to_dict())
+    fields = requested_fields(USER_FIELDS)
+    row = db.session.execute(USER_FIELDS.select(fields).where(User.id == id)).first()
+    if row is None:
+        abort(404)
+    return jsonify(USER_FIELDS.encoder(fields).encode(row))
 
 
 @api.route('/users/<int:user_id>/transactions/<int:txn_id>', methods=['GET'])
@@ -41,17 +72,21 @@ def get_user(id):
 def get_user_transaction(user_id, txn_id):
     """Get a transaction involving the user by transaction ID and user ID.
         - Peforms token authentication check
-        - Queries for valid user else return 404
-        - Queries for transaction with ID matching txn_id
+        - Queries in one go for the transaction with ID matching txn_id and whether the user is on either end of it,
+        in the archived month covering txn_id when it is no longer in transactions_table
         - Returns JSON object of transaction only if user is in the sender or receving end of the transaction
         
     Args:
         user_id (int): ID of the user
         txn_id (int): ID of the transaction
+    
+    Query parameters:
+        fields (str, optional): comma separated subset of id, from, from_acc, to, to_acc, amount, type.
+            Users and transaction types are only joined when from / to / type are requested.
 
     Returns:
         JSON: A JSON object of the transaction with ID of txn_id which involves the user with ID of user_id.
-        400: When transaction does not involve user with ID user_id.
+        400: When transaction does not involve user with ID user_id or an unknown field is requested.
         404: When User of ID user_id or transaction of ID txn_id does not exist.
         403: When token authentication fails
     
@@ -71,10 +106,24 @@ def get_user_transaction(user_id, txn_id):
     """
     if token_auth.current_user().id != user_id:
         abort(403)
-    user = User.query.get_or_404(user_id)
-    txn = Transactions.query.get_or_404(txn_id)
-    if txn.receiver_account.account_owner == user or txn.sender_account.account_owner == user:
-        return jsonify(txn.to_dict())
+    fields = requested_fields(TRANSACTION_FIELDS)
+    # One query: the transaction, flagged with whether one of its accounts belongs to the user
+    owned = db.select(Accounts.account_num).where(Accounts.owner == user_id)
+    involved = Transactions.receiver.in_(owned) | Transactions.sender.in_(owned)
+    # With every field requested the body comes from the fragment cache, only the involvement flag is selected
+    stmt = TRANSACTION_FIELDS.select(() if fields == TRANSACTION_FIELDS.keys else fields, involved)
+    stmt = stmt.where(Transactions.id == txn_id)
+    row = db.session.execute(stmt).first()
+    if row is None:
+        # Archived transactions are looked up in the month covering their ID
+        rows = archive.execute(stmt, archive.covering([txn_id]))
+        row = rows[0] if rows else None
+    if row is None:
+        abort(404)
+    if row[-1]:
+        if fields == TRANSACTION_FIELDS.keys:
+            return fragments.transaction_response(txn_id)
+        return jsonify(TRANSACTION_FIELDS.encoder(fields).encode(row))
     return bad_request("Invalid credentials")
 
 
@@ -86,11 +135,26 @@ def get_user_transactions(id):
 
     Args:
         id (int): ID of user
+    
+    Query parameters:
+        fields (str, optional): comma separated subset of id, from, from_acc, to, to_acc, amount, type.
+            Users and transaction types are only joined when from / to / type are requested.
+        from / to (str, optional): ISO 8601 date or datetime bounds, a date-only "to" includes that day
+        type (str, optional): transaction type name
+        counterparty_account (int, optional): account number on the other side of the transaction
+        min_amount / max_amount (float, optional): inclusive amount bounds
+        sort (str, optional): "desc" (default, newest first) or "asc"
+        limit (int, optional) / cursor (str, optional): cursor pagination. _meta.next_cursor holds the cursor
+            of the next page, null on the last page. total_transactions then counts the current page only
 
     Returns:
-        JSON: A JSON object containing ALL transactions involving user with ID == id
+        JSON: A JSON object containing ALL transactions involving user with ID == id, matching the filters
+        304: If-None-Match holds the current ETag, the body is not rebuilt
         404: Invalid user
         403: When token authentication fails
+        400: Unknown field requested or invalid filter
+    
+    Without fields=, the body is assembled from cached per-transaction JSON fragments (app.fragments)
     
     Example:
         >>> get_user_transactions(1)
@@ -132,9 +196,78 @@ def get_user_transactions(id):
     """
     if token_auth.current_user().id != id:
         abort(403)
-    user = User.query.get_or_404(id)
-    return jsonify(Transactions.to_collection_dict(user))
+    fields = requested_fields(TRANSACTION_FIELDS)
+    try:
+        search = TransactionSearch.from_args(request.args, current_app.config['API_TRANSACTIONS_PER_PAGE'],
+                                             current_app.config['API_TRANSACTIONS_MAX_PER_PAGE'])
+    except ValueError as e:
+        return bad_request(str(e))
     
+    def render():
+        user = user_or_404(id)
+        if fields == TRANSACTION_FIELDS.keys:
+            return fragments.transactions_response(user, search)
+        return jsonify(Transactions.to_collection_dict(user, fields, search))
+    return conditional(ledger_etag(id, 'transactions?' + request.query_string.decode('utf-8')), render)
+    
+
+
+@api.route('/users', methods=['GET'])
+@token_auth.login_required
+@admin_required
+def search_users():
+    """Staff directory search over users by partial first name, last name or email. Administrators only.
+        - Every word of q is matched as a prefix against the users_fts full-text index, all words must match
+        - Results are ranked best match first (bm25), ties broken by user ID
+        - Keyset pagination: pass _meta.next_cursor back as cursor for the next page
+
+    Query parameters:
+        q (str): search text, e.g. "jan do"
+        limit (int, optional): page size, up to API_USERS_MAX_PER_PAGE. Defaults to API_USERS_PER_PAGE
+        cursor (str, optional): next_cursor of the previous page
+        fields (str, optional): comma separated subset of id, first_name, last_name, email, accounts, transactions
+
+    Returns:
+        JSON: matching users and the cursor of the next page (null on the last page)
+        400: q missing or without searchable words, invalid limit, cursor or fields
+        401: When token authentication fails
+        403: When the user is not an administrator
+    
+    Example:
+        >>> search_users() q="jan"
+        {
+            "_meta": {
+                "next_cursor": null
+            },
+            "users": [
+                {
+                    "id":1,
+                    "first_name": "Jane",
+                    "last_name": "Doe",
+                    "email": "janedoe@email.com",
+                    "accounts": "/api/users/1/accounts",
+                    "transactions":"/api/users/1/transactions"
+                }
+            ]
+        }
+    """
+    fields = requested_fields(USER_FIELDS)
+    max_limit = current_app.config['API_USERS_MAX_PER_PAGE']
+    limit = request.args.get('limit', current_app.config['API_USERS_PER_PAGE'], type=int)
+    if limit is None or not 0 < limit <= max_limit:
+        return bad_request('limit must be between 1 and {}'.format(max_limit))
+    try:
+        after = directory.decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        rows, next_cursor = directory.search(request.args.get('q', ''), [USER_FIELDS.columns[key] for key in fields],
+                                             limit, after)
+    except ValueError as e:
+        return bad_request(str(e))
+    return jsonify({
+        'users': USER_FIELDS.encoder(fields).encode_all(rows),
+        '_meta': {
+            'next_cursor': next_cursor
+        }
+    })
 
 
 @api.route('/users', methods=['POST'])
@@ -166,27 +299,23 @@ def create_account():
     data = request.get_json() or {}
     if 'first_name' not in data or 'last_name' not in data or 'email' not in data or 'password' not in data:
         return bad_request('must include first name, last name, email and password fields')
-    if User.query.filter_by(email=data['email']).first():
+    if email_may_exist(data['email']) and User.query.filter_by(email=data['email']).first():
         return bad_request('please use a different email address')
     
     # Add user
     user = User()
     user.from_dict(data, new_user=True)
     db.session.add(user)
-    db.session.commit()
-    
-    # Add account
-    user_acc = Accounts(account_owner=user)
-    db.session.add(user_acc)
-    db.session.commit()
-    
-    # Add txn
-    txn_type = TransactionType.query.filter_by(name="New Account").first()
-    txn = Transactions(receiver_account=user_acc, sender_account=user_acc, amount=0, date_time=datetime.utcnow(), 
-                        transaction_type=txn_type)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Taken by a change the email filter has not seen yet, e.g. an email update in another process
+        db.session.rollback()
+        add_email(data['email'])
+        return bad_request('please use a different email address')
     
-    db.session.add(txn)
-    db.session.commit()
+    # Add account and "New Account" txn
+    ledger.open_account(user)
     
     
     response = jsonify(user.to_dict())
@@ -231,10 +360,18 @@ def update_user_email(id):
         abort(403)
     user = User.query.get_or_404(id)
     data = request.get_json() or {}
-    if 'new_email' in data and data['new_email'] != user.email and User.query.filter_by(email=data['new_email']).first():
+    if 'new_email' in data and data['new_email'] != user.email and email_may_exist(data['new_email']) \
+            and User.query.filter_by(email=data['new_email']).first():
         return bad_request('Please use a different email')
+    if 'new_email' in data:
+        aliases.rename_email(user.id, user.email, data['new_email'])
     user.from_dict(data, new_user=False, update_email=True, change_password=False)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        add_email(data['new_email'])
+        return bad_request('Please use a different email')
     response = jsonify(user.to_dict())
     response.status_code = 200
     return response
@@ -297,11 +434,16 @@ def get_accounts(id):
         to allow multiple bank accounts per user.
     Args:
         id (int): ID of user
+    
+    Query parameters:
+        fields (str, optional): comma separated subset of account_num, owner, balance
 
     Returns:
         JSON: JSON representation of a collection of user accounts
+        304: If-None-Match holds the current ETag, the body is not rebuilt
         404: Invalid user
         403: Token authentication fails
+        400: Unknown field requested
     
     Example:
         >>> get_accounts(1)
@@ -322,8 +464,9 @@ def get_accounts(id):
     """
     if token_auth.current_user().id != id:
         abort(403)
-    user = User.query.get_or_404(id)
-    return jsonify(Accounts.to_collection_dict(user))
+    fields = requested_fields(ACCOUNT_FIELDS)
+    return conditional(ledger_etag(id, 'accounts:' + ','.join(fields)),
+                       lambda: jsonify(Accounts.to_collection_dict(user_or_404(id), fields)))
 
 
 @api.route('users/<int:user_id>/accounts/<int:account_id>', methods=['GET'])
@@ -331,18 +474,23 @@ def get_accounts(id):
 def get_user_account(user_id, account_id):
     """Get a account by id of account_id (account number) belonging to user by id of user_id.
         - Performs token authentication
-        - Queries for valid user and account
+        - Queries in one go for the account and whether it belongs to user
         - Verifies that account belongs to user before sending a JSON response
 
     Args:
         user_id (int): ID of user
         account_id (int): ID of user account (account number)
+    
+    Query parameters:
+        fields (str, optional): comma separated subset of account_num, owner, balance
+        as_of (str, optional): ISO 8601 date or datetime, the balance is the one at that time (end of day for a
+        date), summed from the account's postings
 
     Returns:
         JSON: JSON representation of user account
         403: Token authentication fails
         404: Invalid user or account. When account does not belong to user
-        400: Invalid credentials
+        400: Invalid credentials, unknown field requested or invalid as_of
     
     Example:
         >>> get_user_account(1,1)
@@ -354,25 +502,254 @@ def get_user_account(user_id, account_id):
     """
     if token_auth.current_user().id != user_id:
         abort(403)
-    user = User.query.get_or_404(user_id)
-    account = Accounts.query.get_or_404(account_id)
-    if account.account_owner == user:
-        return jsonify(account.to_dict())
+    fields = requested_fields(ACCOUNT_FIELDS)
+    # One query: the account, flagged with whether it belongs to the user
+    row = db.session.execute(ACCOUNT_FIELDS.select(fields, Accounts.owner == user_id)
+                             .where(Accounts.account_num == account_id)).first()
+    if row is None:
+        abort(404)
+    if row[-1]:
+        data = ACCOUNT_FIELDS.encoder(fields).encode(row)
+        if request.args.get('as_of') and 'balance' in data:
+            try:
+                before = parse_end(request.args['as_of'], 'as_of')
+            except ValueError as e:
+                return bad_request(str(e))
+            data['balance'] = queries.balance_as_of(account_id, before)
+        return jsonify(data)
     return bad_request('Invalid credentials')
 
 
+@api.route('users/<int:user_id>/accounts/<int:account_id>/recent_transactions', methods=['GET'])
+@token_auth.login_required
+def get_recent_transactions(user_id, account_id):
+    """Latest transactions of an account belonging to user, newest first. Meant for dashboards / home screens.
+        - Token authentication
+        - Served from the per-account ring buffer (app.recent), warmed from the database on first read
+        - The number of transactions is fixed by RECENT_TRANSACTIONS_SIZE, use the transactions route for history
+
+    Args:
+        user_id (int): ID of user
+        account_id (int): ID of user account (account number)
+
+    Returns:
+        JSON: JSON representation of the latest transactions
+        304: If-None-Match holds the current ETag
+        403: Token authentication fails
+        404: Account does not exist or does not belong to user
+    
+    Example:
+        >>> get_recent_transactions(1,1)
+        {
+            "_meta": {
+                "account_num": 1,
+                "total_transactions": 1
+            },
+            "transactions": [
+                {
+                    "amount": 0.0,
+                    "date_time": "Sat, 31 Dec 2022 00:00:00 GMT",
+                    "from": "Jane Doe",
+                    "from_acc": 1,
+                    "id": 1,
+                    "to": "Jane Doe",
+                    "to_acc": 1,
+                    "type": "New Account"
+                }
+            ]
+        }
+    """
+    if token_auth.current_user().id != user_id:
+        abort(403)
+    marks = Accounts.ledger_marks(user_id)
+    latest_ids = {account_num: latest_id for account_num, _, latest_id in marks}
+    if account_id not in latest_ids:
+        abort(404)
+    
+    def render():
+        txns = [txn.to_dict() for txn in recent_transactions(account_id, latest_ids[account_id])]
+        return jsonify({'transactions': txns, '_meta': {'account_num': account_id, 'total_transactions': len(txns)}})
+    return conditional(ledger_etag(user_id, 'recent:{}'.format(account_id), marks), render)
+
+
+@api.route('users/<int:id>/insights', methods=['GET'])
+@token_auth.login_required
+def get_insights(id):
+    """Spending insights of user's accounts over the last periods
+        - Token authentication
+        - Inflow and outflow per transaction type, number and average size of transfers per period, top
+        counterparties and the average transfer size over every period
+        - Computed with vectorized NumPy operations over the user's rows of the analytics snapshot (app.analytics),
+        plus the transactions recorded since its last refresh, read with one indexed query
+    
+    Args:
+        id (int): ID of user
+    
+    Query parameters:
+        period (str, optional): "day", "week" or "month" (default)
+        periods (int, optional): periods covered, the current one included, API_INSIGHTS_PERIODS by default
+        limit (int, optional): counterparties returned, API_INSIGHTS_COUNTERPARTIES by default
+
+    Returns:
+        JSON: JSON representation of the insights
+        403: Token authentication fails
+        400: Unknown period
+        503: The analytics snapshot was never refreshed (flask refresh-analytics)
+    
+    Example:
+        >>> get_insights(1) period=month periods=2
+        {
+            "average_transfer": 40.0,
+            "period": "month",
+            "periods": [
+                {
+                    "average_transfer": 50.0,
+                    "inflow": {"Deposit": 100.0},
+                    "outflow": {"Transfer": 50.0},
+                    "period": "2023-09",
+                    "transfers": 1
+                },
+                {
+                    "average_transfer": 30.0,
+                    "inflow": {"Transfer": 30.0},
+                    "outflow": {"Withdrawal": 20.0},
+                    "period": "2023-10",
+                    "transfers": 1
+                }
+            ],
+            "top_counterparties": [
+                {"account_num": 2, "received": 30.0, "sent": 50.0, "transactions": 2}
+            ],
+            "_meta": {"last_txn_id": 100, "refreshed_at": "2023-10-01T12:00:00Z"}
+        }
+    """
+    if token_auth.current_user().id != id:
+        abort(403)
+    period = request.args.get('period', 'month')
+    if period not in analytics.PERIODS:
+        return bad_request('period must be one of {}'.format(', '.join(analytics.PERIODS)))
+    periods = request.args.get('periods', current_app.config['API_INSIGHTS_PERIODS'], type=int)
+    periods = min(max(periods, 1), current_app.config['API_INSIGHTS_MAX_PERIODS'])
+    limit = max(request.args.get('limit', current_app.config['API_INSIGHTS_COUNTERPARTIES'], type=int), 1)
+    snapshot = analytics.get_snapshot()
+    if snapshot is None:
+        return error_response(503, 'The analytics snapshot is not built yet')
+    account_nums = [account.account_num for account in queries.accounts(id)]
+    data = analytics.insights(snapshot, account_nums, period, periods, limit)
+    data['period'] = period
+    data['_meta'] = {'last_txn_id': snapshot.last_id, 'refreshed_at': snapshot.refreshed_at}
+    return jsonify(data)
+
+
+@api.route('users/<int:id>/aliases', methods=['GET'])
+@token_auth.login_required
+def get_aliases(id):
+    """Get the payment aliases (email address, phone numbers) of user by ID
+
+    Args:
+        id (int): ID of user
+
+    Returns:
+        JSON: JSON representation of the user's aliases
+        403: Token authentication fails
+    
+    Example:
+        >>> get_aliases(1)
+        {
+            "aliases": [
+                {
+                    "account_num": 1,
+                    "alias": "janedoe@email.com",
+                    "kind": "email"
+                }
+            ]
+        }
+    """
+    if token_auth.current_user().id != id:
+        abort(403)
+    items = PaymentAlias.query.filter_by(user_id=id).order_by(PaymentAlias.id).all()
+    return jsonify({'aliases': [item.to_dict() for item in items]})
+
+
+@api.route('users/<int:id>/aliases', methods=['POST'])
+@token_auth.login_required
+def create_alias(id):
+    """Registers a phone number other users can transfer to instead of an account number
+        - The email alias follows the login email and cannot be added here
+        
+        JSON keyword fields
+        - "alias": phone number, e.g. "+65 9123 4567"
+        - "account_num" (optional): receiving account, the user's first account by default
+
+    Args:
+        id (int): ID of user
+
+    Returns:
+        response 201 (JSON): JSON representation of the new alias
+        403: Token authentication fails
+        400: Missing, invalid or already registered alias, account not belonging to user
+        409: Alias registered by a concurrent request
+    
+    Example:
+        >>> create_alias(1) alias="+65 9123 4567"
+        {
+            "account_num": 1,
+            "alias": "+6591234567",
+            "kind": "phone"
+        }
+    """
+    if token_auth.current_user().id != id:
+        abort(403)
+    data = request.get_json() or {}
+    if 'alias' not in data:
+        return bad_request('must include alias field')
+    query = Accounts.query.filter_by(owner=id)
+    if 'account_num' in data:
+        query = query.filter_by(account_num=data['account_num'])
+    account = query.order_by(Accounts.account_num).first()
+    if account is None:
+        return bad_request('Invalid credentials')
+    try:
+        alias = PaymentAlias.for_account(data['alias'], account)
+    except ValueError as e:
+        return bad_request(str(e))
+    if alias.kind != 'phone':
+        return bad_request('only phone numbers can be added, the email alias follows the login email')
+    if PaymentAlias.query.filter_by(alias=alias.alias).first():
+        return bad_request('alias already registered')
+    db.session.add(alias)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Registered by a concurrent request since the check above
+        db.session.rollback()
+        return error_response(409, 'alias already registered')
+    aliases.get_index().discard(alias.alias)
+    response = jsonify(alias.to_dict())
+    response.status_code = 201
+    return response
+
+
 @api.route('users/<int:user_id>/accounts/<int:account_num>/deposit', methods=['POST'])
 @token_auth.login_required
+@idempotent
 def deposit(user_id, account_num):
     """Mimicks cash deposits to user account with id of account_num belonging to user with id of user_id. Amount to deposit
     supplied in JSON object during request.
         - Token authentication
-        - Checks for valid user, account and makes sure that account belongs to user
+        - Checks for valid account and makes sure that account belongs to user, in one query
         - Checks for valid deposit_amount field in request JSON
         - Updates account balance, creates a deposit transaction and updates database
+        - With LEDGER_ENGINE_ENABLED on, applies the deposit in the in-memory engine (app.engine) instead, the
+        database follows at its next flush
+        - With LEDGER_SHARDS set, applies the deposit in the account's shard (app.shards) instead, the database
+        follows at the next flask sync-shards
         
         JSON keyword fields
             - 'deposit_amount': amount to be deposited into account
+        
+        Optional headers
+            - 'Idempotency-Key': retries carrying the same key replay the first response instead of depositing again
     
 
     Args:
@@ -381,6 +758,8 @@ def deposit(user_id, account_num):
 
     Returns:
         response 201 (JSON): JSON representation of the user account and deposit transaction
+        response 202 (JSON): JSON representation of the user account and engine or shard posting, with
+        LEDGER_ENGINE_ENABLED on or LEDGER_SHARDS set
         403: Token authentication fails
         404: Invalid user or account
         400: Invalid credentials. When trying to deposit into account not belonging to owner or a invalid deposit amount is supplied
@@ -407,18 +786,24 @@ def deposit(user_id, account_num):
     """
     if token_auth.current_user().id != user_id:
         abort(403)
-    user = User.query.get_or_404(user_id)
-    account = Accounts.query.get_or_404(account_num)
+    row = queries.load_owned_account(account_num, user_id)
+    if row is None:
+        abort(404)
+    account, owned = row
     data = request.get_json() or {}
-    if account.account_owner == user:
+    if owned:
         if "deposit_amount" in data and float(data["deposit_amount"]) > 0:
-            account.update_balance(float(data["deposit_amount"]))
-            
-            txn_type = TransactionType.query.filter_by(name="Deposit").first()
-            txn = Transactions(receiver_account=account, sender_account=account, amount=float(data["deposit_amount"]), date_time=datetime.utcnow(), transaction_type=txn_type)
-            
-            db.session.add_all([account, txn])
-            db.session.commit()
+            if engine.enabled():
+                posting = engine.get_engine().deposit(account.account_num, float(data["deposit_amount"]))
+                response = jsonify({'account': engine.get_engine().account_dict(account), 'posting': posting.to_dict()})
+                response.status_code = 202
+                return response
+            if shards.enabled():
+                posting = shards.get_router().deposit(account.account_num, float(data["deposit_amount"]))
+                response = jsonify({'account': shards.get_router().account_dict(account), 'posting': posting.to_dict()})
+                response.status_code = 202
+                return response
+            txn = ledger.deposit(account, float(data["deposit_amount"]))
             
             response = jsonify({'account': account.to_dict(), 'transaction': txn.to_dict()})
             response.status_code=201
@@ -429,19 +814,31 @@ def deposit(user_id, account_num):
 
 @api.route('users/<int:user_id>/accounts/<int:account_num>/transfer', methods=['POST'])
 @token_auth.login_required
+@idempotent
 def transfer(user_id, account_num):
     """Fund transfers from user account to a specified registered user account. 
     Details of destination account and transfer amount are supplied in the JSON request.
         - Token authentication
-        - Query for valid sender user, account and sender account indeed belongs to user
+        - Query for valid sender account and that it indeed belongs to user, in one query
         - Checks for required receiver information in the JSON request
-        - Checks that amount is valid, not greater than amount held in sender's account
+        - Checks that amount is valid, not greater than amount held in sender's account less its pending transfers.
+        The check is part of the debit statement
         - Updates balance in both accounts
         - Creates "Transfer" type transaction
+        - With TRANSFER_NETTING on, only reserves the amount on the sender and records a pending posting instead,
+        balances and the transaction follow at the next settlement cycle (flask settle-transfers)
+        - With LEDGER_ENGINE_ENABLED on, applies the transfer in the in-memory engine (app.engine) instead, the
+        database follows at its next flush
+        - With LEDGER_SHARDS set, applies the transfer in the accounts' shards (app.shards) instead, with a
+        two-phase commit when they differ. The database follows at the next flask sync-shards
         
         JSON keyword fields
         - "to_account_num": recipient account number
+        - "to_alias": recipient email address or phone number, used when "to_account_num" is absent
         - "amount": amount to be transferred
+        
+        Optional headers
+        - "Idempotency-Key": retries carrying the same key replay the first response instead of transferring again
 
     Args:
         user_id (int): ID of user performing the fund transfer
@@ -449,9 +846,11 @@ def transfer(user_id, account_num):
 
     Returns:
         response 201 (JSON): JSON representation of sender account and transfer transaction details
+        response 202 (JSON): JSON representation of sender account and pending, engine or shard posting, with
+        TRANSFER_NETTING or LEDGER_ENGINE_ENABLED on, or LEDGER_SHARDS set
         403: Token authentication fails
-        404: Invalid user or accounts
-        400: Invalid credentials, attempt to transfer from an account not belonging to user, invalid transfer amount
+        404: Invalid user or accounts, unknown alias
+        400: Invalid credentials, attempt to transfer from an account not belonging to user, invalid transfer amount or alias
     
     Example:
         >>> transfer(1,1) to_account_num=2 amount=5
@@ -474,24 +873,137 @@ def transfer(user_id, account_num):
     """
     if token_auth.current_user().id != user_id:
         abort(403)
-    user = User.query.get_or_404(user_id)
-    account = Accounts.query.get_or_404(account_num)
+    row = queries.load_owned_account(account_num, user_id)
+    if row is None:
+        abort(404)
+    account, owned = row
     data = request.get_json() or {}
-    if account.account_owner == user:
+    if owned:
+        if "to_account_num" not in data and "to_alias" in data:
+            try:
+                data["to_account_num"] = aliases.resolve(data["to_alias"], fresh=True)
+            except ValueError as e:
+                return bad_request(str(e))
+            if data["to_account_num"] is None:
+                abort(404)
         if "to_account_num" in data and data["to_account_num"] != account.account_num:
-            recipient_account = Accounts.query.get_or_404(data["to_account_num"])
-            if "amount" in data and float(data["amount"]) >0 and account.balance - float(data["amount"]) >= 0:
-                account.update_balance(-float(data["amount"]))
-                recipient_account.update_balance(float(data["amount"]))
-                
-                txn_type = TransactionType.query.filter_by(name="Transfer").first()
-                txn = Transactions(receiver_account=recipient_account, sender_account=account, amount=float(data["amount"]), date_time=datetime.utcnow(), transaction_type=txn_type)
-                db.session.add_all([recipient_account, account, txn])
-                db.session.commit()
-                
-                response = jsonify({'account': account.to_dict(), 'transaction': txn.to_dict()})
-                response.status_code = 201
-                return response
+            if not account_may_exist(data["to_account_num"]):
+                abort(404)
+            recipient_account = queries.load_account(data["to_account_num"])
+            if recipient_account is None:
+                abort(404)
+            amount = float(data["amount"]) if "amount" in data else 0
+            if amount > 0 and engine.enabled():
+                posting = engine.get_engine().transfer(account.account_num, recipient_account.account_num, amount)
+                if posting is not None:
+                    response = jsonify({'account': engine.get_engine().account_dict(account), 'posting': posting.to_dict()})
+                    response.status_code = 202
+                    return response
+            elif amount > 0 and shards.enabled():
+                posting = shards.get_router().transfer(account.account_num, recipient_account.account_num, amount)
+                if posting is not None:
+                    response = jsonify({'account': shards.get_router().account_dict(account), 'posting': posting.to_dict()})
+                    response.status_code = 202
+                    return response
+            elif amount > 0 and current_app.config['TRANSFER_NETTING']:
+                posting = ledger.reserve_transfer(account, recipient_account, amount)
+                if posting is not None:
+                    response = jsonify({'account': account.to_dict(), 'posting': posting.to_dict()})
+                    response.status_code = 202
+                    return response
+            elif amount > 0:
+                txn = ledger.transfer(account, recipient_account, amount)
+                if txn is not None:
+                    response = jsonify({'account': account.to_dict(), 'transaction': txn.to_dict()})
+                    response.status_code = 201
+                    return response
             return bad_request('Please enter a valid transfer amount')
     return bad_request('Invalid credentials')
 
+
+
+@api.route('users/<int:user_id>/accounts/<int:account_num>/interbank_transfer', methods=['POST'])
+@token_auth.login_required
+@idempotent
+def interbank_transfer(user_id, account_num):
+    """Fund transfers from user account to an account at another bank.
+    Details of the other bank's account and transfer amount are supplied in the JSON request.
+        - Token authentication
+        - Query for valid sender account and that it indeed belongs to user, in one query
+        - Checks the other bank's code and account, and that amount is valid, not greater than amount held in
+        sender's account less its pending transfers
+        - Updates the sender's balance and creates a "Withdrawal" type transaction together with an outbound clearing
+        entry, paid to the other bank through the next clearing file (flask clearing export)
+        - Not available with LEDGER_ENGINE_ENABLED on or LEDGER_SHARDS set
+        
+        JSON keyword fields
+        - "bank_code": code of the other bank
+        - "to_account": account at the other bank
+        - "amount": amount to be transferred
+        
+        Optional headers
+        - "Idempotency-Key": retries carrying the same key replay the first response instead of transferring again
+
+    Args:
+        user_id (int): ID of user performing the fund transfer
+        account_num (int): ID of user account where funds are moved from
+
+    Returns:
+        response 201 (JSON): JSON representation of sender account, withdrawal transaction and clearing entry
+        403: Token authentication fails
+        404: Invalid user or account
+        400: Invalid credentials, attempt to transfer from an account not belonging to user, invalid bank code,
+        account or transfer amount
+    
+    Example:
+        >>> interbank_transfer(1,1) bank_code="OTHERBANK" to_account="GB29NWBK60161331926819" amount=5
+        {
+            "account": {
+                "account_num": 1,
+                "balance": 6.0,
+                "owner": 1
+            },
+            "clearing": {
+                "account_num": 1,
+                "amount": 5.0,
+                "bank_code": "OTHERBANK",
+                "counterparty": "GB29NWBK60161331926819",
+                "direction": "out",
+                "id": 1,
+                "reference": "4",
+                "status": "pending"
+            },
+            "transaction": {
+                "amount": 5
+                "from": "Jane Doe" 
+                "from_acc": 1,
+                "id": 4,
+                "to": "Jane Doe",
+                "to_acc": 1,
+                "type": "Withdrawal"
+            }
+        }
+    """
+    if token_auth.current_user().id != user_id:
+        abort(403)
+    row = queries.load_owned_account(account_num, user_id)
+    if row is None:
+        abort(404)
+    account, owned = row
+    data = request.get_json() or {}
+    if owned:
+        if engine.enabled() or shards.enabled():
+            return bad_request('Inter-bank transfers are not available')
+        try:
+            clearing.check_counterparty(data.get("bank_code"), data.get("to_account"))
+        except ValueError as e:
+            return bad_request(str(e))
+        amount = float(data["amount"]) if "amount" in data else 0
+        result = ledger.interbank_transfer(account, data["bank_code"], data["to_account"], amount) if amount > 0 else None
+        if result is not None:
+            txn, entry = result
+            response = jsonify({'account': account.to_dict(), 'transaction': txn.to_dict(), 'clearing': entry.to_dict()})
+            response.status_code = 201
+            return response
+        return bad_request('Please enter a valid transfer amount')
+    return bad_request('Invalid credentials')
@@ -0,0 +1,340 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from heapq import merge
+from typing import Dict
+from flask import current_app
+from sqlalchemy.sql.visitors import replacement_traverse
+from app import db, tenancy
+from app.models import Accounts, Transactions, Posting, ArchivePartition, ClearingEntry
+
+
+# Hot / cold tiers of the transaction journal.
+# - archive_transactions() moves whole months older than TRANSACTION_ARCHIVE_HORIZON_DAYS out of transactions_table
+# and postings_table into one SQLite file per month, with the same columns and indexes. Moving a month is the only
+# way rows leave the journal: they are kept, only stored elsewhere.
+# - Closed months are vacuumed, made read-only and optionally gzipped. Compressed months are expanded to
+# TRANSACTION_ARCHIVE_DIR/cache the first time they are read.
+# - Reads attach the months they need to the session's connection (ATTACH DATABASE), keeping up to
+# TRANSACTION_ARCHIVE_MAX_ATTACHED per connection. Any select over transactions_table / postings_table can be run
+# against a month with retarget(), so history queries run unchanged on the hot tables and on each month in range.
+# - Clearing entries move with their transactions. A transaction whose outbound entry has not been exported yet
+# (flask clearing export) stays hot, like the late rows of a month already archived.
+
+_JOURNAL = (Transactions.__table__, Posting.__table__, ClearingEntry.__table__)
+# Raises an account's archived_txn_id to txn_id
+ARCHIVED_MARK = (db.update(Accounts.__table__)
+                 .where(Accounts.__table__.c.account_num == db.bindparam('account'))
+                 .values(archived_txn_id=db.func.max(Accounts.__table__.c.archived_txn_id, db.bindparam('txn_id'))))
+_metadata = db.MetaData()
+_tables: Dict[str, dict] = {}
+_tables_lock = threading.Lock()
+_expand_lock = threading.Lock()
+
+
+def archive_directory():
+    # TRANSACTION_ARCHIVE_DIR, in a subdirectory per tenant
+    tenant = tenancy.current()
+    directory = current_app.config['TRANSACTION_ARCHIVE_DIR']
+    return directory if tenant is None else os.path.join(directory, tenant)
+
+
+def schema_name(month):
+    return 'archive_' + month.replace('-', '_')
+
+
+def archive_tables(schema):
+    # Copies of transactions_table, postings_table and clearing_entries_table in an attached schema, keyed by the
+    # hot table. No foreign keys: the accounts, users and clearing files they refer to stay in the main database
+    tables = _tables.get(schema)
+    if tables is None:
+        with _tables_lock:
+            tables = _tables.get(schema)
+            if tables is None:
+                tables = {}
+                for table in _JOURNAL:
+                    copy = db.Table(table.name, _metadata, *[db.Column(column.name, column.type, primary_key=column.primary_key)
+                                                             for column in table.columns], schema=schema)
+                    for index in table.indexes:
+                        db.Index(index.name, *[copy.c[column.name] for column in index.columns])
+                    tables[table] = copy
+                _tables[schema] = tables
+    return tables
+
+
+def retarget(stmt, schema):
+    """The same statement reading an archived month instead of the hot tables
+
+    Args:
+        stmt (Executable): statement over transactions_table and / or postings_table
+        schema (str): schema name the month is attached as
+
+    Returns:
+        Executable: copy of stmt, other tables (accounts, users, ...) are still read from the main database
+    """
+    tables = archive_tables(schema)
+
+    def replace(element):
+        if element.__visit_name__ == 'table':
+            return tables.get(element._deannotate())
+        if element.__visit_name__ == 'column' and getattr(element, 'table', None) in tables:
+            return tables[element.table].c[element.name]
+        return None
+    return replacement_traverse(stmt, {}, replace)
+
+
+def all_partitions() -> list:
+    """Every archived month, oldest first
+        - Cached per process until the manifest file in TRANSACTION_ARCHIVE_DIR changes, archive_transactions()
+        rewrites it after each month. Reads cost no query, and none at all while nothing is archived
+
+    Returns:
+        list: archive_partitions_table rows
+    """
+    try:
+        stat = os.stat(os.path.join(archive_directory(), 'manifest'))
+    except FileNotFoundError:
+        return []
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = tenancy.extensions().get('archive_partitions')
+    if cached is None or cached[0] != stamp:
+        rows = db.session.execute(db.select(ArchivePartition.__table__).order_by(ArchivePartition.start)).all()
+        cached = tenancy.extensions()['archive_partitions'] = (stamp, rows)
+    return cached[1]
+
+
+def partitions(date_from=None, date_to=None, descending=True) -> list:
+    """Archived months overlapping a date range
+
+    Args:
+        date_from (datetime, optional): inclusive lower bound
+        date_to (datetime, optional): exclusive upper bound
+        descending (bool): newest month first
+
+    Returns:
+        list: archive_partitions_table rows
+    """
+    found = [partition for partition in all_partitions() if (date_from is None or partition.end > date_from) and
+             (date_to is None or partition.start < date_to)]
+    return found[::-1] if descending else found
+
+
+def covering(ids) -> list:
+    # Archived months whose transaction ID range includes one of ids
+    return [partition for partition in all_partitions()
+            if any(partition.min_txn_id <= id <= partition.max_txn_id for id in ids)]
+
+
+def attach(partition):
+    """Attaches an archived month to the session's connection, unless it already is
+
+    Args:
+        partition (Row): archive_partitions_table row of the month to read
+
+    Returns:
+        str: schema name to pass to retarget()
+    """
+    connection = db.session.connection()
+    attached = connection.info.setdefault('archive_partitions', OrderedDict())
+    schema = schema_name(partition.month)
+    if schema in attached:
+        attached.move_to_end(schema)
+        return schema
+    path = _readable_path(partition)
+    while len(attached) >= current_app.config['TRANSACTION_ARCHIVE_MAX_ATTACHED']:
+        connection.exec_driver_sql('DETACH DATABASE ' + attached.popitem(last=False)[0])
+    connection.exec_driver_sql('ATTACH DATABASE ? AS ' + schema, (path,))
+    attached[schema] = True
+    return schema
+
+
+def execute(stmt, months, params=None) -> list:
+    """Rows of a statement over transactions_table / postings_table run against archived months
+
+    Args:
+        stmt (Executable): statement over the hot tables
+        months (list): archive_partitions_table rows of the months to read, in order
+        params (dict, optional): bound parameter values
+
+    Returns:
+        list: rows of every month, one month after the other
+    """
+    rows: list = []
+    for partition in months:
+        rows.extend(db.session.execute(retarget(stmt, attach(partition)), params).all())
+    return rows
+
+
+def history(stmt, search) -> list:
+    """Rows of a transaction history select over the hot table and every archived month inside its date range
+        - stmt is built with TransactionSearch.apply() and ends with (date_time, id) columns. Rows come back in the
+        search's order, trimmed to one page (plus the extra row) when paginated
+        - Months are read in the search's order and reading stops as soon as the page is full and the next month
+        only holds rows that sort after it, so recent pages never touch the archive
+
+    Args:
+        stmt (Select): select over transactions_table
+        search (TransactionSearch): filters, order and pagination stmt was built with
+
+    Returns:
+        list: rows, ready for search.page()
+    """
+    rows = list(db.session.execute(stmt).all())
+    date_from, date_to = search.date_from, search.date_to
+    if search.after is not None:
+        # The cursor bounds the range too
+        if search.descending:
+            bound = search.after[0] + timedelta(microseconds=1)
+            date_to = min(date_to, bound) if date_to is not None else bound
+        else:
+            date_from = max(date_from, search.after[0]) if date_from is not None else search.after[0]
+    for partition in partitions(date_from, date_to, search.descending):
+        if search.paginated and len(rows) > search.limit:
+            last = rows[search.limit][-2]
+            if (last >= partition.end) if search.descending else (last < partition.start):
+                break
+        rows = list(merge(rows, execute(stmt, [partition]), key=lambda row: (row[-2], row[-1]),
+                          reverse=search.descending))
+        if search.paginated:
+            rows = rows[:search.limit + 1]
+    return rows
+
+
+def archive_transactions(up_to_txn_id, before=None, compress=None) -> list:
+    """Moves whole months of transactions, and their postings, from the hot tables into archive files
+        - Months ending before the start of the month holding before are archived, one file and one database
+        transaction each. Months that are already archived are skipped, their late rows stay hot
+        - Transactions with an ID above up_to_txn_id stay hot. Pass the latest checkpoint's transaction, so
+        replays from checkpoints never read the archive
+
+    Args:
+        up_to_txn_id (int): highest transaction ID that may be archived
+        before (datetime, optional): now minus TRANSACTION_ARCHIVE_HORIZON_DAYS by default
+        compress (bool, optional): gzip the files, TRANSACTION_ARCHIVE_COMPRESS by default
+
+    Returns:
+        list: ArchivePartition objects created, oldest first
+    """
+    config = current_app.config
+    before = before or datetime.utcnow() - timedelta(days=config['TRANSACTION_ARCHIVE_HORIZON_DAYS'])
+    compress = config['TRANSACTION_ARCHIVE_COMPRESS'] if compress is None else compress
+    cutoff = _month_start(before)
+    first = db.session.execute(db.select(db.func.min(Transactions.date_time))
+                               .where(Transactions.date_time < cutoff, Transactions.id <= up_to_txn_id)).scalar()
+    created = []
+    month = _month_start(first) if first is not None else cutoff
+    while month < cutoff:
+        end = _month_start(month + timedelta(days=32))
+        if db.session.get(ArchivePartition, '{:%Y-%m}'.format(month)) is None:
+            partition = _archive_month(month, end, up_to_txn_id, compress)
+            if partition is not None:
+                created.append(partition)
+        month = end
+    return created
+
+
+def _archive_month(start, end, up_to_txn_id, compress):
+    directory = archive_directory()
+    os.makedirs(directory, exist_ok=True)
+    month = '{:%Y-%m}'.format(start)
+    name = 'transactions-{}.sqlite'.format(month)
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        # Left over by an interrupted run, its rows were never removed from the hot tables
+        os.remove(path)
+    unexported = db.exists().where(ClearingEntry.txn_id == Transactions.id, ClearingEntry.clearing_file_id.is_(None))
+    in_month = ((Transactions.date_time >= start) & (Transactions.date_time < end) & (Transactions.id <= up_to_txn_id)
+                & ~unexported)
+    ids = db.select(Transactions.id).where(in_month)
+    tables = archive_tables('archive_new')
+    transactions, postings = tables[Transactions.__table__], tables[Posting.__table__]
+    entries = tables[ClearingEntry.__table__]
+    db.session.commit()
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('ATTACH DATABASE ? AS archive_new', (path,))
+        try:
+            for table in tables.values():
+                table.create(connection)
+            count = connection.execute(transactions.insert().from_select(
+                [column.name for column in Transactions.__table__.columns],
+                db.select(*Transactions.__table__.columns).where(in_month))).rowcount
+            if count:
+                connection.execute(postings.insert().from_select(
+                    [column.name for column in Posting.__table__.columns],
+                    db.select(*Posting.__table__.columns).where(Posting.txn_id.in_(ids))))
+                low, high = connection.execute(db.select(db.func.min(transactions.c.id), db.func.max(transactions.c.id))).first()
+                # Accounts keep the latest id that leaves, in the same transaction (see Accounts.ledger_marks)
+                legs = db.union_all(db.select(transactions.c.sender.label('account_num'), transactions.c.id),
+                                    db.select(transactions.c.receiver, transactions.c.id)).subquery()
+                marks = connection.execute(db.select(legs.c.account_num, db.func.max(legs.c.id))
+                                           .group_by(legs.c.account_num)).all()
+                connection.execute(ARCHIVED_MARK, [{'account': account_num, 'txn_id': txn_id}
+                                                   for account_num, txn_id in marks])
+                connection.execute(entries.insert().from_select(
+                    [column.name for column in ClearingEntry.__table__.columns],
+                    db.select(*ClearingEntry.__table__.columns).where(ClearingEntry.txn_id.in_(ids))))
+                connection.execute(db.delete(ClearingEntry.__table__).where(ClearingEntry.txn_id.in_(ids)))
+                connection.execute(db.delete(Posting.__table__).where(Posting.txn_id.in_(ids)))
+                connection.execute(db.delete(Transactions.__table__).where(in_month))
+                connection.execute(db.insert(ArchivePartition.__table__).values(
+                    month=month, path=name, start=start, end=end, min_txn_id=low, max_txn_id=high, transactions=count,
+                    compressed=False, created_at=datetime.utcnow()))
+            connection.commit()
+        finally:
+            connection.rollback()
+            connection.exec_driver_sql('DETACH DATABASE archive_new')
+    if not count:
+        os.remove(path)
+        return None
+    # Closed for good: compact, make read-only and compress
+    vacuum = sqlite3.connect(path)
+    vacuum.execute('VACUUM')
+    vacuum.close()
+    os.chmod(path, 0o444)
+    _write_manifest(directory)
+    partition = db.session.get(ArchivePartition, month)
+    if compress:
+        with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.chmod(path + '.gz', 0o444)
+        partition.path, partition.compressed = name + '.gz', True
+        db.session.commit()
+        _write_manifest(directory)
+        # Readers that attached the uncompressed file keep it open until they detach
+        os.remove(path)
+    return partition
+
+
+def _write_manifest(directory):
+    # Tells every process to reload the list of archived months
+    lines = ['{} {}'.format(month, path) for month, path in
+             db.session.execute(db.select(ArchivePartition.month, ArchivePartition.path).order_by(ArchivePartition.month))]
+    with open(os.path.join(directory, 'manifest.tmp'), 'w') as manifest:
+        manifest.write('\n'.join(lines) + '\n')
+    os.replace(os.path.join(directory, 'manifest.tmp'), os.path.join(directory, 'manifest'))
+
+
+def _readable_path(partition):
+    # File to attach, compressed months are expanded to the cache directory once
+    directory = archive_directory()
+    path = os.path.join(directory, partition.path)
+    if not partition.compressed:
+        return path
+    expanded = os.path.join(directory, 'cache', partition.path[:-len('.gz')])
+    if not os.path.exists(expanded):
+        with _expand_lock:
+            if not os.path.exists(expanded):
+                os.makedirs(os.path.dirname(expanded), exist_ok=True)
+                with gzip.open(path, 'rb') as source, open(expanded + '.tmp', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.chmod(expanded + '.tmp', 0o444)
+                os.replace(expanded + '.tmp', expanded)
+    return expanded
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
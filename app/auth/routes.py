@@ -1,11 +1,13 @@
-from flask import render_template, redirect, url_for, flash, request, Response
+from flask import render_template, redirect, url_for, flash, request, Response, current_app
 from flask_login import current_user, login_user, logout_user, login_required
 from ..main.forms import RegistrationForm, LoginForm, TransferForm, DepositForm, UpdateEmailForm, UpdatePasswordForm
-from app.models import User, Role, Accounts, Transactions, TransactionType
-from datetime import datetime
+from app.models import User, Role
+from app.bloom import email_may_exist, account_may_exist, add_email
+from app import aliases, ledger, queries, engine, shards
 from .. import db
 from . import auth
 from werkzeug.urls import url_parse
+from sqlalchemy.exc import IntegrityError
 
 
 @auth.route('/register', methods=['GET', 'POST'])
@@ -25,19 +27,15 @@ def register() -> Response:
         user = User(first_name=form.first_name.data, last_name=form.last_name.data, email=form.email.data) # Defaults role to user role 
         user.set_password(form.password.data)
         db.session.add(user)
-        db.session.commit()
-        
-        
-        user_acc = Accounts(account_owner=user)
-        db.session.add(user_acc)
-        db.session.commit()
-        
-        txn_type = TransactionType.query.filter_by(name="New Account").first()
-        txn = Transactions(receiver_account=user_acc, sender_account=user_acc, amount=0, date_time=datetime.utcnow(), 
-                           transaction_type=txn_type)
-        
-        db.session.add(txn)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Taken by a change the email filter has not seen yet, e.g. an email update in another process
+            db.session.rollback()
+            add_email(form.email.data)
+            form.email.errors.append('Please use a different email address.')
+            return render_template('auth/register.html', form=form)
+        ledger.open_account(user)
         flash('Congratulations, you are now a registered user! Please login')
         return redirect(url_for('auth.login'))
     return render_template('auth/register.html', form=form)
@@ -58,7 +56,7 @@ def login() -> Response:
         return redirect(url_for('main.index'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = queries.load_user_by_email(form.email.data)
         if user is None or not user.check_password(form.password.data):
             flash('Invalid email or password', 'error')
             return redirect(url_for('auth.login'))
@@ -92,24 +90,45 @@ def transfer() -> Response:
     """
     form = TransferForm()
     if form.validate_on_submit():
-        recipient_acc = Accounts.query.filter_by(account_num=form.recipient_acc_num.data).first()
+        recipient_acc_num = form.recipient_acc_num.data
+        if recipient_acc_num is None:
+            try:
+                recipient_acc_num = aliases.resolve(form.recipient_alias.data, fresh=True)
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('auth.transfer'))
+        if recipient_acc_num is None or not account_may_exist(recipient_acc_num):
+            flash('User not found', 'danger')
+            return redirect(url_for('auth.transfer'))
+        recipient_acc = queries.load_account(recipient_acc_num)
         # recipient_acc_num = recipient_acc.account_num
-        sender_acc = Accounts.query.filter_by(owner=current_user.id).first()
+        sender_acc = queries.load_owner_account(current_user.id)
         # sender_acc_num = sender_acc.account_num
-        if recipient_acc is None:
+        if recipient_acc is None or sender_acc is None:
             flash('User not found', 'danger')
             return redirect(url_for('auth.transfer'))
-        elif sender_acc.balance < form.amount.data:
+        elif engine.enabled():
+            if engine.get_engine().transfer(sender_acc.account_num, recipient_acc.account_num, form.amount.data) is None:
+                flash('Insufficient account balance', 'danger')
+                return redirect(url_for('auth.transfer'))
+            flash('Transfer Success!', 'success')
+            return redirect(url_for('main.index'))
+        elif shards.enabled():
+            if shards.get_router().transfer(sender_acc.account_num, recipient_acc.account_num, form.amount.data) is None:
+                flash('Insufficient account balance', 'danger')
+                return redirect(url_for('auth.transfer'))
+            flash('Transfer Success!', 'success')
+            return redirect(url_for('main.index'))
+        elif current_app.config['TRANSFER_NETTING']:
+            if ledger.reserve_transfer(sender_acc, recipient_acc, form.amount.data) is None:
+                flash('Insufficient account balance', 'danger')
+                return redirect(url_for('auth.transfer'))
+            flash('Transfer Success! It will show in your balance once settled', 'success')
+            return redirect(url_for('main.index'))
+        elif ledger.transfer(sender_acc, recipient_acc, form.amount.data) is None:
             flash('Insufficient account balance', 'danger')
             return redirect(url_for('auth.transfer'))
         else:
-            recipient_acc.update_balance(form.amount.data)
-            sender_acc.update_balance(-form.amount.data)
-            
-            txn_type = TransactionType.query.filter_by(name="Transfer").first()
-            txn = Transactions(receiver_account=recipient_acc, sender_account=sender_acc, amount=form.amount.data, date_time=datetime.utcnow(), transaction_type=txn_type)
-            db.session.add_all([recipient_acc, sender_acc, txn])
-            db.session.commit()
             flash('Transfer Success!', 'success')
             return redirect(url_for('main.index'))
     return render_template('auth/transfer.html', title='Funds Transfer', form=form)
@@ -126,15 +145,16 @@ def deposit() -> Response:
     """
     form = DepositForm()
     if form.validate_on_submit():
-        acc_owner = User.query.filter_by(email=current_user.email).first()
-        own_account = Accounts.query.filter_by(owner=acc_owner.id).first()
-        own_account.update_balance(form.amount.data)
-        
-        txn_type = TransactionType.query.filter_by(name="Deposit").first()
-        txn = Transactions(receiver_account=own_account, sender_account=own_account, amount=form.amount.data, date_time=datetime.utcnow(), transaction_type=txn_type)
-        db.session.add_all([own_account, txn])
-        
-        db.session.commit()
+        own_account = queries.load_owner_account(current_user.id)
+        if own_account is None:
+            flash('Account not found', 'danger')
+            return redirect(url_for('main.index'))
+        if engine.enabled():
+            engine.get_engine().deposit(own_account.account_num, form.amount.data)
+        elif shards.enabled():
+            shards.get_router().deposit(own_account.account_num, form.amount.data)
+        else:
+            ledger.deposit(own_account, form.amount.data)
         flash('Deposit Success!', 'success')
         return redirect(url_for('main.index'))
     return render_template('auth/deposit.html', title='Deposit', form=form)
@@ -147,17 +167,25 @@ def update() -> Response:
         - Requires users to be logged in
         - Upon form validation:
             i. Queries to check if new email has been taken, if yes, flash corresponding message and reloads page
-            ii. If new email is free for grabs, query for current_user, update email and push to database
+            ii. If new email is free for grabs, query for current_user, update email and its payment alias and push to database
 
     Returns:
         Response: update.html if GET or unsuccessful update else index.html
     """
     form = UpdateEmailForm()
     if form.validate_on_submit():
-        existing_user = User.query.filter_by(email=form.new_email.data).first()
+        existing_user = User.query.filter_by(email=form.new_email.data).first() if email_may_exist(form.new_email.data) else None
         if existing_user is None:
+            aliases.rename_email(current_user.id, current_user.email, form.new_email.data)
             acc_owner = User.query.filter_by(email=current_user.email).update(dict(email=form.new_email.data))
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                add_email(form.new_email.data)
+                flash('Please choose another email address', 'info')
+                return render_template('auth/update.html', title='Update Email', form=form)
+            add_email(form.new_email.data)
             flash('Email changed successful!', 'success')
             return redirect(url_for('main.index'))
         else:
@@ -0,0 +1,208 @@
+import hashlib
+import math
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from app import db, tenancy
+from app.models import User, Accounts
+
+
+class BloomFilter:
+    """Fixed size Bloom filter over strings
+        - "not in" answers are definite, "in" answers are false positives with probability ~error_rate while
+        no more than capacity items have been added
+        - Positions come from one blake2b digest split into two 64 bit halves (Kirsch-Mitzenmacher double hashing)
+
+    Args:
+        capacity (int): number of items the filter is sized for
+        error_rate (float): target false positive rate at capacity
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        self.num_bits = max(int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        # Adds are serialised, a lost read-modify-write on a shared byte would turn into a false negative
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def size_bytes(self):
+        return len(self.bits)
+
+    @property
+    def estimated_false_positive_rate(self):
+        # (1 - e^(-kn/m))^k for the items added so far
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class NegativeLookupFilter:
+    """Bloom filter over one unique column, answering "definitely absent" without a database query
+        - Built from the table on first use, then kept current by the insert / update hooks below
+        - Rows inserted by other processes are picked up by an incremental catch-up on the primary key, run before
+        every negative answer. It is a range read past the highest key seen, usually empty, so a row committed
+        anywhere before the lookup is never reported absent
+        - Values changed by updates in other processes are not picked up, writers relying on a negative answer
+        must still handle the unique constraint's IntegrityError
+        - Rebuilt with twice the capacity once more items than its capacity have been added
+
+    Args:
+        name (str): metric name
+        column (Column): unique column whose values are filtered
+        key (Column): integer primary key used for the incremental catch-up
+    """
+
+    def __init__(self, name, column, key):
+        self.name = name
+        self.column = column
+        self.key = key
+        self.filter = None
+        self.last_key = 0
+        self.negatives = 0
+        self.maybes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def needs_build(self):
+        return self.filter is None or self.filter.count > self.filter.capacity
+
+    def build(self):
+        config = current_app.config
+        with self._lock:
+            if not self.needs_build:
+                return
+            count = db.session.execute(db.select(db.func.count()).select_from(self.column.table)).scalar()
+            capacity = max(2 * count, config['BLOOM_FILTER_MIN_CAPACITY'])
+            # Publish the empty filter first so rows flushed while the table is read are not lost
+            self.filter = BloomFilter(capacity, config['BLOOM_FILTER_ERROR_RATE'])
+            self.last_key = 0
+            self.sync()
+
+    def sync(self):
+        # Adds rows with a primary key above the highest one seen
+        rows = db.session.execute(db.select(self.key, self.column).where(self.key > self.last_key)
+                                  .order_by(self.key).execution_options(yield_per=10000))
+        for key, value in rows:
+            self.filter.add(value)
+            self.last_key = key
+
+    def add(self, value):
+        if self.filter is not None:
+            self.filter.add(value)
+
+    def may_contain(self, value):
+        """False when value is definitely not in the column, True when it may be
+
+        Args:
+            value: value to look up
+
+        Returns:
+            bool: whether a database lookup is needed
+        """
+        if self.needs_build:
+            self.build()
+        if value in self.filter:
+            self.maybes += 1
+            return True
+        with self._lock:
+            self.sync()
+        if value in self.filter:
+            self.maybes += 1
+            return True
+        self.negatives += 1
+        return False
+
+    def metrics(self):
+        if self.filter is None:
+            return {'built': False}
+        return {
+            'built': True,
+            'items': self.filter.count,
+            'capacity': self.filter.capacity,
+            'size_bytes': self.filter.size_bytes,
+            'hash_functions': self.filter.num_hashes,
+            'target_false_positive_rate': self.filter.error_rate,
+            'estimated_false_positive_rate': self.filter.estimated_false_positive_rate,
+            'definite_negatives': self.negatives,
+            'possible_positives': self.maybes,
+        }
+
+
+def get_filters():
+    # Filters live per application and tenant, so each app (and each test app) sees only its own database
+    filters = tenancy.extensions().get('bloom_filters')
+    if filters is None:
+        filters = tenancy.extensions().setdefault('bloom_filters', {
+            'emails': NegativeLookupFilter('emails', User.email, User.id),
+            'accounts': NegativeLookupFilter('accounts', Accounts.account_num, Accounts.account_num),
+        })
+    return filters
+
+
+def email_may_exist(email):
+    """False when no user has this email, True when one may have it
+
+    Args:
+        email (str): email address
+
+    Returns:
+        bool: whether users_table needs to be queried
+    """
+    if not current_app.config['BLOOM_FILTER_ENABLED']:
+        return True
+    return get_filters()['emails'].may_contain(email)
+
+
+def account_may_exist(account_num):
+    """False when no account has this number, True when one may have it
+
+    Args:
+        account_num (int): account number
+
+    Returns:
+        bool: whether accounts_table needs to be queried
+    """
+    if not current_app.config['BLOOM_FILTER_ENABLED']:
+        return True
+    return get_filters()['accounts'].may_contain(account_num)
+
+
+def add_email(email):
+    # For bulk UPDATE statements that bypass the ORM hooks below
+    if has_app_context() and 'bloom_filters' in tenancy.extensions():
+        tenancy.extensions()['bloom_filters']['emails'].add(email)
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    add_email(target.email)
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    if inspect(target).attrs.email.history.has_changes():
+        add_email(target.email)
+
+
+@event.listens_for(Accounts, 'after_insert')
+def _account_inserted(mapper, connection, target):
+    if has_app_context() and 'bloom_filters' in tenancy.extensions():
+        tenancy.extensions()['bloom_filters']['accounts'].add(target.account_num)
@@ -0,0 +1,303 @@
+import csv
+import functools
+import hashlib
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db, ledger, recent, engine, shards
+from app.models import Accounts, Transactions, TransactionType, ClearingEntry, ClearingFile
+
+
+# Inter-bank clearing files, exported and imported in batches (flask clearing export / import).
+# - Outbound postings (app.ledger.interbank_transfer) debit the local account right away and wait as ClearingEntry
+# rows for the next export. Inbound files credit local accounts with "Deposit" transactions.
+# - A file is a header, detail records and a trailer carrying their count and total, one record per line, either
+# fixed-width or CSV with the same fields. Amounts are in cents.
+# - Both directions stream: rows are written as they are read from the database and records are posted in chunks
+# of CLEARING_CHUNK_SIZE, memory does not grow with the file.
+
+# Record layouts, (field, width in fixed-width files)
+HEADER = (('record', 1), ('bank_code', 11), ('date', 8))
+DETAIL = (('record', 1), ('date', 8), ('account_num', 12), ('bank_code', 11), ('counterparty', 34), ('amount', 15),
+          ('reference', 35))
+TRAILER = (('record', 1), ('entries', 12), ('total', 18))
+LAYOUTS = {'H': HEADER, 'D': DETAIL, 'T': TRAILER}
+# Zero filled on the left in fixed-width files, other fields are filled with spaces on the right
+NUMERIC = {'date', 'account_num', 'amount', 'entries', 'total'}
+FORMATS = ('fixed', 'csv')
+
+BANK_CODE = re.compile(r'^[A-Z0-9]{4,11}$')
+COUNTERPARTY = re.compile(r'^[A-Za-z0-9]{1,34}$')
+
+_SLICES: Dict[str, List[Tuple[int, int]]] = {}
+for _kind, _layout in LAYOUTS.items():
+    _start, _SLICES[_kind] = 0, []
+    for _, _width in _layout:
+        _SLICES[_kind].append((_start, _start + _width))
+        _start += _width
+
+class Record(NamedTuple):
+    line: int
+    account_num: int
+    bank_code: str
+    counterparty: str
+    cents: int
+    reference: str
+    date_time: datetime
+
+
+def check_counterparty(bank_code, counterparty):
+    """Validates the other bank's side of an inter-bank posting
+
+    Args:
+        bank_code (str): code of the other bank, 4 to 11 upper case letters or digits
+        counterparty (str): account at the other bank, up to 34 letters or digits
+
+    Raises:
+        ValueError: when either is invalid, or bank_code is this bank's (CLEARING_BANK_CODE)
+    """
+    if not isinstance(bank_code, str) or not BANK_CODE.match(bank_code):
+        raise ValueError('Invalid bank code')
+    if bank_code == current_app.config['CLEARING_BANK_CODE']:
+        raise ValueError('Accounts of this bank are paid with a transfer')
+    if not isinstance(counterparty, str) or not COUNTERPARTY.match(counterparty):
+        raise ValueError('Invalid counterparty account')
+
+
+def file_format(path, fmt=None):
+    # fmt when given, csv for .csv files, CLEARING_FILE_FORMAT otherwise
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else current_app.config['CLEARING_FILE_FORMAT'])
+    if fmt not in FORMATS:
+        raise ValueError('Unknown clearing file format {!r}'.format(fmt))
+    return fmt
+
+
+def export_file(path, fmt=None):
+    """Writes the outbound entries not exported yet to a clearing file
+        - Entries are streamed from the database in chunks of CLEARING_CHUNK_SIZE rows, up to the latest one at the
+        start, and marked as exported with one update
+        - The file is written next to path and renamed before the entries are marked. A failure in between leaves the
+        entries to be exported again, never a marked entry without a file: receiving banks refuse references they
+        already posted
+
+    Args:
+        path (str): file to write
+        fmt (str, optional): "fixed" or "csv", from the file name by default
+
+    Returns:
+        ClearingFile: the exported file, None when there was nothing to export
+    """
+    fmt = file_format(path, fmt)
+    pending = (ClearingEntry.direction == 'out') & ClearingEntry.clearing_file_id.is_(None)
+    last = db.session.execute(db.select(db.func.max(ClearingEntry.id)).where(pending)).scalar()
+    if last is None:
+        return None
+    rows = db.session.execute(
+        db.select(ClearingEntry.date_time, ClearingEntry.account_num, ClearingEntry.bank_code,
+                  ClearingEntry.counterparty, ClearingEntry.amount, ClearingEntry.reference)
+        .where(pending, ClearingEntry.id <= last).order_by(ClearingEntry.id),
+        execution_options={'yield_per': current_app.config['CLEARING_CHUNK_SIZE']})
+    partial = path + '.part'
+    entries = total = 0
+    try:
+        with open(partial, 'w', newline='') as file:
+            write = _writer(file, fmt)
+            write(('H', current_app.config['CLEARING_BANK_CODE'], datetime.utcnow().strftime('%Y%m%d')))
+            for date_time, account_num, bank_code, counterparty, amount, reference in rows:
+                cents = round(amount * 100)
+                write(('D', date_time.strftime('%Y%m%d'), account_num, bank_code, counterparty, cents, reference))
+                entries += 1
+                total += cents
+            write(('T', entries, total))
+        clearing_file = ClearingFile(direction='out', name=os.path.basename(path), format=fmt,
+                                     checksum=_checksum(partial), entries=entries, total=total / 100)
+        db.session.add(clearing_file)
+        db.session.flush()
+        db.session.execute(db.update(ClearingEntry).where(pending, ClearingEntry.id <= last)
+                           .values(clearing_file_id=clearing_file.id))
+        os.replace(partial, path)
+    except BaseException:
+        db.session.rollback()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    try:
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        os.remove(path)
+        raise
+    return clearing_file
+
+
+def import_file(path, fmt=None, dry_run=False):
+    """Posts the detail records of an inbound clearing file to the local accounts they name
+        - The file is read twice, both times as a stream: once for its checksum, a file already imported is refused,
+        then to post its records in chunks of CLEARING_CHUNK_SIZE. Each chunk is validated, its accounts looked up
+        with one query, and posted with bulk inserts of its "Deposit" transactions and clearing entries and one net
+        balance update per account
+        - The whole file is one database transaction, committed once the trailer matches the records' count and
+        total, so a file is posted entirely or not at all. Other writers wait for it
+
+    Args:
+        path (str): file to read
+        fmt (str, optional): "fixed" or "csv", from the file name by default
+        dry_run (bool): validate and post the file, then roll it back
+
+    Raises:
+        ValueError: when the file was already imported or a record is invalid, with its line number
+        RuntimeError: with LEDGER_ENGINE_ENABLED on or LEDGER_SHARDS set, which own the balances
+
+    Returns:
+        ClearingFile: the imported file
+    """
+    if engine.enabled() or shards.enabled():
+        raise RuntimeError('Clearing files cannot be imported while the ledger engine or shards hold the balances')
+    fmt = file_format(path, fmt)
+    checksum = _checksum(path)
+    if db.session.execute(db.select(ClearingFile.id).where(ClearingFile.direction == 'in',
+                                                           ClearingFile.checksum == checksum)).scalar() is not None:
+        raise ValueError('{} was already imported'.format(os.path.basename(path)))
+    deposit = db.session.execute(db.select(TransactionType.id).where(TransactionType.name == 'Deposit')).scalar()
+    chunk_size = current_app.config['CLEARING_CHUNK_SIZE']
+    clearing_file = ClearingFile(direction='in', name=os.path.basename(path), format=fmt, checksum=checksum)
+    entries = total = 0
+    header = trailer = None
+    chunk = []
+    try:
+        db.session.add(clearing_file)
+        db.session.flush()
+        with open(path, newline='') as file:
+            for line, row in _records(file, fmt):
+                if (row[0] == 'H') != (header is None):
+                    raise ValueError('Line {}: a file starts with one header record'.format(line))
+                if trailer is not None:
+                    raise ValueError('Line {}: records after the trailer'.format(line))
+                if row[0] == 'H':
+                    if row[1] != current_app.config['CLEARING_BANK_CODE']:
+                        raise ValueError('Line {}: file for bank {}'.format(line, row[1]))
+                    header = row
+                elif row[0] == 'T':
+                    trailer = (line, row)
+                else:
+                    chunk.append(_record(line, row))
+                    if len(chunk) == chunk_size:
+                        total += _post(chunk, clearing_file.id, deposit)
+                        entries += len(chunk)
+                        chunk = []
+        if chunk:
+            total += _post(chunk, clearing_file.id, deposit)
+            entries += len(chunk)
+        if trailer is None:
+            raise ValueError('Missing trailer record')
+        line, row = trailer
+        if [value.lstrip('0') or '0' for value in row[1:]] != [str(entries), str(total)]:
+            raise ValueError('Line {}: trailer does not match the {} records ({} cents)'.format(line, entries, total))
+        clearing_file.entries, clearing_file.total = entries, total / 100
+        if dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    recent.get_cache().clear()
+    return clearing_file
+
+
+def _post(chunk, clearing_file_id, deposit):
+    # Posts one chunk of detail records in the current database transaction, returns their total in cents
+    known = set(db.session.execute(db.select(Accounts.account_num)
+                                   .where(Accounts.account_num.in_({record.account_num for record in chunk})))
+                .scalars())
+    for record in chunk:
+        if record.account_num not in known:
+            raise ValueError('Line {}: account {} does not exist'.format(record.line, record.account_num))
+    # The import holds the write lock since its first insert, ids are numbered here rather than returned one row
+    # at a time
+    first = (db.session.execute(db.select(db.func.max(Transactions.id))).scalar() or 0) + 1
+    txn_ids = range(first, first + len(chunk))
+    db.session.execute(db.insert(Transactions.__table__), [
+        {'id': txn_id, 'sender': record.account_num, 'receiver': record.account_num, 'amount': record.cents / 100,
+         'date_time': record.date_time, 'transaction_type_id': deposit} for txn_id, record in zip(txn_ids, chunk)])
+    try:
+        db.session.execute(db.insert(ClearingEntry.__table__), [
+            {'direction': 'in', 'txn_id': txn_id, 'account_num': record.account_num, 'bank_code': record.bank_code,
+             'counterparty': record.counterparty, 'amount': record.cents / 100, 'reference': record.reference,
+             'date_time': record.date_time, 'clearing_file_id': clearing_file_id}
+            for txn_id, record in zip(txn_ids, chunk)])
+    except IntegrityError:
+        raise ValueError('Lines {}-{}: a reference was already posted'.format(chunk[0].line, chunk[-1].line)) from None
+    net = defaultdict(int)
+    for record in chunk:
+        net[record.account_num] += record.cents
+    db.session.execute(ledger.APPLY_NET, [{'account': account_num, 'net': cents / 100}
+                                          for account_num, cents in net.items()])
+    return sum(net.values())
+
+
+def _record(line, row):
+    _, date, account_num, bank_code, counterparty, amount, reference = row
+    try:
+        record = Record(line, int(account_num), bank_code, counterparty, int(amount), reference, _date(date))
+    except ValueError:
+        raise ValueError('Line {}: invalid date, account number or amount'.format(line)) from None
+    if record.cents <= 0 or not BANK_CODE.match(bank_code) or not COUNTERPARTY.match(counterparty) \
+            or not reference or len(reference) > 35:
+        raise ValueError('Line {}: invalid amount, bank code, counterparty or reference'.format(line))
+    return record
+
+
+@functools.lru_cache(maxsize=1024)
+def _date(text):
+    # Files hold few distinct dates, parsing each once
+    return datetime.strptime(text, '%Y%m%d')
+
+
+def _records(file, fmt):
+    # (line number, field values) of every record, blank lines skipped
+    rows = csv.reader(file) if fmt == 'csv' else file
+    for line, row in enumerate(rows, 1):
+        if fmt != 'csv':
+            row = _split(row.rstrip('\r\n'))
+        if not any(row):
+            continue
+        if len(row) != len(LAYOUTS.get(row[0], ())):
+            raise ValueError('Line {}: malformed record'.format(line))
+        yield line, row
+
+
+def _split(line):
+    # Fixed-width line to field values. Trailing spaces may have been stripped
+    slices = _SLICES.get(line[:1])
+    if slices is None or len(line) > slices[-1][1]:
+        return [line[:1]] if line.strip() else []
+    return [line[start:end].strip() for start, end in slices]
+
+
+def _writer(file, fmt):
+    if fmt == 'csv':
+        return csv.writer(file, lineterminator='\n').writerow
+    return lambda values: file.write(_fixed(values))
+
+
+def _fixed(values):
+    fields = []
+    for (name, width), value in zip(LAYOUTS[values[0]], values):
+        value = str(value)
+        if len(value) > width:
+            raise ValueError('{} {!r} does not fit in {} characters'.format(name, value, width))
+        fields.append(value.zfill(width) if name in NUMERIC else value.ljust(width))
+    return ''.join(fields) + '\n'
+
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,43 @@
+import hashlib
+from flask import current_app, request, make_response
+from app.models import Accounts
+
+
+def ledger_etag(owner_id, scope, marks=None):
+    """Weak ETag for anything rendered from a user's accounts and transactions
+        - Built from each account's balance version and latest transaction id (Accounts.ledger_marks)
+        - scope keeps representations of the same ledger state apart (e.g. the accounts and transactions endpoints)
+
+    Args:
+        owner_id (int): ID of user
+        scope (str): name of the representation the tag is for
+        marks (list, optional): Accounts.ledger_marks(owner_id), when the caller has already read them
+
+    Returns:
+        str: ETag value (without the W/ prefix and quotes)
+    """
+    if marks is None:
+        marks = Accounts.ledger_marks(owner_id)
+    marks = ';'.join('{}:{}:{}'.format(*mark) for mark in marks)
+    return hashlib.sha1('{}|{}|{}'.format(scope, owner_id, marks).encode('utf-8')).hexdigest()
+
+
+def conditional(etag, view):
+    """Answers a GET with 304 Not Modified when the client already holds the current representation
+        - view is only called (and the body only serialised) when If-None-Match does not match
+        - Both responses carry the weak ETag and ask clients to revalidate before reuse
+
+    Args:
+        etag (str): current ETag of the resource
+        view (callable): builds the full response when needed
+
+    Returns:
+        Response: 304 without a body or the response returned by view
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(view())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,96 @@
+import base64
+import re
+import sqlalchemy as sa
+from sqlalchemy import event, DDL
+from app import db
+from app.models import User
+
+
+# External content FTS5 index over users_table. Only the index is stored, rows are read back from users_table.
+# prefix='2 3' keeps dedicated prefix indexes so short "jan*" style queries do not walk the whole term list.
+USERS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        first_name, last_name, email,
+        content='users_table', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_insert AFTER INSERT ON users_table BEGIN
+        INSERT INTO users_fts(rowid, first_name, last_name, email) VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_delete AFTER DELETE ON users_table BEGIN
+        INSERT INTO users_fts(users_fts, rowid, first_name, last_name, email) VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_update AFTER UPDATE OF first_name, last_name, email ON users_table BEGIN
+        INSERT INTO users_fts(users_fts, rowid, first_name, last_name, email) VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO users_fts(rowid, first_name, last_name, email) VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+]
+
+for statement in USERS_FTS_DDL:
+    event.listen(User.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(User.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS users_fts').execute_if(dialect='sqlite'))
+
+# Lightweight description of the virtual table for Core selects. Kept out of db.metadata so create_all() ignores it
+users_fts = sa.Table('users_fts', sa.MetaData(),
+                     sa.Column('rowid', sa.Integer),
+                     sa.Column('users_fts', sa.String),
+                     sa.Column('rank', sa.Float))
+
+
+def match_expression(q):
+    """Turns free text into an FTS5 query matching every word as a prefix
+        - Punctuation is dropped, each remaining word becomes a quoted prefix term ("jane"*), terms are ANDed
+
+    Args:
+        q (str): search text, e.g. "jane do"
+
+    Returns:
+        str: FTS5 MATCH expression, empty when q holds no words
+    """
+    return ' '.join('"{}"*'.format(word) for word in re.findall(r'\w+', q, re.UNICODE))
+
+
+def encode_cursor(rank, id):
+    return base64.urlsafe_b64encode('{!r}|{}'.format(rank, id).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        rank, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return float(rank), int(id)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def search(q, columns, limit, after=None):
+    """Ranked prefix search over the user directory
+        - Best bm25 matches first, ties broken by user id
+        - Keyset pagination on (rank, id): after is the position of the last row of the previous page
+
+    Args:
+        q (str): search text
+        columns (list): user columns to select
+        limit (int): page size
+        after (tuple, optional): (rank, id) position decoded from a cursor
+
+    Raises:
+        ValueError: when q holds no searchable words
+
+    Returns:
+        tuple: (rows, next cursor or None)
+    """
+    expression = match_expression(q)
+    if not expression:
+        raise ValueError('q must contain at least one letter or digit')
+    position = sa.tuple_(users_fts.c.rank, users_fts.c.rowid)
+    stmt = (db.select(*columns, users_fts.c.rank, users_fts.c.rowid)
+            .select_from(users_fts.join(User.__table__, User.id == users_fts.c.rowid))
+            .where(users_fts.c.users_fts.op('MATCH')(expression))
+            .order_by(users_fts.c.rank, users_fts.c.rowid)
+            .limit(limit + 1))
+    if after is not None:
+        stmt = stmt.where(position > sa.tuple_(*after))
+    rows = db.session.execute(stmt).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][-2], rows[-1][-1])
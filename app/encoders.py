@@ -0,0 +1,177 @@
+from flask import url_for
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import User, Accounts, Transactions, TransactionType
+
+
+class UrlTemplate:
+    """url_for resolved once per response for routes taking a single integer argument
+        - Builds the URL with a sentinel value and splits around it, later calls only concatenate
+
+    Args:
+        endpoint (str): Flask endpoint name
+        argument (str): name of the integer URL argument
+    """
+    SENTINEL = 4611686018427387904
+
+    def __init__(self, endpoint, argument):
+        self.head, self.tail = url_for(endpoint, **{argument: self.SENTINEL}).split(str(self.SENTINEL))
+
+    def __call__(self, value):
+        return self.head + str(value) + self.tail
+
+
+class RowEncoder:
+    """Turns column tuples into response dictionaries without hydrating ORM objects
+        - Rows may carry extra trailing columns (e.g. ownership flags), zip stops at the last key
+
+    Args:
+        keys (tuple): JSON keys, in the same order as the columns of the rows to encode
+    """
+
+    def __init__(self, keys):
+        self.keys = tuple(keys)
+
+    def encode(self, row):
+        return dict(zip(self.keys, row))
+
+    def encode_all(self, rows):
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class FieldSet:
+    """Sparse fieldset (?fields=) support for one resource
+        - Maps every JSON key to the column expression producing it and the joins that expression needs
+        - select() projects only the requested columns and adds only the joins they need
+
+    Args:
+        base (Model): model the select starts from
+        fields (list): (key, column, join names) tuples in JSON key order
+        joins (list): (name, target, onclause) tuples in the order they must be applied
+        encoder_class (type): RowEncoder subclass used to encode the selected rows
+    """
+
+    def __init__(self, base, fields, joins=(), encoder_class=RowEncoder):
+        self.base = base
+        self.encoder_class = encoder_class
+        self.columns = {key: column for key, column, _ in fields}
+        self.needs = {key: needs for key, _, needs in fields}
+        self.keys = tuple(key for key, _, _ in fields)
+        self.joins = list(joins)
+
+    def parse(self, value):
+        """Parses a comma separated fields= value
+
+        Args:
+            value (str): the fields= query parameter, None or empty for every field
+
+        Raises:
+            ValueError: when a requested field does not exist
+
+        Returns:
+            tuple: requested keys, in the resource's canonical order
+        """
+        if not value:
+            return self.keys
+        requested = set(field.strip() for field in value.split(',') if field.strip())
+        unknown = requested.difference(self.keys)
+        if unknown:
+            raise ValueError('Unknown fields: {}'.format(', '.join(sorted(unknown))))
+        return tuple(key for key in self.keys if key in requested)
+
+    def select(self, keys, *extra):
+        """Select returning one column per key followed by any extra columns
+
+        Args:
+            keys (tuple): keys returned by parse()
+            *extra: additional column expressions appended after the requested ones
+
+        Returns:
+            Select: projection over the base table with the minimal set of joins
+        """
+        needed = set(name for key in keys for name in self.needs[key])
+        stmt = db.select(*[self.columns[key] for key in keys], *extra).select_from(self.base)
+        for name, target, onclause in self.joins:
+            if name in needed:
+                stmt = stmt.outerjoin(target, onclause)
+        return stmt
+
+    def encoder(self, keys):
+        return self.encoder_class(keys)
+
+
+# Aliases used by the transaction joins, one per party
+sender_account, receiver_account = aliased(Accounts, name='sender_account'), aliased(Accounts, name='receiver_account')
+sender_owner, receiver_owner = aliased(User, name='sender_owner'), aliased(User, name='receiver_owner')
+
+TRANSACTION_FIELDS = FieldSet(Transactions, [
+    ('id', Transactions.id, ()),
+    ('from', sender_owner.first_name + ' ' + sender_owner.last_name, ('sender_account', 'sender_owner')),
+    ('from_acc', Transactions.sender, ()),
+    ('to', receiver_owner.first_name + ' ' + receiver_owner.last_name, ('receiver_account', 'receiver_owner')),
+    ('to_acc', Transactions.receiver, ()),
+    ('amount', Transactions.amount, ()),
+    ('type', TransactionType.name, ('transaction_type',)),
+], joins=[
+    ('sender_account', sender_account, Transactions.sender == sender_account.account_num),
+    ('sender_owner', sender_owner, sender_account.owner == sender_owner.id),
+    ('receiver_account', receiver_account, Transactions.receiver == receiver_account.account_num),
+    ('receiver_owner', receiver_owner, receiver_account.owner == receiver_owner.id),
+    ('transaction_type', TransactionType, Transactions.transaction_type_id == TransactionType.id),
+])
+
+ACCOUNT_FIELDS = FieldSet(Accounts, [
+    ('account_num', Accounts.account_num, ()),
+    ('owner', Accounts.owner, ()),
+    ('balance', Accounts.current_balance, ()),
+])
+
+
+class UserEncoder(RowEncoder):
+    """Encoder for rows selected through USER_FIELDS
+        - The accounts / transactions links are resolved through UrlTemplate once per encoder instance,
+        so build one encoder per response
+
+    Args:
+        keys (tuple): requested keys, as parsed by USER_FIELDS
+    """
+
+    def __init__(self, keys):
+        super().__init__(keys)
+        self.accounts_url = UrlTemplate('api.get_accounts', 'id') if 'accounts' in keys else None
+        self.transactions_url = UrlTemplate('api.get_user_transactions', 'id') if 'transactions' in keys else None
+
+    def encode(self, row):
+        data = dict(zip(self.keys, row))
+        if self.accounts_url is not None:
+            data['accounts'] = self.accounts_url(data['accounts'])
+        if self.transactions_url is not None:
+            data['transactions'] = self.transactions_url(data['transactions'])
+        return data
+
+    def encode_all(self, rows):
+        return [self.encode(row) for row in rows]
+
+
+USER_FIELDS = FieldSet(User, [
+    ('id', User.id, ()),
+    ('first_name', User.first_name, ()),
+    ('last_name', User.last_name, ()),
+    ('email', User.email, ()),
+    ('accounts', User.id, ()),
+    ('transactions', User.id, ()),
+], encoder_class=UserEncoder)
+
+account_encoder = ACCOUNT_FIELDS.encoder(ACCOUNT_FIELDS.keys)
+transaction_encoder = TRANSACTION_FIELDS.encoder(TRANSACTION_FIELDS.keys)
+
+
+def transaction_select():
+    """Select producing full transaction rows ready for transaction_encoder
+        - Party names are concatenated in SQL and the type name comes from a join, so no row triggers lazy loads
+
+    Returns:
+        Select: select over transactions_table joined to both parties and the transaction type
+    """
+    return TRANSACTION_FIELDS.select(TRANSACTION_FIELDS.keys)
@@ -0,0 +1,290 @@
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import NamedTuple
+from flask import current_app
+from app import db, ledger, recent
+from app.models import Accounts, Transactions, TransactionType, LedgerEngineState
+
+
+# Write-ahead log record: sequence number, sender, receiver, amount, epoch seconds, transaction type id and the
+# CRC32 of the preceding fields. A torn or corrupted record ends the log
+RECORD = struct.Struct('<QqqddiI')
+
+
+class EnginePosting(NamedTuple):
+    seq: int
+    sender: int
+    receiver: int
+    amount: float
+    date_time: datetime
+    transaction_type_id: int
+
+    def pack(self):
+        fields = RECORD.pack(self.seq, self.sender, self.receiver, self.amount,
+                             self.date_time.timestamp(), self.transaction_type_id, 0)[:-4]
+        return fields + struct.pack('<I', zlib.crc32(fields))
+
+    @staticmethod
+    def unpack(data):
+        seq, sender, receiver, amount, timestamp, type_id, crc = RECORD.unpack(data)
+        if zlib.crc32(data[:-4]) != crc:
+            raise ValueError('Corrupted write-ahead log record')
+        return EnginePosting(seq, sender, receiver, amount, datetime.fromtimestamp(timestamp), type_id)
+
+    def to_dict(self):
+        # Pieces posting information to a Python dictionary
+        data = {
+                "seq": self.seq,
+                "from_acc": self.sender,
+                "to_acc": self.receiver,
+                "amount": self.amount,
+                "status": "accepted"
+        }
+        return data
+
+
+class LedgerEngine:
+    """In-memory ledger for deposits and transfers, persisted through a write-ahead log (LEDGER_ENGINE_ENABLED)
+        - Balances are kept in one array of doubles, accounts are loaded from the database on first use
+        - Each account is guarded by one of stripes locks, transfers take both locks in a fixed order
+        - Every applied posting is appended to the write-ahead log before the call returns. A flusher thread
+        commits them in batches: one net balance update per account, a bulk insert of their transactions and the
+        last sequence number flushed, in a single database transaction
+        - On start, log records past the last flushed sequence number are committed first, so the database
+        is complete before any balance is loaded
+        - Balances in the database trail the engine by up to one flush interval. The engine must be the only
+        writer of balances: one process, and no settlement, folding or balance repair while it runs
+        - No shutdown hook is needed, postings still in the log are committed on the next start
+
+    Args:
+        app (Flask): application whose database the engine persists to
+        wal_path (str): write-ahead log file
+        stripes (int): number of account locks
+        flush_interval (float): seconds between flushes, 0 to only flush on flush() calls
+        batch_size (int): postings committed per database transaction
+        fsync (bool): fsync the log after each posting, not only flush it to the operating system
+    """
+
+    def __init__(self, app, wal_path, stripes=64, flush_interval=0.5, batch_size=50000, fsync=True):
+        self.app = app
+        self.wal_path = wal_path
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.flushed_seq = 0
+        self._balances = array('d')
+        self._slots = {}
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._load_lock = threading.Lock()
+        self._wal_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._seq = 0
+        self._types = {name: id for id, name in db.session.execute(db.select(TransactionType.id, TransactionType.name))}
+        self._recover()
+        self._stop = threading.Event()
+        self._flusher = None
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._run, args=(flush_interval,), name='ledger-engine-flusher',
+                                             daemon=True)
+            self._flusher.start()
+
+    def balance(self, account_num):
+        return self._balances[self._slot(account_num)]
+
+    def deposit(self, account_num, amount):
+        """Adds amount to an account's balance
+
+        Args:
+            account_num (int): receiving account
+            amount (float): positive amount
+
+        Returns:
+            EnginePosting: the logged posting
+        """
+        slot = self._slot(account_num)
+        with self._stripe(account_num):
+            self._balances[slot] += amount
+            return self._log(account_num, account_num, amount, 'Deposit')
+
+    def transfer(self, sender, recipient, amount):
+        """Moves amount from one account to another when the sender's balance covers it
+
+        Args:
+            sender (int): account funds are taken from
+            recipient (int): account funds are sent to
+            amount (float): positive amount
+
+        Returns:
+            EnginePosting: the logged posting, None when the sender cannot pay
+        """
+        sender_slot, recipient_slot = self._slot(sender), self._slot(recipient)
+        locks = sorted({sender % len(self._stripes), recipient % len(self._stripes)})
+        for index in locks:
+            self._stripes[index].acquire()
+        try:
+            if self._balances[sender_slot] < amount:
+                return None
+            self._balances[sender_slot] -= amount
+            self._balances[recipient_slot] += amount
+            return self._log(sender, recipient, amount, 'Transfer')
+        finally:
+            for index in reversed(locks):
+                self._stripes[index].release()
+
+    def account_dict(self, account):
+        # Accounts.to_dict with the engine's balance
+        return {"account_num": account.account_num, "owner": account.owner, "balance": self.balance(account.account_num)}
+
+    def flush(self):
+        """Commits the oldest logged postings to the database, up to batch_size of them
+
+        Returns:
+            int: number of postings committed
+        """
+        with self._flush_lock:
+            with self._wal_lock:
+                batch = self._pending[:self.batch_size]
+            if not batch:
+                return 0
+            self._commit(batch)
+            with self._wal_lock:
+                del self._pending[:len(batch)]
+                self.flushed_seq = batch[-1].seq
+                if not self._pending:
+                    # Everything logged is in the database, start a new log
+                    self._wal.seek(0)
+                    self._wal.truncate()
+            cache = recent.get_cache()
+            for posting in batch:
+                cache.discard(posting.sender)
+                cache.discard(posting.receiver)
+            return len(batch)
+
+    def close(self):
+        # Stops the flusher and commits every logged posting
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        while self.flush():
+            pass
+        self._wal.close()
+
+    def metrics(self):
+        return {
+            'accounts': len(self._slots),
+            'lock_stripes': len(self._stripes),
+            'logged_seq': self._seq,
+            'flushed_seq': self.flushed_seq,
+            'pending': len(self._pending),
+        }
+
+    def _slot(self, account_num):
+        slot = self._slots.get(account_num)
+        if slot is None:
+            with self._load_lock:
+                slot = self._slots.get(account_num)
+                if slot is None:
+                    balance = db.session.execute(db.select(Accounts.current_balance)
+                                                 .where(Accounts.account_num == account_num)).scalar()
+                    if balance is None:
+                        raise LookupError('Account {} does not exist'.format(account_num))
+                    self._balances.append(balance)
+                    slot = self._slots[account_num] = len(self._balances) - 1
+        return slot
+
+    def _stripe(self, account_num):
+        return self._stripes[account_num % len(self._stripes)]
+
+    def _log(self, sender, receiver, amount, type_name):
+        with self._wal_lock:
+            self._seq += 1
+            posting = EnginePosting(self._seq, sender, receiver, amount, datetime.utcnow(), self._types[type_name])
+            self._wal.write(posting.pack())
+            self._wal.flush()
+            if self.fsync:
+                os.fsync(self._wal.fileno())
+            self._pending.append(posting)
+        return posting
+
+    def _commit(self, batch):
+        net = defaultdict(float)
+        for posting in batch:
+            net[posting.receiver] += posting.amount
+            if posting.sender != posting.receiver:
+                net[posting.sender] -= posting.amount
+        db.session.execute(ledger.APPLY_NET, [{'account': account_num, 'net': amount}
+                                              for account_num, amount in net.items() if amount])
+        db.session.execute(db.insert(Transactions), [
+            {'sender': posting.sender, 'receiver': posting.receiver, 'amount': posting.amount,
+             'date_time': posting.date_time, 'transaction_type_id': posting.transaction_type_id} for posting in batch])
+        state = db.session.get(LedgerEngineState, 1) or LedgerEngineState(id=1)
+        state.flushed_seq = batch[-1].seq
+        db.session.add(state)
+        db.session.commit()
+
+    def _recover(self):
+        state = db.session.get(LedgerEngineState, 1)
+        self.flushed_seq = self._seq = state.flushed_seq if state is not None else 0
+        tail = []
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, 'rb') as wal:
+                while True:
+                    data = wal.read(RECORD.size)
+                    if len(data) < RECORD.size:
+                        break
+                    try:
+                        posting = EnginePosting.unpack(data)
+                    except ValueError:
+                        break
+                    if posting.seq > self.flushed_seq:
+                        tail.append(posting)
+        for start in range(0, len(tail), self.batch_size):
+            self._commit(tail[start:start + self.batch_size])
+        if tail:
+            self.flushed_seq = self._seq = tail[-1].seq
+        self._wal = open(self.wal_path, 'wb')
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            with self.app.app_context():
+                try:
+                    while self.flush() == self.batch_size:
+                        pass
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Ledger engine flush failed, retrying at the next interval')
+
+
+_create_lock = threading.Lock()
+
+
+def get_engine():
+    # One engine per application, created (and recovered) on first use
+    engine = current_app.extensions.get('ledger_engine')
+    if engine is None:
+        with _create_lock:
+            engine = current_app.extensions.get('ledger_engine')
+            if engine is None:
+                config = current_app.config
+                engine = current_app.extensions['ledger_engine'] = LedgerEngine(
+                    current_app._get_current_object(), config['LEDGER_ENGINE_WAL_PATH'],
+                    stripes=config['LEDGER_ENGINE_LOCK_STRIPES'], flush_interval=config['LEDGER_ENGINE_FLUSH_INTERVAL'],
+                    batch_size=config['LEDGER_ENGINE_FLUSH_BATCH_SIZE'], fsync=config['LEDGER_ENGINE_FSYNC'])
+    return engine
+
+
+def enabled():
+    return current_app.config['LEDGER_ENGINE_ENABLED']
+
+
+def init_app(app):
+    # Recovers the engine before the first request is served, so reads see every logged posting
+    @app.before_request
+    def start_engine():
+        if app.config['LEDGER_ENGINE_ENABLED']:
+            get_engine()
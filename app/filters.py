@@ -0,0 +1,159 @@
+import base64
+from datetime import datetime, timedelta
+from app import db
+from app.models import Transactions, TransactionType
+
+
+class TransactionSearch:
+    """Filters, sort order and cursor pagination for transaction collections
+        - Every filter is applied on top of the account scope (receiver / sender IN the user's accounts), so each
+        query shape is driven by the (receiver, date_time) / (sender, date_time) indexes, or the receiver / sender
+        indexes for counterparty lookups, and never scans transactions_table
+        - Pagination is keyset based on (date_time, id): the cursor is the position of the last row returned
+
+        Query parameters (all optional):
+            - from / to: ISO 8601 dates or datetimes. A date-only "to" includes that whole day
+            - type: transaction type name (e.g. Deposit, Transfer)
+            - counterparty_account: only transactions with this account on the other side
+            - min_amount / max_amount: inclusive amount bounds
+            - sort: "desc" (newest first, default) or "asc"
+            - limit: page size, up to API_TRANSACTIONS_MAX_PER_PAGE. Turns pagination on
+            - cursor: next_cursor of the previous page. Turns pagination on
+    """
+
+    def __init__(self, date_from=None, date_to=None, type_name=None, counterparty=None, min_amount=None,
+                 max_amount=None, descending=True, limit=None, after=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.type_name = type_name
+        self.counterparty = counterparty
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.descending = descending
+        self.limit = limit
+        self.after = after
+
+    @property
+    def paginated(self):
+        return self.limit is not None
+
+    @staticmethod
+    def from_args(args, default_limit, max_limit):
+        """Parses the request's query parameters
+
+        Args:
+            args (MultiDict): request.args
+            default_limit (int): page size when only a cursor is given
+            max_limit (int): largest page size accepted
+
+        Raises:
+            ValueError: when a parameter cannot be parsed
+
+        Returns:
+            TransactionSearch: the parsed search
+        """
+        sort = args.get('sort', 'desc')
+        if sort not in ('asc', 'desc'):
+            raise ValueError('sort must be asc or desc')
+        limit = None
+        if 'limit' in args or 'cursor' in args:
+            limit = parse_number(args.get('limit', default_limit), int, 'limit')
+            if not 0 < limit <= max_limit:
+                raise ValueError('limit must be between 1 and {}'.format(max_limit))
+        return TransactionSearch(
+            date_from=parse_datetime(args['from'], 'from') if args.get('from') else None,
+            date_to=parse_end(args['to'], 'to') if args.get('to') else None,
+            type_name=args.get('type') or None,
+            counterparty=parse_number(args['counterparty_account'], int, 'counterparty_account')
+                if args.get('counterparty_account') else None,
+            min_amount=parse_number(args['min_amount'], float, 'min_amount') if args.get('min_amount') else None,
+            max_amount=parse_number(args['max_amount'], float, 'max_amount') if args.get('max_amount') else None,
+            descending=sort == 'desc',
+            limit=limit,
+            after=decode_cursor(args['cursor']) if args.get('cursor') else None)
+
+    def apply(self, stmt, accounts):
+        """Adds the account scope, filters, ordering and page limit to a select over transactions_table
+
+        Args:
+            stmt (Select): select over transactions_table
+            accounts (Select): select of the account numbers the user owns
+
+        Returns:
+            Select: the filtered select
+        """
+        if self.counterparty is None:
+            stmt = stmt.where(Transactions.receiver.in_(accounts) | Transactions.sender.in_(accounts))
+        else:
+            stmt = stmt.where((Transactions.receiver.in_(accounts) & (Transactions.sender == self.counterparty)) |
+                              (Transactions.sender.in_(accounts) & (Transactions.receiver == self.counterparty)))
+        if self.date_from is not None:
+            stmt = stmt.where(Transactions.date_time >= self.date_from)
+        if self.date_to is not None:
+            stmt = stmt.where(Transactions.date_time < self.date_to)
+        if self.type_name is not None:
+            type_id = db.select(TransactionType.id).where(TransactionType.name == self.type_name).scalar_subquery()
+            stmt = stmt.where(Transactions.transaction_type_id == type_id)
+        if self.min_amount is not None:
+            stmt = stmt.where(Transactions.amount >= self.min_amount)
+        if self.max_amount is not None:
+            stmt = stmt.where(Transactions.amount <= self.max_amount)
+
+        position = db.tuple_(Transactions.date_time, Transactions.id)
+        if self.after is not None:
+            stmt = stmt.where(position < db.tuple_(*self.after) if self.descending else position > db.tuple_(*self.after))
+        if self.descending:
+            stmt = stmt.order_by(Transactions.date_time.desc(), Transactions.id.desc())
+        else:
+            stmt = stmt.order_by(Transactions.date_time.asc(), Transactions.id.asc())
+        if self.paginated:
+            # One extra row tells whether there is a next page
+            stmt = stmt.limit(self.limit + 1)
+        return stmt
+
+    def page(self, rows):
+        """Trims the extra row fetched by apply() and works out the next cursor
+
+        Args:
+            rows (list): rows selected with (date_time, id) as their last two columns
+
+        Returns:
+            tuple: (rows of this page, next cursor or None)
+        """
+        if not self.paginated or len(rows) <= self.limit:
+            return rows, None
+        rows = rows[:self.limit]
+        return rows, encode_cursor(rows[-1][-2], rows[-1][-1])
+
+
+def parse_datetime(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError('{} must be an ISO 8601 date or datetime'.format(name))
+
+
+def parse_end(value, name):
+    # Exclusive upper bound of an inclusive end date or datetime, a date-only value includes that whole day
+    end = parse_datetime(value, name)
+    return end + (timedelta(days=1) if len(value) == 10 else timedelta(microseconds=1))
+
+
+def parse_number(value, kind, name):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError('{} must be a number'.format(name))
+
+
+def encode_cursor(date_time, id):
+    # Opaque cursor for the keyset position (date_time, id)
+    return base64.urlsafe_b64encode('{}|{}'.format(date_time.isoformat(), id).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        date_time, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(date_time), int(id)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
@@ -0,0 +1,228 @@
+import dbm
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from flask import current_app
+from app import db, archive, tenancy
+from app.models import Accounts, Transactions
+from app.encoders import TRANSACTION_FIELDS, transaction_encoder
+
+# Files dbm.open may create for one name: none (gdbm), .db (ndbm) or .dir / .dat / .bak (dumb)
+SPILL_EXTENSIONS = ('', '.db', '.dir', '.dat', '.bak', '.pag')
+
+
+class FragmentCache:
+    """Size bounded LRU of serialized JSON fragments keyed by integer id
+        - Meant for immutable rows: a fragment is never invalidated, only evicted
+        - With a spill path, fragments evicted from memory are written to a dbm file and promoted back on the
+        next read, so cold history costs a disk read instead of a query and a serialisation. Files are suffixed
+        with the process id, every process keeps its own
+        - The spill is kept in two generations of files: once the current one has been written spill_capacity / 2
+        bytes, the previous one is deleted and a new one started. Files are deleted by close(), or when the cache
+        is garbage collected or the process exits
+
+    Args:
+        capacity (int): fragment bytes kept in memory
+        spill_path (str, optional): dbm file prefix for evicted fragments, no spill when None
+        spill_capacity (int, optional): fragment bytes written to the spill files before the oldest are dropped
+    """
+
+    def __init__(self, capacity, spill_path=None, spill_capacity=256 * 1024 * 1024):
+        self.capacity = capacity
+        self.spill_capacity = spill_capacity
+        self.used = 0
+        self.spilled = 0
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self._spill_path = '{}.{}'.format(spill_path, os.getpid()) if spill_path else None
+        self._generation = 0
+        # (path, dbm) pairs, oldest first
+        self._spills = []
+        if self._spill_path:
+            self._spills.append(self._open_spill())
+            weakref.finalize(self, _remove_spills, self._spills)
+
+    @property
+    def _spill(self):
+        # Spill file written to, None without spill
+        return self._spills[-1][1] if self._spills else None
+
+    def get_many(self, ids):
+        """Cached fragments of ids
+
+        Args:
+            ids (list): ids to look up
+
+        Returns:
+            dict: id -> fragment for the ids found in memory or in the spill file
+        """
+        found = {}
+        with self._lock:
+            for id in ids:
+                fragment = self._fragments.get(id)
+                if fragment is not None:
+                    self._fragments.move_to_end(id)
+                    self.hits += 1
+                else:
+                    for _, spill in reversed(self._spills):
+                        fragment = spill.get(str(id).encode('ascii'))
+                        if fragment is not None:
+                            self.spill_hits += 1
+                            self._store(id, fragment)
+                            break
+                if fragment is None:
+                    self.misses += 1
+                else:
+                    found[id] = fragment
+            self._evict()
+        return found
+
+    def put_many(self, fragments):
+        # Caches id -> fragment pairs
+        with self._lock:
+            for id, fragment in fragments.items():
+                self._store(id, fragment)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.used = 0
+
+    def close(self):
+        # Closes and deletes the spill files, the cache keeps working without spill
+        with self._lock:
+            _remove_spills(self._spills)
+
+    def _store(self, id, fragment):
+        old = self._fragments.pop(id, None)
+        self.used += len(fragment) - (len(old) if old is not None else 0)
+        self._fragments[id] = fragment
+
+    def _evict(self):
+        while self.used > self.capacity and self._fragments:
+            id, fragment = self._fragments.popitem(last=False)
+            self.used -= len(fragment)
+            if self._spill is not None:
+                if self.spilled + len(fragment) > self.spill_capacity // 2:
+                    if len(self._spills) > 1:
+                        _remove_spills(self._spills, 1)
+                    self._spills.append(self._open_spill())
+                    self.spilled = 0
+                self._spill[str(id).encode('ascii')] = fragment
+                self.spilled += len(fragment)
+
+    def _open_spill(self):
+        self._generation += 1
+        path = '{}.{}'.format(self._spill_path, self._generation)
+        return path, dbm.open(path, 'n')
+
+    def metrics(self):
+        return {
+            'fragments': len(self._fragments),
+            'bytes': self.used,
+            'capacity_bytes': self.capacity,
+            'spill': self._spill is not None,
+            'spill_files': len(self._spills),
+            'spill_bytes': self.spilled,
+            'spill_capacity_bytes': self.spill_capacity,
+            'hits': self.hits,
+            'spill_hits': self.spill_hits,
+            'misses': self.misses,
+        }
+
+
+def _remove_spills(spills, count=None):
+    # Closes and deletes the oldest count spill files (all by default), whatever extensions dbm gave them
+    for path, spill in spills[:count]:
+        spill.close()
+        for extension in SPILL_EXTENSIONS:
+            if os.path.exists(path + extension):
+                os.remove(path + extension)
+    del spills[:count]
+
+
+def get_cache():
+    # One cache per application and tenant, so each app (and each test app) sees only its own database
+    cache = tenancy.extensions().get('transaction_fragments')
+    if cache is None:
+        spill_path = current_app.config['TRANSACTION_FRAGMENT_SPILL_PATH']
+        if spill_path and tenancy.current() is not None:
+            spill_path += '.' + tenancy.current()
+        cache = tenancy.extensions().setdefault('transaction_fragments', FragmentCache(
+            current_app.config['TRANSACTION_FRAGMENT_CACHE_BYTES'], spill_path,
+            current_app.config['TRANSACTION_FRAGMENT_SPILL_BYTES']))
+    return cache
+
+
+def dumps(obj):
+    # Compact JSON bytes in the application's key order
+    return current_app.json.dumps_bytes(obj, separators=(',', ':'))
+
+
+def transaction_fragments(ids):
+    """Serialized JSON of transactions with every TRANSACTION_FIELDS key
+        - Cached fragments are reused as they are, the missing ones are read with one select and cached. Ids not
+        found in transactions_table are looked up in the archived months covering them
+
+    Args:
+        ids (list): transaction ids
+
+    Returns:
+        list: JSON fragments (bytes), in the order of ids. Ids that do not exist are skipped
+    """
+    cache = get_cache()
+    found = cache.get_many(ids)
+    missing = [id for id in ids if id not in found]
+    if missing:
+        stmt = TRANSACTION_FIELDS.select(TRANSACTION_FIELDS.keys).where(Transactions.id.in_(missing))
+        rows = db.session.execute(stmt).all()
+        if len(rows) < len(missing):
+            hot = set(row[0] for row in rows)
+            rows += archive.execute(stmt, archive.covering([id for id in missing if id not in hot]))
+        fresh = {row[0]: dumps(transaction_encoder.encode(row)) for row in rows}
+        cache.put_many(fresh)
+        found.update(fresh)
+    return [found[id] for id in ids if id in found]
+
+
+def response(body):
+    return current_app.response_class(body + b'\n', mimetype=current_app.json.mimetype)
+
+
+def transaction_response(txn_id):
+    """Response holding one transaction, built from its cached fragment
+
+    Args:
+        txn_id (int): transaction ID, which must exist
+
+    Returns:
+        Response: application/json response
+    """
+    return response(transaction_fragments([txn_id])[0])
+
+
+def transactions_response(user, search):
+    """Transaction collection response of Transactions.to_collection_dict(user, search=search), with every field
+        - Only (date_time, id) positions are selected, answered from the receiver / sender indexes alone
+        - The body is the concatenation of the cached fragments, with no per-row dictionaries built
+
+    Args:
+        user (User): user whose transactions are listed
+        search (TransactionSearch): filters, order and pagination
+
+    Returns:
+        Response: application/json response
+    """
+    accounts = db.select(Accounts.account_num).where(Accounts.owner == user.id)
+    stmt = search.apply(db.select(Transactions.date_time, Transactions.id), accounts)
+    rows, next_cursor = search.page(archive.history(stmt, search))
+    fragments = transaction_fragments([row.id for row in rows])
+    meta = {'total_transactions': len(fragments)}
+    if search.paginated:
+        meta['next_cursor'] = next_cursor
+    return response(b'{"_meta":' + dumps(meta) + b',"transactions":[' + b','.join(fragments) + b']}')
@@ -0,0 +1,68 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None  # type: ignore[assignment]
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serialises with orjson when it is installed
+        - Falls back to Flask's stdlib based DefaultJSONProvider when orjson is missing, or for keyword arguments orjson
+        does not understand (custom encoders, indent other than 2, ...)
+        - Keeps the DefaultJSONProvider output contract: keys sorted when sort_keys is set, datetimes as HTTP dates
+        through the same default hook, compact output outside debug mode
+        - response() writes orjson's bytes straight into the response instead of going through str
+    """
+
+    # dumps() keyword arguments orjson can honour, anything else goes through the stdlib path
+    _ORJSON_KWARGS = frozenset(['default', 'sort_keys', 'separators', 'indent', 'ensure_ascii'])
+
+    @property
+    def uses_orjson(self):
+        return orjson is not None
+
+    def _orjson_options(self, kwargs):
+        # Maps stdlib dumps keyword arguments onto orjson option flags, None when they cannot be mapped
+        if orjson is None or not self._ORJSON_KWARGS.issuperset(kwargs) or kwargs.get('indent') not in (None, 2):
+            return None
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent') == 2:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps_bytes(self, obj, **kwargs):
+        """Serialise obj to UTF-8 encoded JSON bytes
+
+        Args:
+            obj: data to serialise
+            **kwargs: json.dumps keyword arguments
+
+        Returns:
+            bytes: JSON document
+        """
+        option = self._orjson_options(kwargs)
+        if option is None:
+            return super().dumps(obj, **kwargs).encode('utf-8')
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option)
+
+    def dumps(self, obj, **kwargs):
+        if self._orjson_options(kwargs) is None:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        dump_args = {}
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            dump_args['indent'] = 2
+        else:
+            dump_args['separators'] = (',', ':')
+        return self._app.response_class(self.dumps_bytes(obj, **dump_args) + b'\n', mimetype=self.mimetype)
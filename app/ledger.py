@@ -0,0 +1,312 @@
+import itertools
+import os
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from app import db, aliases, recent
+from app.models import Accounts, BalanceSlot, ClearingEntry, PendingPosting, Transactions, TransactionType
+
+
+# Balance changing operations shared by the web (app.auth) and API (app.api) routes.
+# Each one commits its own database transaction and then updates the in-process caches that follow the ledger.
+# Hot accounts (Accounts.hot_slots > 0) take credits in BalanceSlot rows, picked round robin, rather than in their
+# accounts_table row. Their main balance is the headroom debits are taken from, refilled by fold().
+
+# With TRANSFER_NETTING on, transfers are recorded as PendingPosting rows reserving the amount on the sender, and
+# settle() applies them in cycles: one net balance update per account and a bulk insert of their transactions.
+
+# Round robin over slots, offset by process so concurrent workers start on different slots
+_next_slot = itertools.count(os.getpid())
+
+# Records a pending posting only when the sender's balance, less the amounts already reserved, covers it.
+# Check and insert are one statement, so concurrent transfers cannot both pass the check
+_reserved = (db.select(db.func.coalesce(db.func.sum(PendingPosting.amount), 0))
+             .where(PendingPosting.sender == db.bindparam('sender', type_=db.Integer)).scalar_subquery())
+_settled = db.select(Accounts.balance).where(Accounts.account_num == db.bindparam('sender')).scalar_subquery()
+RESERVE_TRANSFER = (db.insert(PendingPosting.__table__)
+                    .from_select(['sender', 'receiver', 'amount', 'date_time'],
+                                 db.select(db.bindparam('sender'), db.bindparam('receiver', type_=db.Integer),
+                                           db.bindparam('amount', type_=db.Float),
+                                           db.bindparam('date_time', type_=db.DateTime))
+                                 .where(_settled - _reserved >= db.bindparam('amount')))
+                    .returning(PendingPosting.id))
+# Debits the sender only when its balance, less the amounts reserved by its pending postings, covers amount.
+# Check and debit are one statement, so concurrent debits cannot both pass the check
+DEBIT = (db.update(Accounts.__table__)
+         .where(Accounts.__table__.c.account_num == db.bindparam('sender'),
+                Accounts.__table__.c.balance - _reserved >= db.bindparam('amount', type_=db.Float))
+         .values(balance=Accounts.__table__.c.balance - db.bindparam('amount'),
+                 version=Accounts.__table__.c.version + 1))
+APPLY_NET = (db.update(Accounts.__table__)
+             .where(Accounts.__table__.c.account_num == db.bindparam('account'))
+             .values(balance=Accounts.__table__.c.balance + db.bindparam('net', type_=db.Float),
+                     version=Accounts.__table__.c.version + 1))
+# Adds the credits held in an account's slots to its main balance, when there are any. SQLite takes the write lock
+# with it, so the slots cannot change before they are emptied in the same transaction
+_slots = (db.select(db.func.coalesce(db.func.sum(BalanceSlot.balance), 0))
+          .where(BalanceSlot.account_num == db.bindparam('account', type_=db.Integer)).scalar_subquery())
+FOLD = (db.update(Accounts.__table__)
+        .where(Accounts.__table__.c.account_num == db.bindparam('account'), _slots != 0)
+        .values(balance=Accounts.__table__.c.balance + _slots, version=Accounts.__table__.c.version + 1))
+
+
+def open_account(user):
+    """Opens the first account of a newly registered user
+        - Creates the account, its "New Account" transaction and the email payment alias
+
+    Args:
+        user (User): saved user
+
+    Returns:
+        Accounts: new account
+    """
+    account = Accounts(account_owner=user)
+    db.session.add(account)
+    db.session.commit()
+    aliases.add_email_alias(account)
+    
+    txn_type = TransactionType.query.filter_by(name="New Account").first()
+    txn = Transactions(receiver_account=account, sender_account=account, amount=0, date_time=datetime.utcnow(),
+                       transaction_type=txn_type)
+    db.session.add(txn)
+    db.session.commit()
+    recent.record(txn.id, [account.account_num])
+    return account
+
+
+def deposit(account, amount):
+    """Adds amount to an account's balance and records a "Deposit" transaction
+
+    Args:
+        account (Accounts): receiving account
+        amount (float): positive amount
+
+    Returns:
+        Transactions: deposit transaction
+    """
+    account_nums = [account.account_num]
+    credit(account, amount)
+    txn_type = TransactionType.query.filter_by(name="Deposit").first()
+    txn = Transactions(receiver_account=account, sender_account=account, amount=amount, date_time=datetime.utcnow(),
+                       transaction_type=txn_type)
+    db.session.add_all([account, txn])
+    db.session.commit()
+    recent.record(txn.id, account_nums)
+    return txn
+
+
+def transfer(sender, recipient, amount):
+    """Moves amount from one account to another and records a "Transfer" transaction
+        - Rejected when the sender's balance less its pending postings (TRANSFER_NETTING) does not cover amount.
+        The check is part of the debit statement, a hot sender gets its slots folded in and is checked again
+
+    Args:
+        sender (Accounts): account funds are taken from
+        recipient (Accounts): account funds are sent to
+        amount (float): positive amount
+
+    Returns:
+        Transactions: transfer transaction, None when the sender cannot pay
+    """
+    account_nums = [sender.account_num, recipient.account_num]
+    if not debit(sender, amount):
+        return None
+    credit(recipient, amount)
+    txn_type = TransactionType.query.filter_by(name="Transfer").first()
+    txn = Transactions(sender=account_nums[0], receiver=account_nums[1], amount=amount, date_time=datetime.utcnow(),
+                       transaction_type=txn_type)
+    db.session.add(txn)
+    db.session.commit()
+    recent.record(txn.id, account_nums)
+    return txn
+
+
+def interbank_transfer(sender, bank_code, counterparty, amount):
+    """Sends amount to an account at another bank: debits the sender with a "Withdrawal" transaction and records the
+    outbound clearing entry, paid to the other bank through the next clearing file (flask clearing export)
+        - Rejected when the sender's balance less its pending postings (TRANSFER_NETTING) does not cover amount.
+        The check is part of the debit statement, a hot sender gets its slots folded in and is checked again
+        - Debit, transaction and clearing entry are committed together
+        - Callers check the other bank's side with app.clearing.check_counterparty first
+
+    Args:
+        sender (Accounts): account funds are taken from
+        bank_code (str): code of the other bank
+        counterparty (str): account at the other bank
+        amount (float): positive amount
+
+    Returns:
+        tuple: the Transactions and its ClearingEntry, None when the sender cannot pay
+    """
+    if not debit(sender, amount):
+        return None
+    txn_type = TransactionType.query.filter_by(name="Withdrawal").first()
+    txn = Transactions(sender=sender.account_num, receiver=sender.account_num, amount=amount,
+                       date_time=datetime.utcnow(), transaction_type=txn_type)
+    db.session.add(txn)
+    db.session.flush()
+    entry = ClearingEntry(direction='out', txn_id=txn.id, account_num=sender.account_num, bank_code=bank_code,
+                          counterparty=counterparty, amount=amount, reference=str(txn.id), date_time=txn.date_time)
+    db.session.add(entry)
+    db.session.commit()
+    recent.record(txn.id, [sender.account_num])
+    return txn, entry
+
+
+def reserve_transfer(sender, recipient, amount):
+    """Records a transfer for the next settlement cycle, reserving amount on the sender (TRANSFER_NETTING)
+        - Rejected when the sender's balance less its pending postings does not cover amount. A hot sender gets
+        its slots folded in and is checked again
+
+    Args:
+        sender (Accounts): account funds are taken from
+        recipient (Accounts): account funds are sent to
+        amount (float): positive amount
+
+    Returns:
+        PendingPosting: the posting, None when the sender cannot pay
+    """
+    params = {'sender': sender.account_num, 'receiver': recipient.account_num, 'amount': amount,
+              'date_time': datetime.utcnow()}
+    posting_id = db.session.execute(RESERVE_TRANSFER, params).scalar()
+    if posting_id is None and sender.hot_slots:
+        db.session.rollback()
+        if fold(sender):
+            posting_id = db.session.execute(RESERVE_TRANSFER, params).scalar()
+    db.session.commit()
+    return db.session.get(PendingPosting, posting_id) if posting_id is not None else None
+
+
+def settle(batch_size=None):
+    """Settles the oldest pending postings in one database transaction
+        - Postings are netted per account, each account with a non zero net gets a single balance update
+        - Their "Transfer" transactions are bulk inserted with the time each transfer was made
+
+    Args:
+        batch_size (int, optional): maximum postings settled, SETTLEMENT_BATCH_SIZE by default
+
+    Returns:
+        int: number of postings settled
+    """
+    batch_size = batch_size or current_app.config['SETTLEMENT_BATCH_SIZE']
+    postings = db.session.execute(db.select(PendingPosting.id, PendingPosting.sender, PendingPosting.receiver,
+                                            PendingPosting.amount, PendingPosting.date_time)
+                                  .order_by(PendingPosting.id).limit(batch_size)).all()
+    if not postings:
+        return 0
+    net = defaultdict(float)
+    for _, sender, receiver, amount, _ in postings:
+        net[sender] -= amount
+        net[receiver] += amount
+    txn_type = TransactionType.query.filter_by(name="Transfer").first()
+    updates = [{'account': account_num, 'net': amount} for account_num, amount in net.items() if amount]
+    if updates:
+        db.session.execute(APPLY_NET, updates)
+    db.session.execute(db.insert(Transactions), [
+        {'sender': sender, 'receiver': receiver, 'amount': amount, 'date_time': date_time,
+         'transaction_type_id': txn_type.id} for _, sender, receiver, amount, date_time in postings])
+    db.session.execute(db.delete(PendingPosting).where(PendingPosting.id.in_([row.id for row in postings])))
+    db.session.commit()
+    cache = recent.get_cache()
+    for account_num in net:
+        cache.discard(account_num)
+    return len(postings)
+
+
+def credit(account, amount):
+    """Adds amount to an account within the current database transaction, without committing
+        - Hot accounts get the amount in one of their slots, their accounts_table row is left untouched
+
+    Args:
+        account (Accounts): receiving account
+        amount (float): positive amount
+    """
+    if account.hot_slots:
+        slot = next(_next_slot) % account.hot_slots
+        result = db.session.execute(db.update(BalanceSlot)
+                                    .where(BalanceSlot.account_num == account.account_num, BalanceSlot.slot == slot)
+                                    .values(balance=BalanceSlot.balance + amount))
+        if result.rowcount:
+            return
+    db.session.execute(APPLY_NET, {'account': account.account_num, 'net': amount})
+
+
+def debit(account, amount):
+    """Takes amount from an account's main balance within the current database transaction, without committing
+        - Only when the balance less the account's pending postings covers amount, checked by the DEBIT statement
+        itself. When a hot account falls short, the transaction is rolled back, its slots are folded in and the
+        debit is tried again
+        - The transaction is rolled back when the debit is rejected
+
+    Args:
+        account (Accounts): paying account
+        amount (float): positive amount
+
+    Returns:
+        bool: True when the account was debited
+    """
+    params = {'sender': account.account_num, 'amount': amount}
+    debited = db.session.execute(DEBIT, params).rowcount
+    if not debited and account.hot_slots:
+        db.session.rollback()
+        if fold(account):
+            debited = db.session.execute(DEBIT, params).rowcount
+    if not debited:
+        db.session.rollback()
+    return bool(debited)
+
+
+def fold(account):
+    """Moves the credits held in a hot account's slots into its main balance and commits
+        - One UPDATE adds the slots to the main balance in the database, the slots are emptied in the same
+        transaction. Nothing is computed from the account row loaded by the caller
+
+    Args:
+        account (Accounts): account to fold
+
+    Returns:
+        float: amount moved into the main balance
+    """
+    params = {'account': account.account_num}
+    pending = 0
+    if db.session.execute(FOLD, params).rowcount:
+        pending = db.session.execute(db.select(_slots), params).scalar()
+        db.session.execute(db.update(BalanceSlot)
+                           .where(BalanceSlot.account_num == account.account_num, BalanceSlot.balance != 0)
+                           .values(balance=0))
+    db.session.commit()
+    return pending
+
+
+def fold_all():
+    """Folds every hot account, for periodic runs (flask fold-balances)
+
+    Returns:
+        int: number of accounts that had credits to fold
+    """
+    folded = 0
+    for account in db.session.execute(db.select(Accounts).where(Accounts.hot_slots > 0)).scalars().all():
+        if fold(account):
+            folded += 1
+    return folded
+
+
+def set_hot(account, slots):
+    """Flags an account as hot with a number of credit slots, or back to regular with 0 slots
+        - Dropped slots are folded into the main balance before they are deleted
+
+    Args:
+        account (Accounts): account to flag
+        slots (int): number of slots, 0 to unflag
+    """
+    existing = set(db.session.execute(db.select(BalanceSlot.slot)
+                                      .where(BalanceSlot.account_num == account.account_num)).scalars())
+    db.session.add_all([BalanceSlot(account_num=account.account_num, slot=slot)
+                        for slot in range(slots) if slot not in existing])
+    account.hot_slots = slots
+    db.session.add(account)
+    db.session.commit()
+    fold(account)
+    db.session.execute(db.delete(BalanceSlot).where(BalanceSlot.account_num == account.account_num,
+                                                    BalanceSlot.slot >= slots, BalanceSlot.balance == 0))
+    db.session.commit()
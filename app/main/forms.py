@@ -1,8 +1,9 @@
 from typing import Optional
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, PasswordField, BooleanField, EmailField, DecimalField, IntegerField, FloatField
-from wtforms.validators import DataRequired, ValidationError, Email, EqualTo, NumberRange
+from wtforms import Field, StringField, SubmitField, PasswordField, BooleanField, EmailField, DecimalField, IntegerField, FloatField
+from wtforms.validators import DataRequired, ValidationError, Email, EqualTo, NumberRange, optional
 from app.models import User
+from app.bloom import email_may_exist
 
 class RegistrationForm(FlaskForm):
     """User registration form 
@@ -27,7 +28,9 @@ class RegistrationForm(FlaskForm):
         'Repeat Password', validators=[DataRequired(), EqualTo('password')])
     submit = SubmitField('Submit')
     
-    def validate_email(self, email: str) -> None:
+    def validate_email(self, email: Field) -> None:
+        if not email_may_exist(email.data):
+            return
         user: Optional[str] = User.query.filter_by(email=email.data).first()
         if user is not None:
             raise ValidationError('Please use a different email address.')
@@ -53,13 +56,20 @@ class LoginForm(FlaskForm):
 class TransferForm(FlaskForm):
     """Transfer funds form
         - User fund transfer. Login is required to access the form
-        - User inputs recipient account number and desired transfer amount
+        - User inputs recipient account number, or the recipient's email / phone alias, and desired transfer amount
     
+    Raises:
+        ValidationError: when neither an account number nor an alias is given
     """
-    recipient_acc_num = IntegerField('To Account', validators=[DataRequired()])
+    recipient_acc_num = IntegerField('To Account', validators=[optional()])
+    recipient_alias = StringField('Or To Email / Phone')
     amount = FloatField('Amount', validators=[DataRequired(), NumberRange(min=0.01)])
     submit = SubmitField('Send')
     
+    def validate_recipient_alias(self, recipient_alias: Field) -> None:
+        if self.recipient_acc_num.data is None and not recipient_alias.data:
+            raise ValidationError('Please enter an account number or an email / phone.')
+    
 
 class DepositForm(FlaskForm):
     """User Deposit funds form
@@ -1,7 +1,9 @@
-from flask import render_template, session, Response 
+from flask import render_template, session, make_response, Response 
 from flask_login import current_user
-from app.models import Accounts, User, Transactions
-from app import db
+from app.models import Accounts
+from app.conditional import ledger_etag, conditional
+from app.recent import recent_transactions
+from app import queries
 from . import main
 
 @main.route('/')
@@ -12,19 +14,36 @@ def index() -> Response:
         - queries for
             -user's first name
             -user's account
-            -user's transaction
+            -user's latest transactions, from the recent transactions ring buffer (app.recent)
+        - answers 304 when the browser's ETag still matches the user's ledger high-water marks and profile
+        - always renders, without an ETag, when flashed messages are waiting, a 304 would consume them without
+        showing them
     
     Returns:
         Response: index.html
     """
+    if current_user.is_authenticated:
+        marks = Accounts.ledger_marks(current_user.id)
+        if '_flashes' in session:
+            response = make_response(render_index(marks))
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        profile = '|'.join([current_user.email, current_user.first_name, current_user.last_name,
+                            session.get('first_name') or ''])
+        return conditional(ledger_etag(current_user.id, 'index:' + profile, marks), lambda: render_index(marks))
+    return render_index()
+
+
+def render_index(marks=()) -> str:
+    # Renders index.html for the current user. marks are the user's Accounts.ledger_marks
     balance = None
     first_name = session.get('first_name')
     transactions = []
     account = None
     if current_user.is_authenticated:
-        user = User.query.filter_by(email=current_user.email).first()
-        account = Accounts.query.filter_by(owner=user.id).first()
+        account = queries.first_account(current_user.id)
+    if account is not None:
         balance = account.balance
-        transactions = Transactions.query.filter((Transactions.receiver_account == account) | 
-                                                 (Transactions.sender_account == account)).order_by(Transactions.date_time.desc()).all()
+        latest_ids = {account_num: latest_id for account_num, _, latest_id in marks}
+        transactions = recent_transactions(account.account_num, latest_ids.get(account.account_num))
     return render_template('index.html', first_name=first_name, balance=balance, account=account, transactions=transactions)
\ No newline at end of file
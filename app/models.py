@@ -2,8 +2,10 @@ from app import db, login
 from flask import url_for
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import event
 from . import login
 import base64
+import re
 from datetime import datetime, timedelta
 import os
 
@@ -108,6 +110,11 @@ class User(UserMixin, db.Model):
         return check_password_hash(self.password_hash, password)
     
     
+    def is_administrator(self) -> bool:
+        # True for users holding the Administrator role
+        return self.role is not None and self.role.name == 'Administrator'
+    
+    
     def get_token(self, expires_in=3600):
         # Retrieves token from user role in database if it hasn't expires else create a new one
         now = datetime.utcnow()
@@ -127,7 +134,8 @@ class User(UserMixin, db.Model):
     @staticmethod
     def check_token(token):
         # Function to check if token has expired
-        user = User.query.filter_by(token=token).first()
+        from app.queries import load_user_by_token
+        user = load_user_by_token(token)
         if user is None or user.token_expiration < datetime.utcnow():
             return None
         return user
@@ -196,6 +204,8 @@ class TransactionType(db.Model):
 
 class Transactions(db.Model):
     """Transactions SQlite ORM model
+        The ledger's journal and system of record: rows are only ever appended. Account balances are projections
+        of it, rebuilt by app.projections.replay. Old months are moved unchanged to archive files (app.archive)
 
     Columns:
         - id (SQLite int): primary key
@@ -208,10 +218,15 @@ class Transactions(db.Model):
     """
     
     __tablename__ = "transactions_table"
+    __table_args__ = (
+        # Account scoped history reads: date ranges, ordering and keyset pagination, see app.filters
+        db.Index('ix_transactions_table_receiver_date_time', 'receiver', 'date_time'),
+        db.Index('ix_transactions_table_sender_date_time', 'sender', 'date_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    receiver = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False)
-    sender = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False)
+    receiver = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False, index=True)
+    sender = db.Column(db.Integer, db.ForeignKey("accounts_table.account_num"), nullable=False, index=True)
     amount = db.Column(db.Integer)
     date_time = db.Column(db.DateTime, index=True)
     transaction_type_id = db.Column(db.Integer, db.ForeignKey('transaction_type_table.id'))
@@ -230,16 +245,23 @@ class Transactions(db.Model):
         return data
     
     @staticmethod
-    def to_collection_dict(user):
+    def to_collection_dict(user, fields=None, search=None):
         # Pieces all transactions involving user into a Python dictionary
+        # user only needs an id, a User or an app.queries.UserRow
         # Added the possibility to query for multiple accounts
-        account = Accounts.query.filter_by(account_owner=user).all()
-        txns = []
-        for acc in account:
-            transactions = Transactions.query.filter((Transactions.receiver_account == acc) | 
-                                                 (Transactions.sender_account == acc)).order_by(Transactions.date_time.desc()).all()
-            for txn in transactions:
-                txns.append(txn.to_dict())
+        # Rows come straight from one select over column tuples, see app.encoders
+        # fields limits the keys (and the columns / joins selected), every key by default
+        # search (app.filters.TransactionSearch) adds filters, sort order and cursor pagination
+        # Archived months inside the search's date range are read too, see app.archive
+        from app.encoders import TRANSACTION_FIELDS
+        from app.filters import TransactionSearch
+        from app import archive
+        fields = fields or TRANSACTION_FIELDS.keys
+        search = search or TransactionSearch()
+        accounts = db.select(Accounts.account_num).where(Accounts.owner == user.id)
+        stmt = search.apply(TRANSACTION_FIELDS.select(fields, Transactions.date_time, Transactions.id), accounts)
+        rows, next_cursor = search.page(archive.history(stmt, search))
+        txns = TRANSACTION_FIELDS.encoder(fields).encode_all(rows)
         
         data = {
             "transactions": txns,
@@ -247,6 +269,8 @@ class Transactions(db.Model):
                 'total_transactions':len(txns)
             }
         }
+        if search.paginated:
+            data['_meta']['next_cursor'] = next_cursor
         return data
     
     
@@ -255,6 +279,39 @@ class Transactions(db.Model):
         return '< {} Txn {}: {} - {}, amount {}, type: {}>'.format(self.date_time, self.id, self.sender, self.receiver, self.amount, self.transaction_type_id)
 
 
+@event.listens_for(Transactions, 'before_update')
+@event.listens_for(Transactions, 'before_delete')
+def journal_is_append_only(mapper, connection, target):
+    # Corrections are new transactions, never edits of recorded ones
+    raise RuntimeError('Transaction {} is recorded in the journal and cannot be changed'.format(target.id))
+
+
+class Posting(db.Model):
+    """Ledger posting SQlite ORM model
+        One signed row per account leg of a transaction, so statements, balances as of a date and rollups of an
+        account read one (account_num, date_time, txn_id) index range. Rows are written by a trigger on
+        transactions_table (see app.postings), every insert path is covered, bulk inserts included
+
+    Columns:
+        id (SQLite int): primary key
+        txn_id (SQLite int): transaction, mapped to transactions_table id
+        account_num (SQLite int): account of this leg, mapped to accounts_table account_num
+        amount (SQLite float): signed amount, negative when funds leave the account
+        date_time (SQLite DateTime): date time of the transaction
+        transaction_type_id (SQLite int): type of the transaction, mapped to transaction_type_table id
+    """
+    
+    __tablename__ = "postings_table"
+    __table_args__ = (db.Index('ix_postings_table_account_num_date_time_txn_id', 'account_num', 'date_time', 'txn_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    txn_id = db.Column(db.Integer, db.ForeignKey('transactions_table.id'), nullable=False, index=True)
+    account_num = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    date_time = db.Column(db.DateTime)
+    transaction_type_id = db.Column(db.Integer, db.ForeignKey('transaction_type_table.id'))
+
+
 class Accounts(db.Model):
     """Bank account SQlite ORM model
 
@@ -262,13 +319,21 @@ class Accounts(db.Model):
         account_num (SQLite int): bank account number
         owner (SQLite int): bank account owner, mapped to users_table id
         balance (SQLite int): account balance, default 0 during account creation
+        version (SQLite int): balance version, incremented on every balance update. Used for ETags
+        hot_slots (SQLite int): number of BalanceSlot rows taking this account's credits, 0 for regular accounts
+        archived_txn_id (SQLite int): highest transaction ID of this account moved to an archive file, 0 when none
     """
     
     __tablename__ = "accounts_table"
+    # Covers owner -> (account_num, version, archived_txn_id) lookups so ETag checks never touch the table itself
+    __table_args__ = (db.Index('ix_accounts_table_owner_marks', 'owner', 'version', 'archived_txn_id'),)
     
     account_num = db.Column(db.Integer, primary_key=True, autoincrement=True)
     owner = db.Column(db.Integer, db.ForeignKey('users_table.id'))
     balance = db.Column(db.Float, default=0.00)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    hot_slots = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    archived_txn_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     receiver_acc = db.relationship("Transactions", foreign_keys="Transactions.receiver", backref="receiver_account", lazy="dynamic")
     sender_acc = db.relationship("Transactions", foreign_keys="Transactions.sender", backref="sender_account", lazy="dynamic")
     
@@ -286,6 +351,7 @@ class Accounts(db.Model):
             amount (int): update amount. Negative for fund removal.
         """
         self.balance += amount
+        self.version = (self.version or 0) + 1
     
     
     def to_dict(self):
@@ -293,19 +359,24 @@ class Accounts(db.Model):
         data = {
                 "account_num": self.account_num,
                 "owner": self.owner,
-                "balance": self.balance
+                "balance": self.current_balance
         }
         return data
     
     @staticmethod
-    def to_collection_dict(user):
+    def to_collection_dict(user, fields=None):
         # Pieces all accounts belonging to user into a Python dictionary
+        # user only needs an id, a User or an app.queries.UserRow
+        # fields limits the keys selected, every key by default. The balance is always selected for the total
+        from app.encoders import ACCOUNT_FIELDS
+        fields = fields or ACCOUNT_FIELDS.keys
         total = 0
-        accounts = Accounts.query.filter_by(account_owner=user).all()
+        accounts = db.session.execute(ACCOUNT_FIELDS.select(fields, Accounts.current_balance).where(Accounts.owner == user.id)
+                                      .order_by(Accounts.account_num)).all()
         for item in accounts:
-            total += item.balance
+            total += item[-1]
         data = {
-            "accounts": [item.to_dict() for item in accounts],
+            "accounts": ACCOUNT_FIELDS.encoder(fields).encode_all(accounts),
             "_meta": {
                 'num_accounts':len(accounts),
                 'total_balance': total
@@ -314,5 +385,392 @@ class Accounts(db.Model):
         return data
     
     
+    @staticmethod
+    def ledger_marks(owner_id):
+        """High-water marks of every account belonging to a user
+            - One query answered from indexes only: ix_accounts_table_owner_marks for the accounts and
+            the receiver / sender indexes on transactions_table for the latest transaction ids
+            - Accounts whose latest transactions were archived get them from archived_txn_id, so the mark never
+            goes back when months leave transactions_table
+
+        Args:
+            owner_id (int): ID of user
+
+        Returns:
+            list: (account_num, version, latest transaction id) tuples ordered by account number
+        """
+        received = db.select(db.func.max(Transactions.id)).where(Transactions.receiver == Accounts.account_num).scalar_subquery()
+        sent = db.select(db.func.max(Transactions.id)).where(Transactions.sender == Accounts.account_num).scalar_subquery()
+        rows = db.session.execute(db.select(Accounts.account_num, Accounts.version, received, sent, Accounts.archived_txn_id)
+                                  .where(Accounts.owner == owner_id).order_by(Accounts.account_num))
+        return [(account_num, version, max(received or 0, sent or 0, archived or 0))
+                for account_num, version, received, sent, archived in rows]
+    
+    
+    def __repr__(self):
+        return '<Account no. {}, owner {}: {}>'.format(self.owner, self.account_num, self.balance)
+
+
+class BalanceSlot(db.Model):
+    """Sub-balance of a hot account SQlite ORM model
+        Credits to a hot account are added to one of its slots instead of its accounts_table row, so concurrent
+        credits update different rows. app.ledger.fold moves the slots back into the main balance.
+
+    Columns:
+        account_num (SQLite int): hot account, mapped to accounts_table account_num
+        slot (SQLite int): slot number, 0 to hot_slots - 1
+        balance (SQLite float): credits not folded into the main balance yet
+    """
+    
+    __tablename__ = "balance_slots_table"
+    
+    account_num = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    balance = db.Column(db.Float, nullable=False, default=0, server_default='0')
+
+
+class PendingPosting(db.Model):
+    """Transfer awaiting settlement SQlite ORM model
+        Used when TRANSFER_NETTING is on: the transfer amount is reserved on the sender until app.ledger.settle
+        applies it, together with every other pending posting, as one net balance update per account.
+
+    Columns:
+        id (SQLite int): primary key, settlement order
+        sender (SQLite int): paying account, mapped to accounts_table account_num
+        receiver (SQLite int): receiving account, mapped to accounts_table account_num
+        amount (SQLite float): amount reserved on the sender
+        date_time (SQLite DateTime): time of the transfer, kept by its transaction once settled
+    """
+    
+    __tablename__ = "pending_postings_table"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), nullable=False, index=True)
+    receiver = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    date_time = db.Column(db.DateTime, nullable=False)
+    
+    def to_dict(self):
+        # Pieces pending posting information to a Python dictionary
+        data = {
+                "id": self.id,
+                "from_acc": self.sender,
+                "to_acc": self.receiver,
+                "amount": self.amount,
+                "status": "pending"
+        }
+        return data
+
+
+# Balance including credits still held in slots. The slots are only summed for hot accounts
+Accounts.current_balance = db.column_property(db.case(
+    (Accounts.hot_slots > 0, Accounts.balance + db.func.coalesce(
+        db.select(db.func.sum(BalanceSlot.balance)).where(BalanceSlot.account_num == Accounts.account_num)
+        .scalar_subquery(), 0)),
+    else_=Accounts.balance))
+
+
+class IdempotencyKey(db.Model):
+    """Idempotency key SQlite ORM model
+        Stores the outcome of a write request so retries carrying the same Idempotency-Key header are replayed
+        instead of being executed again.
+
+    Columns:
+        id (SQLite int): primary key
+        user_id (SQLite int): user that issued the request, mapped to users_table id
+        key (SQLite str255): client supplied Idempotency-Key header value, unique per user
+        fingerprint (SQLite str64): sha256 of the request method, path and body
+        status_code (SQLite int): stored response status code, NULL while the first request is still in flight
+        body (SQLite bytes): stored response body
+        created_at (SQLite DateTime): time the key was first seen
+        committed_at (SQLite DateTime): time the request first committed its changes, NULL until then
+    """
+    
+    __tablename__ = "idempotency_keys_table"
+    __table_args__ = (db.UniqueConstraint('user_id', 'key'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users_table.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    committed_at = db.Column(db.DateTime)
+    
+    @staticmethod
+    def purge_expired(ttl, lease):
+        """Deletes keys older than ttl seconds and in-flight keys older than lease seconds
+            In-flight keys whose request already committed its changes are kept until the ttl so it is not run again
+
+        Args:
+            ttl (int): lifetime of an idempotency key in seconds
+            lease (int): lifetime of an in-flight key in seconds
+
+        Returns:
+            int: number of keys deleted
+        """
+        now = datetime.utcnow()
+        return IdempotencyKey.query.filter(db.or_(
+            IdempotencyKey.created_at < now - timedelta(seconds=ttl),
+            db.and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.committed_at.is_(None),
+                    IdempotencyKey.created_at < now - timedelta(seconds=lease))
+        )).delete()
+    
+    
     def __repr__(self):
-        return '<Account no. {}, owner {}: {}>'.format(self.owner, self.account_num, self.balance)
\ No newline at end of file
+        return '<Idempotency key {} user {}: {}>'.format(self.key, self.user_id, self.status_code)
+
+
+class PaymentAlias(db.Model):
+    """Payment alias SQlite ORM model
+        Maps a normalized email address or phone number to the account that receives transfers sent to it.
+
+    Columns:
+        id (SQLite int): primary key
+        alias (SQLite str255): normalized alias, see normalize()
+        kind (SQLite str8): "email" or "phone"
+        user_id (SQLite int): alias owner, mapped to users_table id
+        account_num (SQLite int): receiving account, mapped to accounts_table account_num
+    """
+    
+    __tablename__ = "payment_aliases_table"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    alias = db.Column(db.String(255), unique=True, index=True, nullable=False)
+    kind = db.Column(db.String(8), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users_table.id'), index=True, nullable=False)
+    account_num = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), nullable=False)
+    
+    @staticmethod
+    def normalize(value):
+        """Canonical form of an email address or phone number
+            - Emails are trimmed and lower cased
+            - Phone numbers keep their digits and a leading +, separators ( ) - . and spaces are dropped
+
+        Args:
+            value (str): alias as typed by a user, e.g. " Jane.Doe@Email.com" or "+65 9123-4567"
+
+        Raises:
+            ValueError: when value is neither an email address nor a 7 to 15 digit phone number
+
+        Returns:
+            tuple: (kind, normalized alias)
+        """
+        value = str(value).strip()
+        if '@' in value:
+            if not re.fullmatch(r'[^@\s]+@[^@\s]+\.[^@\s]+', value):
+                raise ValueError('Invalid email address')
+            return 'email', value.lower()
+        phone = re.sub(r'[\s().-]', '', value)
+        if not re.fullmatch(r'\+?\d{7,15}', phone):
+            raise ValueError('Invalid phone number')
+        return 'phone', phone
+    
+    @staticmethod
+    def for_account(value, account):
+        """Alias pointing at account, owned by the account owner
+
+        Args:
+            value (str): email address or phone number
+            account (Accounts): receiving account
+
+        Raises:
+            ValueError: when value is not a valid alias
+
+        Returns:
+            PaymentAlias: new, unsaved alias
+        """
+        kind, alias = PaymentAlias.normalize(value)
+        return PaymentAlias(alias=alias, kind=kind, account_num=account.account_num, user_id=account.owner)
+    
+    def to_dict(self):
+        # Pieces alias information to a Python dictionary
+        data = {
+                "alias": self.alias,
+                "kind": self.kind,
+                "account_num": self.account_num
+        }
+        return data
+    
+    
+    def __repr__(self):
+        return '<Payment alias {} -> account {}>'.format(self.alias, self.account_num)
+
+
+class LedgerCheckpoint(db.Model):
+    """Ledger checkpoint SQlite ORM model
+        Balances of every account replayed from the journal up to a transaction, so later replays start from
+        there instead of from the first transaction (see app.projections)
+
+    Columns:
+        id (SQLite int): primary key
+        txn_id (SQLite int): ID of the last transaction included, 0 for an empty journal
+        created_at (SQLite DateTime): time the checkpoint was taken
+    """
+    
+    __tablename__ = "ledger_checkpoints_table"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    txn_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    balances = db.relationship('CheckpointBalance', backref='checkpoint', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return '<Ledger checkpoint {} at transaction {}>'.format(self.id, self.txn_id)
+
+
+class CheckpointBalance(db.Model):
+    """Balance of one account in a ledger checkpoint SQlite ORM model, accounts at 0 are left out
+
+    Columns:
+        checkpoint_id (SQLite int): checkpoint, mapped to ledger_checkpoints_table id
+        account_num (SQLite int): account number
+        balance (SQLite float): balance replayed up to the checkpoint's transaction
+    """
+    
+    __tablename__ = "checkpoint_balances_table"
+    
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('ledger_checkpoints_table.id'), primary_key=True)
+    account_num = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    balance = db.Column(db.Float, nullable=False)
+
+
+class LedgerEngineState(db.Model):
+    """In-memory ledger engine state SQlite ORM model, a single row (see app.engine)
+
+    Columns:
+        id (SQLite int): primary key, always 1
+        flushed_seq (SQLite int): sequence number of the last write-ahead log record committed to the database
+    """
+    
+    __tablename__ = "ledger_engine_state_table"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    flushed_seq = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ArchivePartition(db.Model):
+    """Archived month of transactions SQlite ORM model
+        One SQLite file per month holding the transactions (and their postings) moved out of transactions_table and
+        postings_table, attached to history reads whose date range overlaps the month (see app.archive)
+
+    Columns:
+        month (SQLite str): YYYY-MM, primary key
+        path (SQLite str): file name in TRANSACTION_ARCHIVE_DIR, gzipped when compressed
+        start (SQLite DateTime): first instant of the month
+        end (SQLite DateTime): first instant of the next month
+        min_txn_id (SQLite int): lowest transaction ID archived
+        max_txn_id (SQLite int): highest transaction ID archived
+        transactions (SQLite int): number of transactions archived
+        compressed (SQLite bool): whether the file is gzipped
+        created_at (SQLite DateTime): time the month was archived
+    """
+    
+    __tablename__ = "archive_partitions_table"
+    
+    month = db.Column(db.String(7), primary_key=True)
+    path = db.Column(db.String(256), nullable=False)
+    start = db.Column(db.DateTime, nullable=False, index=True)
+    end = db.Column(db.DateTime, nullable=False)
+    min_txn_id = db.Column(db.Integer, nullable=False)
+    max_txn_id = db.Column(db.Integer, nullable=False)
+    transactions = db.Column(db.Integer, nullable=False)
+    compressed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return '<Archive partition {}: transactions {}-{}>'.format(self.month, self.min_txn_id, self.max_txn_id)
+
+
+class ShardSyncState(db.Model):
+    """Ledger shard publication state SQlite ORM model, one row per shard (see app.shards)
+
+    Columns:
+        shard (SQLite int): shard index, primary key
+        journal_id (SQLite int): ID of the last shard journal row published to transactions_table
+    """
+    
+    __tablename__ = "shard_sync_state_table"
+    
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    journal_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ClearingFile(db.Model):
+    """Inter-bank clearing file SQlite ORM model, one row per file exported or imported (see app.clearing)
+
+    Columns:
+        id (SQLite int): primary key
+        direction (SQLite str): "out" for files exported, "in" for files imported
+        name (SQLite str): file name
+        format (SQLite str): "fixed" (fixed-width) or "csv"
+        checksum (SQLite str): SHA-256 of the file, an inbound file is only imported once
+        entries (SQLite int): number of detail records
+        total (SQLite float): sum of the detail records' amounts
+        date_time (SQLite DateTime): time the file was exported or imported
+    """
+    
+    __tablename__ = "clearing_files_table"
+    __table_args__ = (db.UniqueConstraint('direction', 'checksum'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    direction = db.Column(db.String(3), nullable=False)
+    name = db.Column(db.String(256), nullable=False)
+    format = db.Column(db.String(5), nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)
+    entries = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    date_time = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return '<Clearing file {} ({}): {} entries>'.format(self.name, self.direction, self.entries)
+
+
+class ClearingEntry(db.Model):
+    """Inter-bank posting SQlite ORM model
+        The journal side of an inter-bank posting is a plain transaction on the local account: a "Withdrawal" for
+        outbound postings and a "Deposit" for inbound ones. This row keeps the other bank's side of it. Outbound
+        entries wait for the next flask clearing export, inbound ones are written by flask clearing import
+
+    Columns:
+        id (SQLite int): primary key, export order
+        direction (SQLite str): "out" or "in"
+        txn_id (SQLite int): transaction on the local account, mapped to transactions_table id
+        account_num (SQLite int): local account, mapped to accounts_table account_num
+        bank_code (SQLite str): code of the other bank
+        counterparty (SQLite str): account at the other bank
+        amount (SQLite float): positive amount
+        reference (SQLite str): reference of the posting, unique per bank and direction
+        date_time (SQLite DateTime): date time of the posting
+        clearing_file_id (SQLite int): file the entry was exported in or imported from, None until exported
+    """
+    
+    __tablename__ = "clearing_entries_table"
+    __table_args__ = (db.UniqueConstraint('direction', 'bank_code', 'reference'),
+                      db.Index('ix_clearing_entries_table_direction_clearing_file_id', 'direction', 'clearing_file_id'))
+    
+    id = db.Column(db.Integer, primary_key=True)
+    direction = db.Column(db.String(3), nullable=False)
+    txn_id = db.Column(db.Integer, db.ForeignKey('transactions_table.id'), nullable=False)
+    account_num = db.Column(db.Integer, db.ForeignKey('accounts_table.account_num'), nullable=False)
+    bank_code = db.Column(db.String(11), nullable=False)
+    counterparty = db.Column(db.String(34), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    reference = db.Column(db.String(35), nullable=False)
+    date_time = db.Column(db.DateTime, nullable=False)
+    clearing_file_id = db.Column(db.Integer, db.ForeignKey('clearing_files_table.id'))
+    
+    def to_dict(self):
+        # Pieces clearing entry information to a Python dictionary
+        data = {
+                "id": self.id,
+                "direction": self.direction,
+                "account_num": self.account_num,
+                "bank_code": self.bank_code,
+                "counterparty": self.counterparty,
+                "amount": self.amount,
+                "reference": self.reference,
+                "status": "pending" if self.clearing_file_id is None else "exported" if self.direction == "out" else "imported"
+        }
+        return data
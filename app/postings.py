@@ -0,0 +1,20 @@
+from sqlalchemy import event, DDL
+from app.models import Posting
+
+
+# Double-entry postings derived from transactions_table by a trigger, one signed row per account leg:
+# receivers are credited unless the transaction is a withdrawal, senders are debited for withdrawals and for
+# transactions between two accounts (deposits and new accounts have a single leg).
+# Batch migrations that recreate transactions_table drop the trigger, create it again afterwards.
+POSTINGS_TRIGGER_DDL = """CREATE TRIGGER IF NOT EXISTS postings_after_insert AFTER INSERT ON transactions_table BEGIN
+        INSERT INTO postings_table (txn_id, account_num, amount, date_time, transaction_type_id)
+        SELECT new.id, new.receiver, new.amount, new.date_time, new.transaction_type_id
+        WHERE coalesce(new.transaction_type_id, 0) != coalesce((SELECT id FROM transaction_type_table WHERE name = 'Withdrawal'), -1);
+        INSERT INTO postings_table (txn_id, account_num, amount, date_time, transaction_type_id)
+        SELECT new.id, new.sender, -new.amount, new.date_time, new.transaction_type_id
+        WHERE new.sender != new.receiver
+            OR coalesce(new.transaction_type_id, 0) = coalesce((SELECT id FROM transaction_type_table WHERE name = 'Withdrawal'), -1);
+    END"""
+
+event.listen(Posting.__table__, 'after_create', DDL(POSTINGS_TRIGGER_DDL).execute_if(dialect='sqlite'))
+event.listen(Posting.__table__, 'before_drop', DDL('DROP TRIGGER IF EXISTS postings_after_insert').execute_if(dialect='sqlite'))
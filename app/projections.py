@@ -0,0 +1,186 @@
+import time
+from collections import defaultdict
+from typing import DefaultDict, NamedTuple
+import numpy as np
+from flask import current_app
+from app import db, ledger, archive, analytics
+from app.models import Accounts, Transactions, TransactionType, LedgerCheckpoint, CheckpointBalance
+
+
+# Balances as projections of the transaction journal.
+# - app.ledger keeps Accounts.balance up to date incrementally, in the same database transaction that appends
+# the journal row.
+# - Checkpoints store the balances replayed up to a transaction, each one built from the previous checkpoint
+# plus the journal after it.
+# - replay() recomputes balances from the latest checkpoint (or from the start) and rebuild_balances() repairs
+# Accounts.balance wherever it disagrees.
+# The journal is read in sequential primary key ranges. Each range is loaded into NumPy columns and its postings
+# are netted per account in one vectorized batch, so Python only sees one value per account per chunk.
+
+
+class Replay(NamedTuple):
+    balances: dict
+    txn_id: int
+    postings: int
+    seconds: float
+
+
+# Journal rows with lo < id <= hi, in the layout of JOURNAL_ROW
+JOURNAL_ROWS = (db.select(Transactions.sender, Transactions.receiver, db.func.coalesce(Transactions.amount, 0),
+                          db.func.coalesce(Transactions.transaction_type_id, 0))
+                .where(Transactions.id > db.bindparam('lo'), Transactions.id <= db.bindparam('hi')))
+JOURNAL_ROW = np.dtype([('sender', '<i8'), ('receiver', '<i8'), ('amount', '<f8'), ('type_id', '<i8')])
+
+
+def postings(rows, withdrawal):
+    """Signed legs of journal rows, netted per account
+        - Receivers are credited unless the transaction is a withdrawal, senders are debited for withdrawals and
+        for transactions between two accounts
+
+    Args:
+        rows (list): JOURNAL_ROWS rows, as tuples
+        withdrawal (int): ID of the withdrawal transaction type, -1 when there is none
+
+    Returns:
+        tuple: account numbers (sorted), their net change and number of postings, as arrays
+    """
+    chunk = np.array(rows, dtype=JOURNAL_ROW)
+    credit = chunk['type_id'] != withdrawal
+    debit = ~credit | (chunk['sender'] != chunk['receiver'])
+    return analytics.group_by(np.concatenate((chunk['receiver'][credit], chunk['sender'][debit])),
+                              np.concatenate((chunk['amount'][credit], -chunk['amount'][debit])))
+
+
+def _fetch(stmt, params):
+    # Plain tuples straight from the DB-API cursor: NumPy takes them as they are, building SQLAlchemy rows for
+    # millions of journal rows would cost more than the replay itself
+    connection = db.session.connection()
+    compiled = stmt.compile(dialect=connection.dialect)
+    values = {**compiled.params, **params}
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        cursor.execute(str(compiled), [values[name] for name in compiled.positiontup])
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def latest_checkpoint():
+    return db.session.execute(db.select(LedgerCheckpoint).order_by(LedgerCheckpoint.txn_id.desc(),
+                                                                   LedgerCheckpoint.id.desc()).limit(1)).scalar()
+
+
+def _journal(lo, last, chunk_size, archived):
+    # Journal rows with lo < id <= last in ranges of chunk_size ids, preceded by every archived month when archived
+    ranges = [(partition, partition.min_txn_id - 1, partition.max_txn_id)
+              for partition in (archive.partitions(descending=False) if archived else [])]
+    for partition, low, high in ranges + [(None, lo, last)]:
+        while low < high:
+            params = {'lo': low, 'hi': min(low + chunk_size, high)}
+            rows = _fetch(JOURNAL_ROWS if partition is None
+                          else archive.retarget(JOURNAL_ROWS, archive.attach(partition)), params)
+            if rows:
+                yield rows
+            low = params['hi']
+
+
+def replay(full=False, chunk_size=None) -> Replay:
+    """Balances of every account recomputed from the journal
+        - Starts from the latest checkpoint, or from the first transaction when full or when there is none. Archived
+        months are only read by full replays, checkpoints always cover them (see app.archive)
+        - Reads in chunks of chunk_size transaction ids up to the latest one at the start. Journal rows never
+        change, so the result is the state of the journal at that transaction
+
+    Args:
+        full (bool): ignore checkpoints and replay the whole journal
+        chunk_size (int, optional): transaction ids per chunk, LEDGER_REPLAY_CHUNK_SIZE by default
+
+    Returns:
+        Replay: balances (account number -> balance), ID of the last transaction replayed, number of postings
+        (transaction legs) applied and wall time
+    """
+    start = time.perf_counter()
+    chunk_size = chunk_size or current_app.config['LEDGER_REPLAY_CHUNK_SIZE']
+    balances: DefaultDict[int, float] = defaultdict(float)
+    lo = 0
+    checkpoint = None if full else latest_checkpoint()
+    if checkpoint is not None:
+        lo = checkpoint.txn_id
+        balances.update(db.session.execute(db.select(CheckpointBalance.account_num, CheckpointBalance.balance)
+                                           .where(CheckpointBalance.checkpoint_id == checkpoint.id)).tuples().all())
+    last = db.session.execute(db.select(db.func.max(Transactions.id))).scalar() or 0
+    withdrawal = db.session.execute(db.select(TransactionType.id).where(TransactionType.name == 'Withdrawal')).scalar()
+    withdrawal = withdrawal if withdrawal is not None else -1
+    accounts, deltas, total = np.zeros(0, dtype=np.int64), np.zeros(0), 0
+    for rows in _journal(lo, last, chunk_size, archived=checkpoint is None):
+        chunk_accounts, chunk_deltas, legs = postings(rows, withdrawal)
+        accounts, deltas, _ = analytics.group_by(np.concatenate((accounts, chunk_accounts)),
+                                                 np.concatenate((deltas, chunk_deltas)))
+        total += int(legs.sum())
+    for account_num, delta in zip(accounts.tolist(), deltas.tolist()):
+        balances[account_num] += delta
+    return Replay(dict(balances), max(last, checkpoint.txn_id if checkpoint is not None else 0), total,
+                  time.perf_counter() - start)
+
+
+def checkpoint():
+    """Records the balances replayed from the latest checkpoint as a new checkpoint
+        - Only the newest LEDGER_CHECKPOINTS_KEPT checkpoints are kept
+
+    Returns:
+        LedgerCheckpoint: new checkpoint, or the latest one when no transaction was recorded since
+    """
+    latest = latest_checkpoint()
+    result = replay()
+    if latest is not None and latest.txn_id == result.txn_id:
+        return latest
+    new = LedgerCheckpoint(txn_id=result.txn_id)
+    db.session.add(new)
+    db.session.flush()
+    db.session.execute(db.insert(CheckpointBalance), [
+        {'checkpoint_id': new.id, 'account_num': account_num, 'balance': balance}
+        for account_num, balance in result.balances.items() if balance])
+    kept = current_app.config['LEDGER_CHECKPOINTS_KEPT']
+    for old in db.session.execute(db.select(LedgerCheckpoint).order_by(LedgerCheckpoint.txn_id.desc(),
+                                                                       LedgerCheckpoint.id.desc()).offset(kept)).scalars():
+        db.session.delete(old)
+    db.session.commit()
+    return new
+
+
+def rebuild_balances(full=False, dry_run=False, chunk_size=None):
+    """Compares every account's balance with the journal and repairs the ones that disagree
+        - Compares Accounts.current_balance, credits held in hot account slots included. Repairs adjust the main
+        balance and bump the version, like any other balance update
+        - Every balance change appends to the journal, so the repair is abandoned when a transaction was recorded
+        after the replay started
+
+    Args:
+        full (bool): replay the whole journal instead of starting from the latest checkpoint
+        dry_run (bool): only report the differences
+        chunk_size (int, optional): transaction ids per chunk, LEDGER_REPLAY_CHUNK_SIZE by default
+
+    Raises:
+        RuntimeError: when transactions were recorded during the replay, run it again
+
+    Returns:
+        tuple: the Replay, and (account number, projected balance, replayed balance) tuples of the accounts
+        that disagreed
+    """
+    result = replay(full=full, chunk_size=chunk_size)
+    mismatches = []
+    for account_num, projected in db.session.execute(db.select(Accounts.account_num, Accounts.current_balance)):
+        replayed = result.balances.get(account_num, 0)
+        if abs(replayed - (projected or 0)) > 1e-6:
+            mismatches.append((account_num, projected, replayed))
+    if mismatches and not dry_run:
+        db.session.execute(ledger.APPLY_NET, [{'account': account_num, 'net': replayed - (projected or 0)}
+                                              for account_num, projected, replayed in mismatches])
+        # The update holds the write lock, nothing can be appended between this check and the commit
+        if (db.session.execute(db.select(db.func.max(Transactions.id))).scalar() or 0) > result.txn_id:
+            db.session.rollback()
+            raise RuntimeError('Transactions were recorded during the replay')
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return result, mismatches
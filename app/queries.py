@@ -0,0 +1,213 @@
+from typing import NamedTuple, Optional
+from datetime import datetime
+from app import db, archive
+from app.models import User, Accounts, Transactions, Posting
+from app.encoders import TRANSACTION_FIELDS
+
+
+# Query layer for the hot paths.
+# - Row functions (user, accounts, transaction, ...) run Core selects mapped into named tuples instead of ORM objects.
+# Rows skip the identity map, attribute instrumentation and relationship proxies, so they cost a tuple each.
+# - load_* functions return ORM objects attached to the session, for the write paths that update them.
+# Every statement is built once at import time with bound parameters. Its cache key is memoized on the statement,
+# so executions skip both SQL construction and compilation (see app.sqlstats for the compiled cache statistics).
+
+
+class UserRow(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+
+
+class AccountRow(NamedTuple):
+    account_num: int
+    owner: int
+    balance: float
+
+    def to_dict(self):
+        # Same keys as Accounts.to_dict
+        return self._asdict()
+
+
+class TransactionRow(NamedTuple):
+    id: int
+    from_name: str
+    from_acc: int
+    to_name: str
+    to_acc: int
+    amount: float
+    type: str
+    date_time: datetime
+    signed_amount: Optional[float]  # amount as seen by the account the row was read for, None when read by id
+
+    def to_dict(self):
+        # Keys of Transactions.to_dict plus date_time
+        return {'id': self.id, 'from': self.from_name, 'from_acc': self.from_acc, 'to': self.to_name,
+                'to_acc': self.to_acc, 'amount': self.amount, 'type': self.type, 'date_time': self.date_time}
+
+
+USER_COLUMNS = (User.id, User.first_name, User.last_name, User.email)
+ACCOUNT_COLUMNS = (Accounts.account_num, Accounts.owner, Accounts.current_balance)
+
+
+def transaction_select(signed_amount=db.null()):
+    # Select producing TransactionRow columns, party names and type name joined in SQL
+    return TRANSACTION_FIELDS.select(TRANSACTION_FIELDS.keys, Transactions.date_time, signed_amount)
+
+
+def posting_select():
+    # transaction_select() driven by postings_table, one row per account leg with its signed amount
+    return transaction_select(Posting.amount).join(Posting, Posting.txn_id == Transactions.id)
+
+
+USER_ROW = db.select(*USER_COLUMNS).where(User.id == db.bindparam('id'))
+ACCOUNT_ROWS = db.select(*ACCOUNT_COLUMNS).where(Accounts.owner == db.bindparam('owner')).order_by(Accounts.account_num)
+FIRST_ACCOUNT_ROW = ACCOUNT_ROWS.limit(1)
+TRANSACTION_ROWS = (posting_select()
+                    .where(Posting.account_num == db.bindparam('account_num'))
+                    .order_by(Posting.date_time.desc(), Posting.txn_id.desc())
+                    .limit(db.bindparam('limit')))
+TRANSACTION_ROW = transaction_select().where(Transactions.id == db.bindparam('id'))
+TRANSACTION_LEGS = posting_select().add_columns(Posting.account_num).where(Posting.txn_id == db.bindparam('id'))
+BALANCE_AS_OF = (db.select(db.func.coalesce(db.func.sum(Posting.amount), 0))
+                 .where(Posting.account_num == db.bindparam('account_num'), Posting.date_time < db.bindparam('before')))
+
+USER_BY_TOKEN = db.select(User).where(User.token == db.bindparam('token'))
+USER_BY_EMAIL = db.select(User).where(User.email == db.bindparam('email'))
+ACCOUNT = db.select(Accounts).where(Accounts.account_num == db.bindparam('account_num'))
+OWNED_ACCOUNT = (db.select(Accounts, (Accounts.owner == db.bindparam('owner')).label('owned'))
+                 .where(Accounts.account_num == db.bindparam('account_num')))
+OWNER_ACCOUNT = db.select(Accounts).where(Accounts.owner == db.bindparam('owner')).order_by(Accounts.account_num).limit(1)
+
+
+def user(id) -> Optional[UserRow]:
+    """User by ID
+
+    Args:
+        id (int): ID of user
+
+    Returns:
+        UserRow: the user, None when it does not exist
+    """
+    row = db.session.execute(USER_ROW, {'id': id}).first()
+    return UserRow._make(row) if row is not None else None
+
+
+def accounts(owner_id) -> list:
+    """Accounts belonging to a user, by account number
+
+    Args:
+        owner_id (int): ID of user
+
+    Returns:
+        list: AccountRow tuples
+    """
+    return [AccountRow._make(row) for row in db.session.execute(ACCOUNT_ROWS, {'owner': owner_id})]
+
+
+def first_account(owner_id) -> Optional[AccountRow]:
+    """Account with the lowest account number belonging to a user (the one opened at registration)
+
+    Args:
+        owner_id (int): ID of user
+
+    Returns:
+        AccountRow: the account, None when the user has none
+    """
+    row = db.session.execute(FIRST_ACCOUNT_ROW, {'owner': owner_id}).first()
+    return AccountRow._make(row) if row is not None else None
+
+
+def transactions(account_num, limit) -> list:
+    """Latest transactions involving an account, newest first
+        - When the hot table holds fewer than limit, archived months are read newest first until there are enough
+
+    Args:
+        account_num (int): account number
+        limit (int): maximum number of transactions
+
+    Returns:
+        list: TransactionRow tuples
+    """
+    rows = [TransactionRow._make(row)
+            for row in db.session.execute(TRANSACTION_ROWS, {'account_num': account_num, 'limit': limit})]
+    if len(rows) < limit:
+        # Archived months only hold transactions older than the hot table's
+        for partition in archive.partitions():
+            params = {'account_num': account_num, 'limit': limit - len(rows)}
+            rows += [TransactionRow._make(row) for row in archive.execute(TRANSACTION_ROWS, [partition], params)]
+            if len(rows) >= limit:
+                break
+    return rows
+
+
+def transaction(txn_id) -> Optional[TransactionRow]:
+    """Transaction by ID
+
+    Args:
+        txn_id (int): ID of transaction
+
+    Returns:
+        TransactionRow: the transaction, None when it does not exist
+    """
+    row = db.session.execute(TRANSACTION_ROW, {'id': txn_id}).first()
+    return TransactionRow._make(row) if row is not None else None
+
+
+def transaction_legs(txn_id) -> list:
+    """A transaction as seen by each account it involves
+
+    Args:
+        txn_id (int): ID of transaction
+
+    Returns:
+        list: (account_num, TransactionRow) pairs, one per posting, rows carry the account's signed amount
+    """
+    return [(row[-1], TransactionRow._make(row[:-1])) for row in db.session.execute(TRANSACTION_LEGS, {'id': txn_id})]
+
+
+def balance_as_of(account_num, before) -> float:
+    """Balance of an account from the transactions recorded before a point in time
+
+    Args:
+        account_num (int): account number
+        before (datetime): transactions at or after this time are left out
+
+    Returns:
+        float: sum of the account's postings, archived months before that time included, 0 when it has none
+    """
+    params = {'account_num': account_num, 'before': before}
+    return db.session.execute(BALANCE_AS_OF, params).scalar() + sum(
+        row[0] for row in archive.execute(BALANCE_AS_OF, archive.partitions(date_to=before), params))
+
+
+def load_user_by_token(token) -> Optional[User]:
+    # User holding an API token, expired or not
+    return db.session.execute(USER_BY_TOKEN, {'token': token}).scalar()
+
+
+def load_user_by_email(email) -> Optional[User]:
+    return db.session.execute(USER_BY_EMAIL, {'email': email}).scalar()
+
+
+def load_account(account_num) -> Optional[Accounts]:
+    return db.session.execute(ACCOUNT, {'account_num': account_num}).scalar()
+
+
+def load_owned_account(account_num, owner_id):
+    """Account by number together with whether it belongs to a user, in one query
+
+    Args:
+        account_num (int): account number
+        owner_id (int): ID of the user claiming the account
+
+    Returns:
+        Row: (Accounts, owned) pair, None when the account does not exist
+    """
+    return db.session.execute(OWNED_ACCOUNT, {'account_num': account_num, 'owner': owner_id}).first()
+
+
+def load_owner_account(owner_id) -> Optional[Accounts]:
+    # Account with the lowest account number belonging to a user
+    return db.session.execute(OWNER_ACCOUNT, {'owner': owner_id}).scalar()
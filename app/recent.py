@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict, deque
+from flask import current_app
+from app import queries, tenancy
+
+
+class RecentTransactions:
+    """Per-account ring buffers of the latest transactions (app.queries.TransactionRow), for dashboard reads
+        - Each buffer holds up to size entries and is warmed from the database the first time its account is read
+        - Writes append to buffers that are already warm, cold accounts are left for the next read to warm
+        - Buffers remember the id of the latest transaction they hold, reads given a newer id (e.g. written by
+        another process) warm the buffer again
+        - All buffers share a budget of budget bytes of serialized JSON, least recently used accounts are
+        evicted first
+
+    Args:
+        size (int): entries kept per account
+        budget (int): serialized bytes kept across all accounts
+    """
+
+    def __init__(self, size, budget):
+        self.size = size
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, account_num, latest_id=None):
+        """Latest transactions of an account, newest first
+
+        Args:
+            account_num (int): account number
+            latest_id (int, optional): id of the account's latest transaction, when the caller already knows it
+
+        Returns:
+            list: TransactionRow tuples, None when the account is cold
+        """
+        with self._lock:
+            buffer = self._buffers.get(account_num)
+            if buffer is None or (latest_id is not None and buffer.latest_id != latest_id):
+                self.misses += 1
+                return None
+            self._buffers.move_to_end(account_num)
+            self.hits += 1
+            return [entry for entry, _ in reversed(buffer.entries)]
+
+    def is_warm(self, account_num):
+        return account_num in self._buffers
+
+    def load(self, account_num, entries):
+        # Replaces the buffer of account_num with entries, given newest first
+        buffer = _Buffer(self.size)
+        for entry in reversed(entries):
+            buffer.push(entry, _size(entry))
+        with self._lock:
+            old = self._buffers.pop(account_num, None)
+            self.used -= old.used if old is not None else 0
+            self._buffers[account_num] = buffer
+            self.used += buffer.used
+            self._evict()
+
+    def append(self, entry, account_nums):
+        # Appends entry to the warm buffers among account_nums
+        size = _size(entry)
+        with self._lock:
+            for account_num in set(account_nums):
+                buffer = self._buffers.get(account_num)
+                if buffer is not None:
+                    self.used += buffer.push(entry, size)
+            self._evict()
+
+    def discard(self, account_num):
+        with self._lock:
+            buffer = self._buffers.pop(account_num, None)
+            if buffer is not None:
+                self.used -= buffer.used
+
+    def clear(self):
+        with self._lock:
+            self._buffers.clear()
+            self.used = 0
+
+    def _evict(self):
+        while self.used > self.budget and self._buffers:
+            _, buffer = self._buffers.popitem(last=False)
+            self.used -= buffer.used
+            self.evictions += 1
+
+    def metrics(self):
+        return {
+            'accounts': len(self._buffers),
+            'entries_per_account': self.size,
+            'bytes': self.used,
+            'budget_bytes': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class _Buffer:
+    # Ring buffer of (TransactionRow, serialized size) pairs, oldest first
+    __slots__ = ('entries', 'used', 'latest_id')
+
+    def __init__(self, size):
+        self.entries = deque(maxlen=size)
+        self.used = 0
+        self.latest_id = 0
+
+    def push(self, entry, size):
+        # Returns the change in serialized bytes held
+        delta = size
+        if len(self.entries) == self.entries.maxlen:
+            delta -= self.entries[0][1]
+        self.entries.append((entry, size))
+        self.used += delta
+        self.latest_id = max(self.latest_id, entry.id)
+        return delta
+
+
+def _size(entry):
+    return len(current_app.json.dumps(entry.to_dict()))
+
+
+def get_cache():
+    # One cache per application and tenant, so each app (and each test app) sees only its own database
+    cache = tenancy.extensions().get('recent_transactions')
+    if cache is None:
+        cache = tenancy.extensions().setdefault('recent_transactions', RecentTransactions(
+            current_app.config['RECENT_TRANSACTIONS_SIZE'], current_app.config['RECENT_TRANSACTIONS_MEMORY_BUDGET']))
+    return cache
+
+
+def recent_transactions(account_num, latest_id=None):
+    """Latest RECENT_TRANSACTIONS_SIZE transactions involving an account, newest first
+        - Served from the ring buffer when warm, otherwise read with one indexed query and cached
+
+    Args:
+        account_num (int): account number
+        latest_id (int, optional): id of the account's latest transaction (Accounts.ledger_marks), lets the
+        buffer detect transactions written by other processes
+
+    Returns:
+        list: app.queries.TransactionRow tuples
+    """
+    cache = get_cache()
+    entries = cache.get(account_num, latest_id)
+    if entries is None:
+        entries = queries.transactions(account_num, cache.size)
+        cache.load(account_num, entries)
+    return entries
+
+
+def record(txn_id, account_nums):
+    """Appends a committed transaction to the buffers of the accounts it involves
+        - Nothing is read when none of those accounts is warm
+        - Each account gets the row of its own posting, with its signed amount
+
+    Args:
+        txn_id (int): ID of the transaction
+        account_nums (list): account numbers of the sender and receiver
+    """
+    cache = get_cache()
+    if not any(cache.is_warm(account_num) for account_num in account_nums):
+        return
+    for account_num, entry in queries.transaction_legs(txn_id):
+        cache.append(entry, [account_num])
@@ -0,0 +1,339 @@
+import threading
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from flask import current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from app import db, ledger, recent
+from app.models import Accounts, Transactions, TransactionType, ShardSyncState
+
+
+# Account balances hash-sharded over LEDGER_SHARDS SQLite files, so each shard has its own writer (app.shards).
+# - Every account lives in one shard, picked by a hash of its number. A shard holds the balances of its accounts,
+# the journal of the transactions debiting them (deposits: crediting them) and its side of cross-shard transfers.
+# - Deposits and transfers within a shard are one local transaction. Transfers across shards use a two-phase commit
+# whose recovery log is kept in the shards themselves:
+#   1. prepare: the credit is recorded as a prepared row in the receiver's shard
+#   2. commit point: the sender's shard debits the sender, appends the journal row and records the decision, in one
+#      local transaction. The decision's primary key makes it final: recover() can only abort a transfer by
+#      recording the decision first
+#   3. the receiver's shard applies the credit and removes the prepared row
+#   recover() completes or aborts prepared credits left behind by a crash, once they are older than
+#   LEDGER_SHARD_RECOVERY_GRACE seconds.
+# - The main database stays the read model: sync() publishes the shard journals to transactions_table and
+# accounts_table in batches, so balances there trail the shards until the next sync. An account's balance is
+# copied from accounts_table the first time its shard sees it, and the shards must then be the only balance
+# writers. LEDGER_SHARDS cannot change while shards hold balances.
+
+shard_metadata = db.MetaData()
+shard_accounts = db.Table(
+    'shard_accounts', shard_metadata,
+    db.Column('account_num', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('balance', db.Float, nullable=False),
+    db.Column('version', db.Integer, nullable=False, default=0))
+shard_journal = db.Table(
+    'shard_journal', shard_metadata,
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('sender', db.Integer, nullable=False),
+    db.Column('receiver', db.Integer, nullable=False),
+    db.Column('amount', db.Float, nullable=False),
+    db.Column('date_time', db.DateTime, nullable=False),
+    db.Column('transaction_type_id', db.Integer))
+shard_prepared = db.Table(
+    'shard_prepared', shard_metadata,
+    db.Column('xid', db.String(32), primary_key=True),
+    db.Column('account_num', db.Integer, nullable=False),
+    db.Column('amount', db.Float, nullable=False),
+    db.Column('sender_shard', db.Integer, nullable=False),
+    db.Column('created_at', db.DateTime, nullable=False))
+shard_decisions = db.Table(
+    'shard_decisions', shard_metadata,
+    db.Column('xid', db.String(32), primary_key=True),
+    db.Column('committed', db.Boolean, nullable=False),
+    db.Column('created_at', db.DateTime, nullable=False))
+
+DEBIT = (shard_accounts.update()
+         .where(shard_accounts.c.account_num == db.bindparam('account'), shard_accounts.c.balance >= db.bindparam('amount'))
+         .values(balance=shard_accounts.c.balance - db.bindparam('amount'), version=shard_accounts.c.version + 1))
+CREDIT = (shard_accounts.update()
+          .where(shard_accounts.c.account_num == db.bindparam('account'))
+          .values(balance=shard_accounts.c.balance + db.bindparam('amount'), version=shard_accounts.c.version + 1))
+DECIDE = sqlite_insert(shard_decisions).on_conflict_do_nothing()
+
+
+class ShardPosting(NamedTuple):
+    shard: int
+    id: int
+    sender: int
+    receiver: int
+    amount: float
+    xid: Optional[str]  # two-phase commit transaction id, None within a shard
+
+    def to_dict(self):
+        # Pieces posting information to a Python dictionary
+        data = {
+                "shard": self.shard,
+                "id": self.id,
+                "from_acc": self.sender,
+                "to_acc": self.receiver,
+                "amount": self.amount,
+                "status": "accepted"
+        }
+        return data
+
+
+class ShardRouter:
+    """Routes balance changes to the shard holding each account (LEDGER_SHARDS)
+
+    Args:
+        urls (list): database URL of each shard, in shard order
+        types (dict): transaction type name -> id
+        load_balance (callable): account number -> balance of an account its shard has not seen yet, raises
+            LookupError when it does not exist
+    """
+
+    def __init__(self, urls, types, load_balance):
+        self.engines = [create_engine(url) for url in urls]
+        self.types = types
+        self.load_balance = load_balance
+        self.transfers = defaultdict(int)
+        self._known = [set() for _ in urls]
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'connect', _configure)
+            shard_metadata.create_all(engine)
+
+    def shard_of(self, account_num):
+        return zlib.crc32(account_num.to_bytes(8, 'little', signed=True)) % len(self.engines)
+
+    def balance(self, account_num):
+        shard = self.shard_of(account_num)
+        with self.engines[shard].connect() as connection:
+            balance = connection.execute(db.select(shard_accounts.c.balance)
+                                         .where(shard_accounts.c.account_num == account_num)).scalar()
+        return self.load_balance(account_num) if balance is None else balance
+
+    def account_dict(self, account):
+        # Accounts.to_dict with the shard's balance
+        return {"account_num": account.account_num, "owner": account.owner, "balance": self.balance(account.account_num)}
+
+    def deposit(self, account_num, amount):
+        """Adds amount to an account's balance, in the account's shard
+
+        Args:
+            account_num (int): receiving account
+            amount (float): positive amount
+
+        Returns:
+            ShardPosting: the journal row
+        """
+        shard = self.shard_of(account_num)
+        self._ensure(shard, account_num)
+        with self.engines[shard].begin() as connection:
+            connection.execute(CREDIT, {'account': account_num, 'amount': amount})
+            id = self._journal(connection, account_num, account_num, amount, 'Deposit')
+        return ShardPosting(shard, id, account_num, account_num, amount, None)
+
+    def transfer(self, sender, recipient, amount):
+        """Moves amount from one account to another when the sender's balance covers it
+            - One local transaction when both accounts share a shard, a two-phase commit otherwise
+
+        Args:
+            sender (int): account funds are taken from
+            recipient (int): account funds are sent to
+            amount (float): positive amount
+
+        Returns:
+            ShardPosting: the sender shard's journal row, None when the sender cannot pay
+        """
+        sender_shard, recipient_shard = self.shard_of(sender), self.shard_of(recipient)
+        self._ensure(sender_shard, sender)
+        self._ensure(recipient_shard, recipient)
+        if sender_shard == recipient_shard:
+            with self.engines[sender_shard].begin() as connection:
+                if not connection.execute(DEBIT, {'account': sender, 'amount': amount}).rowcount:
+                    return None
+                connection.execute(CREDIT, {'account': recipient, 'amount': amount})
+                id = self._journal(connection, sender, recipient, amount, 'Transfer')
+            self._count('local')
+            return ShardPosting(sender_shard, id, sender, recipient, amount, None)
+
+        xid = uuid.uuid4().hex
+        # 1. prepare the credit
+        with self.engines[recipient_shard].begin() as connection:
+            connection.execute(shard_prepared.insert().values(xid=xid, account_num=recipient, amount=amount,
+                                                              sender_shard=sender_shard, created_at=datetime.utcnow()))
+        # 2. commit point: debit, journal and decision in the sender's shard
+        id = None
+        try:
+            with self.engines[sender_shard].begin() as connection:
+                if connection.execute(DEBIT, {'account': sender, 'amount': amount}).rowcount:
+                    id = self._journal(connection, sender, recipient, amount, 'Transfer')
+                connection.execute(shard_decisions.insert().values(xid=xid, committed=id is not None,
+                                                                   created_at=datetime.utcnow()))
+        except IntegrityError:
+            # recover() aborted the transfer first
+            id = None
+        # 3. apply or drop the prepared credit
+        self._complete(recipient_shard, xid, id is not None)
+        self._count('two_phase' if id is not None else 'aborted')
+        return ShardPosting(sender_shard, id, sender, recipient, amount, xid) if id is not None else None
+
+    def recover(self, grace=0):
+        """Completes or aborts cross-shard transfers interrupted between their phases
+            - A prepared credit without a decision is aborted, by recording the abort in the sender's shard
+            - Decisions are pruned once no prepared credit refers to them
+
+        Args:
+            grace (float): seconds a prepared credit is left to its transfer before being recovered
+
+        Returns:
+            tuple: (credits applied, credits aborted)
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=grace)
+        applied = aborted = 0
+        pending = set()
+        for shard, engine in enumerate(self.engines):
+            with engine.connect() as connection:
+                prepared = connection.execute(db.select(shard_prepared.c.xid, shard_prepared.c.sender_shard,
+                                                        shard_prepared.c.created_at)).all()
+            for xid, sender_shard, created_at in prepared:
+                pending.add(xid)
+                if created_at > cutoff:
+                    continue
+                with self.engines[sender_shard].begin() as connection:
+                    connection.execute(DECIDE, {'xid': xid, 'committed': False, 'created_at': datetime.utcnow()})
+                    committed = connection.execute(db.select(shard_decisions.c.committed)
+                                                   .where(shard_decisions.c.xid == xid)).scalar()
+                self._complete(shard, xid, committed)
+                applied, aborted = applied + bool(committed), aborted + (not committed)
+        for engine in self.engines:
+            with engine.begin() as connection:
+                connection.execute(shard_decisions.delete().where(shard_decisions.c.created_at <= cutoff,
+                                                                  shard_decisions.c.xid.not_in(pending)))
+        return applied, aborted
+
+    def sync(self, batch_size):
+        """Publishes the shard journals to the main database
+            - Per shard, up to batch_size journal rows past the last one published: one net balance update per
+            account, a bulk insert of their transactions and the new high-water mark, in one database transaction
+
+        Args:
+            batch_size (int): journal rows published per shard
+
+        Returns:
+            int: number of journal rows published
+        """
+        published = 0
+        for shard, engine in enumerate(self.engines):
+            state = db.session.get(ShardSyncState, shard) or ShardSyncState(shard=shard, journal_id=0)
+            with engine.connect() as connection:
+                rows = connection.execute(db.select(shard_journal).where(shard_journal.c.id > state.journal_id)
+                                          .order_by(shard_journal.c.id).limit(batch_size)).all()
+            if not rows:
+                continue
+            net = defaultdict(float)
+            for row in rows:
+                net[row.receiver] += row.amount
+                if row.sender != row.receiver:
+                    net[row.sender] -= row.amount
+            db.session.execute(ledger.APPLY_NET, [{'account': account_num, 'net': amount}
+                                                  for account_num, amount in net.items() if amount])
+            db.session.execute(db.insert(Transactions), [
+                {'sender': row.sender, 'receiver': row.receiver, 'amount': row.amount, 'date_time': row.date_time,
+                 'transaction_type_id': row.transaction_type_id} for row in rows])
+            state.journal_id = rows[-1].id
+            db.session.add(state)
+            db.session.commit()
+            cache = recent.get_cache()
+            for account_num in net:
+                cache.discard(account_num)
+            published += len(rows)
+        return published
+
+    def metrics(self):
+        shards = []
+        for shard, engine in enumerate(self.engines):
+            with engine.connect() as connection:
+                shards.append({
+                    'accounts': connection.execute(db.select(db.func.count()).select_from(shard_accounts)).scalar(),
+                    'journal': connection.execute(db.select(db.func.max(shard_journal.c.id))).scalar() or 0,
+                    'prepared': connection.execute(db.select(db.func.count()).select_from(shard_prepared)).scalar(),
+                })
+        return {'shards': shards, 'transfers': dict(self.transfers)}
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+    def _ensure(self, shard, account_num):
+        # Copies an account's balance into its shard the first time the shard sees it
+        if account_num in self._known[shard]:
+            return
+        balance = self.load_balance(account_num)
+        with self.engines[shard].begin() as connection:
+            connection.execute(sqlite_insert(shard_accounts).on_conflict_do_nothing(),
+                               {'account_num': account_num, 'balance': balance, 'version': 0})
+        with self._lock:
+            self._known[shard].add(account_num)
+
+    def _journal(self, connection, sender, receiver, amount, type_name):
+        return connection.execute(shard_journal.insert().values(
+            sender=sender, receiver=receiver, amount=amount, date_time=datetime.utcnow(),
+            transaction_type_id=self.types[type_name])).inserted_primary_key[0]
+
+    def _complete(self, shard, xid, committed):
+        # Second phase in the receiver's shard: applies the prepared credit, or drops it
+        with self.engines[shard].begin() as connection:
+            prepared = connection.execute(db.select(shard_prepared.c.account_num, shard_prepared.c.amount)
+                                          .where(shard_prepared.c.xid == xid)).first()
+            if prepared is None:
+                return
+            if committed:
+                connection.execute(CREDIT, {'account': prepared.account_num, 'amount': prepared.amount})
+            connection.execute(shard_prepared.delete().where(shard_prepared.c.xid == xid))
+
+    def _count(self, kind):
+        with self._lock:
+            self.transfers[kind] += 1
+
+
+def _configure(dbapi_connection, connection_record):
+    # Readers never block the writer, and every commit is durable before the next phase of a transfer starts
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=FULL')
+    cursor.close()
+
+
+def _load_balance(account_num):
+    balance = db.session.execute(db.select(Accounts.current_balance).where(Accounts.account_num == account_num)).scalar()
+    if balance is None:
+        raise LookupError('Account {} does not exist'.format(account_num))
+    return balance
+
+
+_create_lock = threading.Lock()
+
+
+def get_router():
+    # One router per application, its shard databases are created on first use
+    router = current_app.extensions.get('ledger_shards')
+    if router is None:
+        with _create_lock:
+            router = current_app.extensions.get('ledger_shards')
+            if router is None:
+                config = current_app.config
+                types = {name: id for id, name in db.session.execute(db.select(TransactionType.id, TransactionType.name))}
+                router = current_app.extensions['ledger_shards'] = ShardRouter(
+                    [config['LEDGER_SHARD_URL'].format(shard) for shard in range(config['LEDGER_SHARDS'])],
+                    types, _load_balance)
+    return router
+
+
+def enabled():
+    return current_app.config['LEDGER_SHARDS'] > 0
@@ -0,0 +1,61 @@
+import threading
+from collections import Counter
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine.interfaces import CacheStats
+from app import db
+
+
+class CompiledCacheStats:
+    """Counts how often executed statements were found in the engine's compiled SQL cache
+        - A hit means SQLAlchemy reused the SQL compiled for an equivalent statement, a miss means it compiled it
+        - Misses are also counted per SQL string, so a hot path that recompiles on each request stands out
+
+    Args:
+        engine (Engine): engine whose executions are counted
+        max_statements (int): distinct SQL strings tracked for misses
+    """
+
+    def __init__(self, engine, max_statements=200):
+        self.engine = engine
+        self.max_statements = max_statements
+        self.counts = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        cache_hit = getattr(context, 'cache_hit', None)
+        if cache_hit is None:
+            return
+        with self._lock:
+            self.counts[cache_hit] += 1
+            if cache_hit is CacheStats.CACHE_MISS and (statement in self.misses or len(self.misses) < self.max_statements):
+                self.misses[statement] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.misses.clear()
+
+    def metrics(self, top=10):
+        cache = getattr(self.engine, '_compiled_cache', None)
+        return {
+            'hits': self.counts[CacheStats.CACHE_HIT],
+            'misses': self.counts[CacheStats.CACHE_MISS],
+            'no_cache_key': self.counts[CacheStats.NO_CACHE_KEY],
+            'caching_disabled': self.counts[CacheStats.CACHING_DISABLED] + self.counts[CacheStats.NO_DIALECT_SUPPORT],
+            'cached_statements': len(cache) if cache is not None else 0,
+            'cache_capacity': getattr(cache, 'capacity', 0),
+            'top_misses': [{'sql': sql, 'misses': count} for sql, count in self.misses.most_common(top)],
+        }
+
+
+def init_app(app):
+    # Starts counting compiled cache hits and misses on the application's default engine
+    with app.app_context():
+        app.extensions['sql_compiled_cache'] = CompiledCacheStats(db.engine)
+
+
+def get_stats():
+    return current_app.extensions['sql_compiled_cache']
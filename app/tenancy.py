@@ -0,0 +1,167 @@
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request, abort
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+
+
+# Several banks (tenants) served by one application, each with its own database (TENANTS).
+# - A request's tenant comes from its host (TENANT_HOSTS, or a first host label naming a tenant) or from the prefix
+# of its API token, "<tenant>.<token>". Requests without one use SQLALCHEMY_DATABASE_URI as before.
+# - db.session binds to the tenant's engine (TenantSession). Engines are created from TENANT_DATABASE_URL on first
+# use and kept in an LRU of TENANT_ENGINES_MAX, the least recently used one is disposed.
+# - In-process caches of database rows (recent transactions, fragments, aliases, Bloom filters, idempotency keys,
+# archived months) are kept per tenant, in extensions() rather than current_app.extensions.
+
+TENANT_NAME = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+
+
+class TenantSession(Session):
+    """db.session binding every query to the current tenant's database, when there is one"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = current()
+        if bind is None and tenant is not None:
+            return get_engine(tenant)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class EngineCache:
+    """Bounded LRU of per-tenant engines
+        - An evicted engine is disposed: its pooled connections are closed, connections still checked out are
+        closed when returned
+
+    Args:
+        url (str): database URL, {} is replaced by the tenant name
+        capacity (int): engines kept
+    """
+
+    def __init__(self, url, capacity):
+        self.url = url
+        self.capacity = capacity
+        self.created = 0
+        self.evictions = 0
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant):
+        with self._lock:
+            engine = self._engines.get(tenant)
+            if engine is not None:
+                self._engines.move_to_end(tenant)
+                return engine
+            engine = self._engines[tenant] = create_engine(self.url.format(tenant))
+            self.created += 1
+            while len(self._engines) > self.capacity:
+                _, evicted = self._engines.popitem(last=False)
+                evicted.dispose()
+                self.evictions += 1
+            return engine
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+    def metrics(self):
+        return {'engines': len(self._engines), 'capacity': self.capacity, 'created': self.created,
+                'evictions': self.evictions}
+
+
+def current():
+    # Name of the current tenant, None for the default database
+    return g.get('tenant') if has_app_context() else None
+
+
+def get_engine(tenant):
+    return current_app.extensions['tenant_engines'].get(tenant)
+
+
+def extensions():
+    # Per tenant counterpart of current_app.extensions, for caches holding one database's rows
+    tenant = current()
+    if tenant is None:
+        return current_app.extensions
+    return current_app.extensions['tenants'].setdefault(tenant, {})
+
+
+@contextmanager
+def use(tenant):
+    """Binds db.session to a tenant's database for the duration of the block, outside of requests (CLI, tests)
+
+    Args:
+        tenant (str): tenant name, None for the default database
+
+    Raises:
+        LookupError: when tenant is not in TENANTS
+    """
+    from app import db
+    if tenant is not None and tenant not in current_app.config['TENANTS']:
+        raise LookupError('Unknown tenant {}'.format(tenant))
+    previous = g.get('tenant')
+    db.session.remove()
+    g.tenant = tenant
+    try:
+        yield
+    finally:
+        db.session.remove()
+        g.tenant = previous
+
+
+def qualify_token(token):
+    # API token as handed to the client, prefixed with the tenant that issued it
+    tenant = current()
+    return token if tenant is None else '{}.{}'.format(tenant, token)
+
+
+def token_secret(token):
+    # Stored part of an API token (base64, never contains a dot)
+    return token.rpartition('.')[2]
+
+
+def resolve():
+    """Tenant of the current request, from its host or its bearer token
+
+    Returns:
+        str: tenant name, None for the default database. Aborts with 404 for unknown tenants and 401 for a token
+        issued by another tenant than the host's
+    """
+    config = current_app.config
+    host = request.host.split(':')[0].lower()
+    tenant = config['TENANT_HOSTS'].get(host)
+    if tenant is None and host.split('.')[0] in config['TENANTS']:
+        tenant = host.split('.')[0]
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer ') and '.' in authorization:
+        claimed = authorization[len('Bearer '):].rpartition('.')[0]
+        if claimed not in config['TENANTS']:
+            abort(404)
+        if tenant is not None and claimed != tenant:
+            abort(401)
+        tenant = claimed
+    return tenant
+
+
+def init_app(app):
+    # Resolves the tenant before anything reads the database
+    if not app.config['TENANTS']:
+        return
+    for tenant in app.config['TENANTS']:
+        if not TENANT_NAME.match(tenant):
+            raise ValueError('Invalid tenant name {!r}'.format(tenant))
+    if app.config['LEDGER_ENGINE_ENABLED'] or app.config['LEDGER_SHARDS']:
+        raise ValueError('TENANTS cannot be combined with LEDGER_ENGINE_ENABLED or LEDGER_SHARDS')
+    app.extensions['tenant_engines'] = EngineCache(app.config['TENANT_DATABASE_URL'], app.config['TENANT_ENGINES_MAX'])
+    app.extensions['tenants'] = {}
+
+    @app.before_request
+    def select_tenant():
+        tenant = resolve()
+        if tenant != g.get('tenant'):
+            # A session kept from another tenant (app context reused across requests) holds that tenant's rows
+            from app import db
+            db.session.remove()
+        g.tenant = tenant
@@ -0,0 +1,73 @@
+"""Inter-bank clearing file benchmark: app.clearing.import_file and export_file on `lines` records
+
+Writes an inbound file of `lines` credits spread over 10000 accounts, in both formats, and reports the time
+to import it. The imported entries are then copied as outbound entries and exported again. Peak memory is
+reported too, it should not grow with `lines`. Uses the testing database, set TEST_DATABASE_URL to a file to
+include disk writes.
+
+Run from the repository root:
+    python -m benchmarks.bench_clearing [lines]
+"""
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from app import create_app, db, clearing
+from app.models import Role, TransactionType, User, Accounts, ClearingEntry
+
+ACCOUNTS = 10000
+
+
+def write(path, fmt, lines):
+    with open(path, 'w', newline='') as file:
+        write = clearing._writer(file, fmt)
+        write(('H', 'BENCHBANK', '20231001'))
+        for line in range(lines):
+            write(('D', '20231001', line % ACCOUNTS + 1, 'OTHERBANK', 'DE89370400440532013000', line % 1000 + 1,
+                   '{}-{}'.format(fmt, line)))
+        write(('T', lines, sum(line % 1000 + 1 for line in range(lines))))
+
+
+def main(lines=1000000):
+    app = create_app('testing')
+    app.config.update(CLEARING_BANK_CODE='BENCHBANK')
+    directory = tempfile.mkdtemp()
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        db.session.add(User(first_name='Jane', last_name='Doe', email='janedoe@email.com'))
+        db.session.flush()
+        db.session.execute(db.insert(Accounts), [{'owner': 1, 'balance': 0} for _ in range(ACCOUNTS)])
+        db.session.commit()
+        try:
+            for fmt, name in (('fixed', 'inbound.txt'), ('csv', 'inbound.csv')):
+                path = os.path.join(directory, name)
+                write(path, fmt, lines)
+                start = time.perf_counter()
+                imported = clearing.import_file(path)
+                seconds = time.perf_counter() - start
+                print('import {:<6} {:>9} lines {:>8.1f} s {:>10.0f} lines/s'.format(
+                    fmt, imported.entries, seconds, imported.entries / seconds))
+            entries = ClearingEntry.__table__
+            db.session.execute(db.insert(entries).from_select(
+                ['direction', 'txn_id', 'account_num', 'bank_code', 'counterparty', 'amount', 'reference', 'date_time'],
+                db.select(db.literal('out'), entries.c.txn_id, entries.c.account_num, entries.c.bank_code,
+                          entries.c.counterparty, entries.c.amount, entries.c.reference, entries.c.date_time)
+                .where(entries.c.direction == 'in')))
+            db.session.commit()
+            start = time.perf_counter()
+            exported = clearing.export_file(os.path.join(directory, 'outbound.txt'))
+            seconds = time.perf_counter() - start
+            print('export fixed  {:>9} lines {:>8.1f} s {:>10.0f} lines/s'.format(
+                exported.entries, seconds, exported.entries / seconds))
+            print('peak memory {:.0f} MB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+        finally:
+            db.drop_all()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
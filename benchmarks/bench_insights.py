@@ -0,0 +1,72 @@
+"""Spending insights benchmark: app.analytics.insights over a snapshot of `rows` transactions
+
+Seeds `rows` transfers and deposits over the last two years between 10000 accounts, a third of them involving
+account 1, refreshes the analytics snapshot and reports the median time of monthly, weekly and daily insights
+of account 1, which should stay under 50 ms. Uses the testing database, set TEST_DATABASE_URL to a file to
+include disk reads.
+
+Run from the repository root:
+    python -m benchmarks.bench_insights [rows]
+"""
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from app import create_app, db, analytics
+from app.models import Role, TransactionType, User, Accounts, Transactions
+
+ACCOUNTS = 10000
+CHUNK = 100000
+
+
+def seed(rows):
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    for start in range(0, rows, CHUNK):
+        batch = []
+        for _ in range(start, min(start + CHUNK, rows)):
+            sender = 1 if rng.random() < 0.33 else rng.randrange(2, ACCOUNTS + 1)
+            receiver = rng.randrange(1, ACCOUNTS + 1)
+            batch.append({'sender': sender, 'receiver': receiver, 'amount': rng.randrange(1, 1000),
+                          'transaction_type_id': 3 if sender != receiver else 2,
+                          'date_time': now - timedelta(seconds=rng.randrange(2 * 365 * 86400))})
+        db.session.execute(db.insert(Transactions), batch)
+    db.session.commit()
+
+
+def main(rows=1000000):
+    app = create_app('testing')
+    directory = tempfile.mkdtemp()
+    app.config.update(ANALYTICS_SNAPSHOT_DIR=directory)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        db.session.add(User(first_name='Jane', last_name='Doe', email='janedoe@email.com'))
+        db.session.flush()
+        db.session.execute(db.insert(Accounts), [{'owner': 1, 'balance': 0} for _ in range(ACCOUNTS)])
+        seed(rows)
+        try:
+            start = time.perf_counter()
+            analytics.refresh()
+            print('refresh {:>9} rows {:>8.1f} s'.format(rows, time.perf_counter() - start))
+            snapshot = analytics.get_snapshot()
+            print('account 1: {} rows'.format(len(snapshot.account_rows([1]))))
+            for period, periods in (('month', 6), ('month', 24), ('week', 52), ('day', 90)):
+                timings = []
+                for _ in range(20):
+                    start = time.perf_counter()
+                    analytics.insights(snapshot, [1], period, periods, 5)
+                    timings.append(time.perf_counter() - start)
+                print('insights {:<5} x{:<3} median {:>6.1f} ms'.format(
+                    period, periods, statistics.median(timings) * 1000))
+        finally:
+            db.drop_all()
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,64 @@
+"""Read path microbenchmark: ORM hydration vs Core selects mapped into app.queries named tuples
+
+For the latest `rows` transactions of an account, compares
+    - ORM: Transactions.query ... .all() then to_dict() (lazy loads the parties and the type, as the views did)
+    - Core: app.queries.transactions() then TransactionRow.to_dict()
+reporting the best wall time and the memory held per row by the fetched objects (tracemalloc).
+
+Run from the repository root:
+    python -m benchmarks.bench_read_path [rows]
+"""
+import sys
+import time
+import tracemalloc
+from app import create_app, db, queries
+from app.models import Transactions
+from benchmarks.bench_serializers import seed
+
+
+def measure(fn, repeat=5):
+    # Best wall time over repeat runs, then bytes still allocated by one run's result
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    db.session.expunge_all()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = fn()
+    held = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+    del result
+    return min(timings), held
+
+
+def main(rows=10000):
+    app = create_app('testing')
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        seed(rows)
+
+        def orm_rows():
+            return (Transactions.query.filter((Transactions.receiver == 1) | (Transactions.sender == 1))
+                    .order_by(Transactions.date_time.desc(), Transactions.id.desc()).limit(rows).all())
+
+        def core_rows():
+            return queries.transactions(1, rows)
+
+        results = [
+            ('ORM objects', measure(orm_rows)),
+            ('Core + TransactionRow', measure(core_rows)),
+            ('ORM objects + to_dict', measure(lambda: [txn.to_dict() for txn in orm_rows()], repeat=1)),
+            ('Core + TransactionRow.to_dict', measure(lambda: [txn.to_dict() for txn in core_rows()])),
+        ]
+        print('{} rows'.format(rows))
+        for name, (seconds, held) in results:
+            print('{:<32} {:>9.2f} ms {:>12.0f} rows/s {:>8.0f} bytes/row'.format(
+                name, seconds * 1000, rows / seconds, held / rows))
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
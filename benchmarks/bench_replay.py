@@ -0,0 +1,35 @@
+"""Journal replay benchmark: app.projections.replay over a seeded transactions_table
+
+Seeds `rows` transfers between two accounts (two postings each) and reports the replay throughput, from the
+first transaction and from a checkpoint taken halfway. Uses the testing database, set TEST_DATABASE_URL to a
+file to include disk reads.
+
+Run from the repository root:
+    python -m benchmarks.bench_replay [rows]
+"""
+import sys
+from app import create_app, db, projections
+from app.models import Transactions
+from benchmarks.bench_serializers import seed
+
+
+def main(rows=1000000):
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        seed(rows // 2)
+        projections.checkpoint()
+        first = db.session.get(Transactions, 1)
+        db.session.execute(db.insert(Transactions), [
+            {'sender': first.sender, 'receiver': first.receiver, 'amount': i % 100, 'date_time': first.date_time,
+             'transaction_type_id': first.transaction_type_id} for i in range(rows - rows // 2)])
+        db.session.commit()
+        for name, full in [('full replay', True), ('from checkpoint', False)]:
+            result = projections.replay(full=full)
+            print('{:<16} {:>10} postings {:>9.2f} ms {:>12.0f} postings/s'.format(
+                name, result.postings, result.seconds * 1000, result.postings / result.seconds))
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
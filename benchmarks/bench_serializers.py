@@ -0,0 +1,77 @@
+"""Serializer microbenchmark for 10k-row transaction payloads
+
+Compares the original per-object path (ORM Transactions + to_dict + stdlib json) with the column tuple encoders
+from app.encoders serialised through FastJSONProvider (orjson when installed).
+
+Run from the repository root:
+    python -m benchmarks.bench_serializers [rows]
+"""
+import sys
+import time
+from datetime import datetime
+from flask.json.provider import DefaultJSONProvider
+from app import create_app, db
+from app.models import Role, User, Accounts, Transactions, TransactionType
+from app.encoders import transaction_encoder, transaction_select
+
+
+def seed(rows):
+    # Two users with one account each and `rows` transfers between them
+    Role.insert_roles()
+    TransactionType.insert_transaction_types()
+    jane = User(first_name='Jane', last_name='Doe', email='janedoe@email.com')
+    john = User(first_name='John', last_name='Doe', email='johndoe@email.com')
+    db.session.add_all([jane, john])
+    db.session.flush()
+    jane_acc, john_acc = Accounts(owner=jane.id, balance=0), Accounts(owner=john.id, balance=0)
+    db.session.add_all([jane_acc, john_acc])
+    db.session.flush()
+    transfer = TransactionType.query.filter_by(name='Transfer').first()
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Transactions), [
+        {'sender': jane_acc.account_num, 'receiver': john_acc.account_num, 'amount': i % 100,
+         'date_time': now, 'transaction_type_id': transfer.id} for i in range(rows)])
+    db.session.commit()
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(rows=10000):
+    app = create_app('testing')
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        seed(rows)
+        stdlib = DefaultJSONProvider(app)
+        fast = app.json
+        orm_txns = Transactions.query.all()
+
+        def orm_to_dict():
+            return stdlib.dumps([txn.to_dict() for txn in Transactions.query.all()], separators=(',', ':'))
+
+        def rows_encoder():
+            return fast.dumps_bytes(transaction_encoder.encode_all(db.session.execute(transaction_select())),
+                                    separators=(',', ':'))
+
+        payload = [txn.to_dict() for txn in orm_txns]
+        results = [
+            ('stdlib json, prebuilt dicts', best_of(lambda: stdlib.dumps(payload, separators=(',', ':')))),
+            ('FastJSONProvider, prebuilt dicts', best_of(lambda: fast.dumps_bytes(payload, separators=(',', ':')))),
+            ('ORM + to_dict + stdlib json', best_of(orm_to_dict, repeat=1)),
+            ('Core rows + encoder + FastJSONProvider', best_of(rows_encoder)),
+        ]
+        print('{} rows, orjson {}'.format(rows, 'enabled' if fast.uses_orjson else 'not installed'))
+        for name, seconds in results:
+            print('{:<42} {:>9.2f} ms {:>12.0f} rows/s'.format(name, seconds * 1000, rows / seconds))
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,57 @@
+"""Sharded ledger write benchmark: app.shards.ShardRouter deposits and transfers with concurrent writer processes
+
+For 1, 2 and 4 shard files in a temporary directory, `workers` processes each run `operations` deposits, then the
+same number of transfers between random accounts (cross-shard ones use the two-phase commit), and the aggregate
+operations per second are reported. Each shard has its own SQLite writer, so throughput should grow with the
+shard count until the disk or the CPUs saturate.
+
+Run from the repository root:
+    python -m benchmarks.bench_shards [operations] [workers]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+from app.shards import ShardRouter
+
+ACCOUNTS = 10000
+TYPES = {'Deposit': 2, 'Transfer': 3}
+
+
+def run(args):
+    urls, kind, operations, seed = args
+    router = ShardRouter(urls, TYPES, lambda account_num: 1e12)
+    rng = random.Random(seed)
+    for _ in range(operations):
+        if kind == 'deposit':
+            router.deposit(rng.randrange(1, ACCOUNTS), 1)
+        else:
+            sender, recipient = rng.sample(range(1, ACCOUNTS), 2)
+            router.transfer(sender, recipient, 1)
+    router.dispose()
+    return dict(router.transfers)
+
+
+def main(operations=2000, workers=4):
+    print('{:>6} {:>9} {:>12} {:>14}'.format('shards', 'kind', 'ops/s', 'two-phase'))
+    for count in (1, 2, 4):
+        directory = tempfile.mkdtemp()
+        try:
+            urls = ['sqlite:///' + os.path.join(directory, 'shard-{}.sqlite'.format(shard)) for shard in range(count)]
+            ShardRouter(urls, TYPES, lambda account_num: 0).dispose()
+            with Pool(workers) as pool:
+                for kind in ('deposit', 'transfer'):
+                    start = time.perf_counter()
+                    results = pool.map(run, [(urls, kind, operations, worker) for worker in range(workers)])
+                    seconds = time.perf_counter() - start
+                    two_phase = sum(result.get('two_phase', 0) for result in results)
+                    print('{:>6} {:>9} {:>12.0f} {:>14}'.format(count, kind, operations * workers / seconds, two_phase))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
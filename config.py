@@ -7,6 +7,94 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard to guess sting' # used as an encrpyption or signing key. Flask uses this key in its mechanism for csrf protection
     
+    # Idempotency-Key support for POST deposit / transfer API routes
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE') or 10000) # completed keys kept in the in-memory LRU
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL') or 86400) # seconds before a key may be reused
+    IDEMPOTENCY_WAIT_TIMEOUT = 10 # seconds a duplicate waits on the in-flight first request before answering 409
+    IDEMPOTENCY_LEASE = int(os.environ.get('IDEMPOTENCY_LEASE') or 60) # seconds an in-flight key stays claimed, keys left by a crashed worker are reclaimed after it
+    IDEMPOTENCY_POLL_INTERVAL = 0.05
+    
+    # Negotiated gzip / deflate compression of API responses. Level 0 disables compression
+    API_COMPRESSION_LEVEL = int(os.environ.get('API_COMPRESSION_LEVEL') or 6)
+    API_COMPRESSION_MIN_SIZE = int(os.environ.get('API_COMPRESSION_MIN_SIZE') or 1024) # bytes, smaller buffered bodies are sent uncompressed
+    
+    # Cursor pagination of GET /api/users/<id>/transactions
+    API_TRANSACTIONS_PER_PAGE = 50 # page size when only a cursor is given
+    API_TRANSACTIONS_MAX_PER_PAGE = 1000
+    
+    # Spending insights (GET /api/users/<id>/insights), from the analytics snapshot
+    API_INSIGHTS_PERIODS = 6 # periods returned when ?periods= is not given
+    API_INSIGHTS_MAX_PERIODS = 60
+    API_INSIGHTS_COUNTERPARTIES = 5 # counterparties returned when ?limit= is not given
+    
+    # Staff user directory search (GET /api/users?q=)
+    API_USERS_PER_PAGE = 20
+    API_USERS_MAX_PER_PAGE = 100
+    
+    # In-memory Bloom filters answering "definitely not registered" for emails and account numbers
+    BLOOM_FILTER_ENABLED = (os.environ.get('BLOOM_FILTER_ENABLED') or 'true').lower() == 'true'
+    BLOOM_FILTER_MIN_CAPACITY = int(os.environ.get('BLOOM_FILTER_MIN_CAPACITY') or 100000) # items, filters are sized for at least twice the table
+    BLOOM_FILTER_ERROR_RATE = 0.01 # target false positive rate at capacity
+    
+    # Pay-by-email / phone alias lookups (app.aliases)
+    PAYMENT_ALIAS_CACHE_SIZE = int(os.environ.get('PAYMENT_ALIAS_CACHE_SIZE') or 100000) # aliases kept in the in-memory index
+    PAYMENT_ALIAS_CACHE_TTL = 300 # seconds before a cached alias is read again, bounds staleness across processes
+    
+    # Per-account ring buffers of the latest transactions shown on the dashboard (app.recent)
+    RECENT_TRANSACTIONS_SIZE = 20 # transactions kept per account, and shown on the index page
+    RECENT_TRANSACTIONS_MEMORY_BUDGET = int(os.environ.get('RECENT_TRANSACTIONS_MEMORY_BUDGET') or 64 * 1024 * 1024) # serialized bytes across all accounts
+    
+    # Serialized JSON of immutable transactions, reused by the transaction endpoints (app.fragments)
+    TRANSACTION_FRAGMENT_CACHE_BYTES = int(os.environ.get('TRANSACTION_FRAGMENT_CACHE_BYTES') or 32 * 1024 * 1024)
+    TRANSACTION_FRAGMENT_SPILL_PATH = os.environ.get('TRANSACTION_FRAGMENT_SPILL_PATH') # dbm file prefix for evicted fragments, no spill when unset
+    TRANSACTION_FRAGMENT_SPILL_BYTES = int(os.environ.get('TRANSACTION_FRAGMENT_SPILL_BYTES') or 256 * 1024 * 1024) # fragment bytes kept in the spill files
+    
+    # Hot accounts taking credits in sub-balance slots (app.ledger, flask hot-account / fold-balances)
+    HOT_ACCOUNT_SLOTS = int(os.environ.get('HOT_ACCOUNT_SLOTS') or 16) # default slots of a newly flagged account, credit throughput scales with it
+    
+    # Batched netting settlement of transfers (app.ledger.settle, flask settle-transfers)
+    TRANSFER_NETTING = (os.environ.get('TRANSFER_NETTING') or 'false').lower() == 'true' # transfers reserve funds and wait for settlement
+    SETTLEMENT_BATCH_SIZE = int(os.environ.get('SETTLEMENT_BATCH_SIZE') or 5000) # pending postings settled per database transaction
+    
+    # Balances replayed from the transaction journal (app.projections, flask replay-ledger / checkpoint-ledger)
+    LEDGER_REPLAY_CHUNK_SIZE = int(os.environ.get('LEDGER_REPLAY_CHUNK_SIZE') or 500000) # transaction ids netted per query
+    LEDGER_CHECKPOINTS_KEPT = 3
+    
+    # In-memory ledger engine for deposits and transfers, persisted through a write-ahead log (app.engine). Single process only
+    LEDGER_ENGINE_ENABLED = (os.environ.get('LEDGER_ENGINE_ENABLED') or 'false').lower() == 'true'
+    LEDGER_ENGINE_WAL_PATH = os.environ.get('LEDGER_ENGINE_WAL_PATH') or os.path.join(basedir, 'ledger-engine.wal')
+    LEDGER_ENGINE_LOCK_STRIPES = 64
+    LEDGER_ENGINE_FLUSH_INTERVAL = float(os.environ.get('LEDGER_ENGINE_FLUSH_INTERVAL') or 0.5) # seconds between batch commits, 0 disables the flusher thread
+    LEDGER_ENGINE_FLUSH_BATCH_SIZE = 50000 # postings committed per database transaction
+    LEDGER_ENGINE_FSYNC = (os.environ.get('LEDGER_ENGINE_FSYNC') or 'true').lower() == 'true' # fsync the log after every posting
+    
+    # Monthly archive files of old transactions, attached to history reads (app.archive, flask archive-transactions)
+    TRANSACTION_ARCHIVE_DIR = os.environ.get('TRANSACTION_ARCHIVE_DIR') or os.path.join(basedir, 'archive')
+    TRANSACTION_ARCHIVE_HORIZON_DAYS = int(os.environ.get('TRANSACTION_ARCHIVE_HORIZON_DAYS') or 90) # only whole months older than this are archived
+    TRANSACTION_ARCHIVE_COMPRESS = (os.environ.get('TRANSACTION_ARCHIVE_COMPRESS') or 'false').lower() == 'true' # gzip closed months, expanded to TRANSACTION_ARCHIVE_DIR/cache on first read
+    TRANSACTION_ARCHIVE_MAX_ATTACHED = 8 # archives kept attached per connection, SQLite allows 10 by default
+    
+    # Account balances hash-sharded over several SQLite files, one writer each (app.shards, flask sync-shards). 0 disables
+    LEDGER_SHARDS = int(os.environ.get('LEDGER_SHARDS') or 0) # must not change once shards hold balances
+    LEDGER_SHARD_URL = os.environ.get('LEDGER_SHARD_URL') or 'sqlite:///' + os.path.join(basedir, 'ledger-shard-{}.sqlite') # {} is the shard index
+    LEDGER_SHARD_RECOVERY_GRACE = 30 # seconds before an unfinished cross-shard transfer is recovered
+    LEDGER_SHARD_SYNC_BATCH_SIZE = 5000 # shard journal rows published to the main database per transaction
+    
+    # Banks served from one application, each with its own database (app.tenancy, flask tenant-init / tenant-upgrade)
+    TENANTS = tuple(name.strip() for name in (os.environ.get('TENANTS') or '').split(',') if name.strip()) # empty for a single bank
+    TENANT_HOSTS = dict(pair.strip().split('=', 1) for pair in (os.environ.get('TENANT_HOSTS') or '').split(',') if pair.strip()) # host=tenant pairs
+    TENANT_DATABASE_URL = os.environ.get('TENANT_DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'tenant-{}.sqlite') # {} is the tenant name
+    TENANT_ENGINES_MAX = int(os.environ.get('TENANT_ENGINES_MAX') or 32) # tenant engines kept open, least recently used first disposed
+    
+    # Inter-bank clearing files (app.clearing, flask clearing export / import)
+    CLEARING_BANK_CODE = os.environ.get('CLEARING_BANK_CODE') or 'BANKWEBAPP' # this bank's code, in file headers
+    CLEARING_FILE_FORMAT = os.environ.get('CLEARING_FILE_FORMAT') or 'fixed' # "fixed" (fixed-width) or "csv", for files not named *.csv
+    CLEARING_CHUNK_SIZE = 10000 # records posted, or entries read, per chunk
+    
+    # Columnar snapshot of the transaction journal for analytics (app.analytics, flask refresh-analytics)
+    ANALYTICS_SNAPSHOT_DIR = os.environ.get('ANALYTICS_SNAPSHOT_DIR') or os.path.join(basedir, 'analytics')
+    ANALYTICS_CHUNK_SIZE = 100000 # transactions read from the database per chunk
+    
     @staticmethod
     def init_app(app):
         pass
@@ -16,6 +16,10 @@ logger = logging.getLogger('alembic.env')
 
 
 def get_engine():
+    from app import tenancy
+    if tenancy.current() is not None:
+        # flask tenant-init / tenant-upgrade: the tenant's database
+        return tenancy.get_engine(tenancy.current())
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
         return current_app.extensions['migrate'].db.get_engine()
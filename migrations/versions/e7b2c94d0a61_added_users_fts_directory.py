@@ -0,0 +1,47 @@
+"""added users_fts full-text directory
+
+Revision ID: e7b2c94d0a61
+Revises: c5e1a8d34f92
+Create Date: 2026-10-18 12:41:55.094127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2c94d0a61'
+down_revision = 'c5e1a8d34f92'
+branch_labels = None
+depends_on = None
+
+USERS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        first_name, last_name, email,
+        content='users_table', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_insert AFTER INSERT ON users_table BEGIN
+        INSERT INTO users_fts(rowid, first_name, last_name, email) VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_delete AFTER DELETE ON users_table BEGIN
+        INSERT INTO users_fts(users_fts, rowid, first_name, last_name, email) VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_after_update AFTER UPDATE OF first_name, last_name, email ON users_table BEGIN
+        INSERT INTO users_fts(users_fts, rowid, first_name, last_name, email) VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO users_fts(rowid, first_name, last_name, email) VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+]
+
+
+def upgrade():
+    for statement in USERS_FTS_DDL:
+        op.execute(statement)
+    # Index the users that already exist
+    op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS users_fts_after_update')
+    op.execute('DROP TRIGGER IF EXISTS users_fts_after_delete')
+    op.execute('DROP TRIGGER IF EXISTS users_fts_after_insert')
+    op.execute('DROP TABLE IF EXISTS users_fts')
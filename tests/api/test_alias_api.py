@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from app import create_app, db, tenancy
+from app.models import Role, TransactionType, Accounts, PaymentAlias
+from app import aliases
+
+
+class PaymentAliasAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def transfer(self, headers, **data):
+        return self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=headers, json=data)
+
+
+    def test_transfer_by_alias(self):
+        """
+        Given two registered users, the sender holding funds
+
+        # 1
+        When the sender transfers to the recipient's email and then to a phone number the recipient registered
+        Then verify that both transfers reach the recipient's account, each one resolving the alias from the
+        database while lookups that move no money are served from memory
+
+        # 2
+        When the recipient changes email
+        Then verify that the old email no longer resolves (404) and the new one does
+
+        # 3
+        When aliases are invalid, unknown, already taken or not phone numbers
+        Then verify that they are rejected
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        john = self.register('John', 'Doe', 'johndoe@email.com')
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=jane, json={'deposit_amount': 20})
+
+        # 1
+        self.assertEqual(self.transfer(jane, to_alias='JohnDoe@email.com', amount=5).status_code, 201)
+        response = self.client.post('http://localhost:5000/api/users/2/aliases', headers=john, json={'alias': '+65 9123-4567'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json, {'alias': '+6591234567', 'kind': 'phone', 'account_num': 2})
+        self.assertEqual(self.transfer(jane, to_alias='+6591234567', amount=2).status_code, 201)
+        self.assertEqual(self.transfer(jane, to_alias='+65 91234567', amount=1).status_code, 201)
+        self.assertEqual(db.session.get(Accounts, 2).balance, 8)
+        self.assertEqual(aliases.get_index().hits, 0)
+        self.assertEqual(aliases.resolve('+65 91234567'), 2)
+        self.assertEqual(aliases.get_index().hits, 1)
+        response = self.client.get('http://localhost:5000/api/users/2/aliases', headers=john)
+        self.assertEqual([alias['alias'] for alias in response.json['aliases']], ['johndoe@email.com', '+6591234567'])
+
+        # 2
+        response = self.client.put('http://localhost:5000/api/users/2/change_email', headers=john, json={'new_email': 'john@email.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.transfer(jane, to_alias='johndoe@email.com', amount=1).status_code, 404)
+        self.assertEqual(self.transfer(jane, to_alias='john@email.com', amount=1).status_code, 201)
+
+        # 3
+        self.assertEqual(self.transfer(jane, to_alias='not-an-alias', amount=1).status_code, 400)
+        self.assertEqual(self.transfer(jane, to_alias='+10000000000', amount=1).status_code, 404)
+        response = self.client.post('http://localhost:5000/api/users/1/aliases', headers=jane, json={'alias': '+6591234567'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('http://localhost:5000/api/users/1/aliases', headers=jane, json={'alias': 'jane@email.com'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('http://localhost:5000/api/users/1/aliases', headers=jane, json={'alias': '12345678', 'account_num': 2})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('http://localhost:5000/api/users/2/aliases', headers=jane).status_code, 403)
+
+
+    def test_alias_registered_concurrently(self):
+        """
+        Given a phone number registered by another request after this one checked it was free
+        When the alias is saved
+        Then verify that the request is rejected as a conflict (409) and the first registration is kept
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+        db.session.add(PaymentAlias(alias='+6591234567', kind='phone', user_id=2, account_num=2))
+        db.session.commit()
+        with patch.object(PaymentAlias, 'query') as query:
+            query.filter_by.return_value.first.return_value = None
+            response = self.client.post('http://localhost:5000/api/users/1/aliases', headers=jane,
+                                        json={'alias': '+6591234567'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(aliases.resolve('+6591234567', fresh=True), 2)
+
+    def test_alias_moved_by_another_instance(self):
+        """
+        Given two application instances (worker processes) sharing one bank database, the second one having
+        transferred to John's email
+
+        # 1
+        When John changes email through the first instance and Jim registers John's old email there
+        Then verify that the second instance's next transfer to that email reaches Jim, not John
+        """
+        directory = tempfile.mkdtemp()
+        instances = []
+        try:
+            for _ in range(2):
+                app = create_app('testing')
+                app.config.update(TENANTS=('acme',),
+                                  TENANT_DATABASE_URL='sqlite:///' + os.path.join(directory, 'tenant-{}.sqlite'))
+                tenancy.init_app(app)
+                instances.append(app)
+            with instances[0].app_context(), tenancy.use('acme'):
+                db.metadata.create_all(db.session.get_bind())
+                Role.insert_roles()
+                TransactionType.insert_transaction_types()
+            first, second = (app.test_client(use_cookies=True) for app in instances)
+            headers = {}
+            for first_name in ['Jane', 'John']:
+                email = first_name.lower() + 'doe@email.com'
+                first.post('http://acme.localhost/api/users', json={
+                    'first_name': first_name, 'last_name': 'Doe', 'email': email, 'password': 'testpassword'})
+                response = first.post('http://acme.localhost/api/tokens', auth=(email, 'testpassword'))
+                headers[first_name] = {'Authorization': 'Bearer '+response.json['token']}
+            first.post('http://acme.localhost/api/users/1/accounts/1/deposit', headers=headers['Jane'],
+                       json={'deposit_amount': 10})
+            response = second.post('http://acme.localhost/api/users/1/accounts/1/transfer', headers=headers['Jane'],
+                                   json={'to_alias': 'johndoe@email.com', 'amount': 1})
+            self.assertEqual(response.status_code, 201)
+
+            # 1
+            response = first.put('http://acme.localhost/api/users/2/change_email', headers=headers['John'],
+                                 json={'new_email': 'john@email.com'})
+            self.assertEqual(response.status_code, 200)
+            first.post('http://acme.localhost/api/users', json={
+                'first_name': 'Jim', 'last_name': 'Doe', 'email': 'johndoe@email.com', 'password': 'testpassword'})
+            response = second.post('http://acme.localhost/api/users/1/accounts/1/transfer', headers=headers['Jane'],
+                                   json={'to_alias': 'johndoe@email.com', 'amount': 2})
+            self.assertEqual(response.status_code, 201)
+            with instances[0].app_context(), tenancy.use('acme'):
+                self.assertEqual([account.balance for account in Accounts.query.order_by(Accounts.account_num)],
+                                 [7, 1, 2])
+        finally:
+            for app in instances:
+                app.extensions['tenant_engines'].dispose()
+            shutil.rmtree(directory)
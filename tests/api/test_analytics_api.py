@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import event
+from app import create_app, db, analytics, archive, projections
+from app.models import Role, TransactionType, Transactions, User
+
+
+class AnalyticsAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        The analytics snapshot and archived months are written to temporary directories.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(ANALYTICS_SNAPSHOT_DIR=os.path.join(self.directory, 'analytics'),
+                               TRANSACTION_ARCHIVE_DIR=os.path.join(self.directory, 'archive'), ANALYTICS_CHUNK_SIZE=3)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.statements = []
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, first_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': 'Doe', 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def record(self, sender, receiver, amount, type_name, date_time):
+        # Backdated journal row, balances are not read by analytics
+        type_id = db.session.execute(db.select(TransactionType.id).where(TransactionType.name == type_name)).scalar()
+        db.session.add(Transactions(sender=sender, receiver=receiver, amount=amount, date_time=date_time,
+                                    transaction_type_id=type_id))
+        db.session.commit()
+
+    def sql(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+    def test_snapshot_appends_new_transactions(self):
+        """
+        Given three accounts and a snapshot refreshed once
+        When two transactions are recorded, a refresh was interrupted after appending bytes, and it is refreshed again
+        Then only the new transactions are appended, the stray bytes are cut and earlier snapshots keep their rows
+        """
+        for name in ('Jane', 'John', 'Jack'):
+            self.register(name, name.lower() + 'doe@email.com')
+        self.assertIsNone(analytics.get_snapshot())
+        self.assertEqual(analytics.refresh(), 3)
+        first = analytics.get_snapshot()
+        self.assertEqual((first.rows, first.last_id), (3, 3))
+
+        now = datetime.utcnow()
+        self.record(1, 2, 50, 'Transfer', now)
+        self.record(3, 3, 20, 'Withdrawal', now)
+        with open(os.path.join(analytics.snapshot_directory(), 'amount'), 'ab') as column:
+            column.write(b'torn')
+        self.assertEqual(analytics.refresh(), 2)
+        snapshot = analytics.get_snapshot()
+        self.assertEqual(list(snapshot['id']), [1, 2, 3, 4, 5])
+        self.assertEqual(list(snapshot['sender']), [1, 2, 3, 1, 3])
+        self.assertEqual(list(snapshot['amount']), [0, 0, 0, 50, 20])
+        self.assertEqual(list(snapshot.debits()), [False, False, False, True, True])
+        self.assertEqual(int(snapshot['timestamp'][-1]), int((now - datetime(1970, 1, 1)).total_seconds()))
+        for name, dtype in analytics.COLUMNS:
+            self.assertEqual(os.path.getsize(os.path.join(analytics.snapshot_directory(), name)),
+                             5 * np.dtype(dtype).itemsize)
+        self.assertEqual(first.rows, 3)
+        self.assertEqual(list(first['id']), [1, 2, 3])
+        self.assertEqual(analytics.refresh(), 0)
+
+    def test_snapshot_covers_archived_months(self):
+        """
+        Given transactions of January 2024 moved to an archive file, and newer ones
+        When the snapshot is built
+        Then it holds the archived transactions and the ones left in transactions_table, accounts opened before
+        January included, and a refresh finds nothing new
+        """
+        for name in ('Jane', 'John'):
+            self.register(name, name.lower() + 'doe@email.com')
+        for day in (3, 4, 5, 6):
+            self.record(1, 2, day, 'Transfer', datetime(2024, 1, day))
+        self.record(2, 1, 7, 'Transfer', datetime.utcnow())
+        checkpoint = projections.checkpoint()
+        self.assertTrue(archive.archive_transactions(checkpoint.txn_id, before=datetime(2024, 2, 15), compress=False))
+        self.assertEqual(db.session.execute(db.select(db.func.count()).select_from(Transactions)).scalar(), 3)
+        self.assertEqual(analytics.refresh(), 7)
+        snapshot = analytics.get_snapshot()
+        self.assertEqual(list(snapshot['id']), [3, 4, 5, 6, 1, 2, 7])
+        self.assertEqual(list(snapshot['amount']), [3, 4, 5, 6, 0, 0, 7])
+        self.assertEqual(snapshot.last_id, 7)
+        self.assertEqual(analytics.refresh(), 0)
+
+    def test_admin_analytics(self):
+        """
+        Given transfers and a withdrawal over this month and the previous one
+        When an administrator reads the analytics, before and after the snapshot is refreshed
+        Then spending is summed per month and type, accounts are ranked by transfers received, and no statement
+        reads transactions_table
+        """
+        headers = self.register('Admin', 'admin@bank.com')
+        admin = User.query.filter_by(email='admin@bank.com').first()
+        admin.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        user = self.register('John', 'johndoe@email.com')
+        self.register('Jack', 'jackdoe@email.com')
+        this_month = datetime.utcnow().replace(day=1, hour=12)
+        previous_month = (this_month - timedelta(days=1)).replace(day=1)
+        self.record(1, 2, 50, 'Transfer', previous_month)
+        self.record(1, 2, 30, 'Transfer', previous_month)
+        self.record(3, 1, 10, 'Transfer', previous_month)
+        self.record(1, 1, 20, 'Withdrawal', this_month)
+        self.record(2, 3, 5, 'Transfer', this_month)
+
+        response = self.client.get('http://localhost:5000/api/admin/analytics', headers=headers)
+        self.assertEqual(response.status_code, 503)
+        analytics.refresh()
+        response = self.client.get('http://localhost:5000/api/admin/analytics', headers=user)
+        self.assertEqual(response.status_code, 403)
+        event.listen(db.engine, 'before_cursor_execute', self.sql)
+        try:
+            response = self.client.get('http://localhost:5000/api/admin/analytics?months=2&limit=2', headers=headers)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', self.sql)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([statement for statement in self.statements if 'transactions_table' in statement])
+        months = [previous_month.strftime('%Y-%m'), this_month.strftime('%Y-%m')]
+        self.assertCountEqual(response.json['spending'], [
+            {'month': months[0], 'type': 'Transfer', 'amount': 90.0, 'transactions': 3},
+            {'month': months[1], 'type': 'Transfer', 'amount': 5.0, 'transactions': 1},
+            {'month': months[1], 'type': 'Withdrawal', 'amount': 20.0, 'transactions': 1},
+        ])
+        self.assertEqual(response.json['top_counterparties'], [
+            {'account_num': 2, 'amount': 80.0, 'transactions': 2},
+            {'account_num': 1, 'amount': 10.0, 'transactions': 1},
+        ])
+        self.assertEqual(response.json['_meta']['last_txn_id'], 8)
+        response = self.client.get('http://localhost:5000/api/admin/metrics', headers=headers)
+        self.assertEqual(response.json['analytics_snapshot']['rows'], 8)
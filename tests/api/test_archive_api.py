@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from app import create_app, db, archive, projections, queries, recent, clearing
+from app.models import Role, TransactionType, Accounts, Transactions, ArchivePartition, Posting, ClearingEntry
+
+
+class ArchiveAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        A single archive is kept attached, so reading several months detaches the others.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(TRANSACTION_ARCHIVE_DIR=self.directory, TRANSACTION_ARCHIVE_MAX_ATTACHED=1)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def record(self, sender, receiver, amount, type_name, date_time):
+        # Backdated transaction, with the balances it implies
+        type_id = db.session.execute(db.select(TransactionType.id).where(TransactionType.name == type_name)).scalar()
+        db.session.add(Transactions(sender=sender, receiver=receiver, amount=amount, date_time=date_time,
+                                    transaction_type_id=type_id))
+        if sender != receiver:
+            db.session.execute(db.update(Accounts).where(Accounts.account_num == sender)
+                               .values(balance=Accounts.balance - amount))
+        db.session.execute(db.update(Accounts).where(Accounts.account_num == receiver)
+                           .values(balance=Accounts.balance + amount))
+        db.session.commit()
+
+    def ids(self, url, headers):
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [transaction['id'] for transaction in response.json['transactions']], response.json['_meta']
+
+
+    def test_archive_transactions(self):
+        """
+        Given two users with transactions in January, February and March 2024 and one today
+
+        # 1
+        When January and then February are archived, February compressed
+        Then verify that their transactions leave the hot tables for read-only monthly files, and that archiving again is a no-op
+
+        # 2
+        When the user's history is requested, whole, by page, for a date range and with fields
+        Then verify that archived transactions are listed in order with the hot ones
+
+        # 3
+        When archived transactions and balances as of archived dates are requested
+        Then verify that they are found in the archive
+
+        # 4
+        When the balances are replayed from the whole journal
+        Then verify that the archived transactions are included
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        john = self.register('John', 'Doe', 'johndoe@email.com')
+        self.record(1, 1, 10, 'Deposit', datetime(2024, 1, 15))
+        self.record(1, 2, 4, 'Transfer', datetime(2024, 2, 10))
+        self.record(1, 1, 1, 'Deposit', datetime(2024, 3, 5))
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=jane, json={'deposit_amount': 5})
+
+        # 1
+        checkpoint = projections.checkpoint()
+        january = archive.archive_transactions(checkpoint.txn_id, before=datetime(2024, 2, 15), compress=False)
+        february = archive.archive_transactions(checkpoint.txn_id, before=datetime(2024, 3, 20), compress=True)
+        self.assertEqual([(partition.month, partition.transactions, partition.min_txn_id) for partition in january + february],
+                         [('2024-01', 1, 3), ('2024-02', 1, 4)])
+        self.assertEqual(archive.archive_transactions(checkpoint.txn_id, before=datetime(2024, 3, 20)), [])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['manifest', 'transactions-2024-01.sqlite', 'transactions-2024-02.sqlite.gz'])
+        self.assertFalse(os.stat(os.path.join(self.directory, 'transactions-2024-01.sqlite')).st_mode & 0o222)
+        self.assertEqual(sorted(id for id, in db.session.execute(db.select(Transactions.id))), [1, 2, 5, 6])
+
+        # 2
+        url = 'http://localhost:5000/api/users/1/transactions'
+        self.assertEqual(self.ids(url, jane)[0], [6, 1, 5, 4, 3])
+        self.assertEqual(self.ids(url + '?sort=asc', jane)[0], [3, 4, 5, 1, 6])
+        pages, cursor = [], None
+        while True:
+            ids, meta = self.ids(url + '?limit=2' + ('&cursor=' + cursor if cursor else ''), jane)
+            pages.append(ids)
+            cursor = meta['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[6, 1], [5, 4], [3]])
+        self.assertEqual(self.ids(url + '?from=2024-01-01&to=2024-02-29', jane)[0], [4, 3])
+        response = self.client.get(url + '?fields=id,from,amount&to=2024-02-29', headers=jane)
+        self.assertEqual(response.json['transactions'], [{'id': 4, 'from': 'Jane Doe', 'amount': 4},
+                                                         {'id': 3, 'from': 'Jane Doe', 'amount': 10}])
+        self.assertEqual(self.ids('http://localhost:5000/api/users/2/transactions', john)[0], [2, 4])
+
+        # 3
+        response = self.client.get('http://localhost:5000/api/users/2/transactions/4', headers=john)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json['from_acc'], response.json['to_acc'], response.json['amount']), (1, 2, 4))
+        response = self.client.get('http://localhost:5000/api/users/2/transactions/3', headers=john)
+        self.assertEqual(response.status_code, 400)
+        account_url = 'http://localhost:5000/api/users/1/accounts/1?as_of='
+        self.assertEqual(self.client.get(account_url + '2024-01-31', headers=jane).json['balance'], 10)
+        self.assertEqual(self.client.get(account_url + '2024-03-31', headers=jane).json['balance'], 7)
+        self.assertEqual(self.client.get(account_url + datetime.utcnow().date().isoformat(), headers=jane).json['balance'], 12)
+
+        # 4
+        result, mismatches = projections.rebuild_balances(full=True, dry_run=True)
+        self.assertEqual(mismatches, [])
+        self.assertEqual(result.balances, {1: 12, 2: 4})
+        self.assertEqual(ArchivePartition.query.count(), 2)
+
+
+    def test_recent_transactions_all_archived(self):
+        """
+        Given an account opened in January 2024 whose transactions were all archived, and an account with one
+        transaction left in the hot tables
+        When their recent transactions are requested
+        Then verify that they are read from the archived months, newest first, after the hot ones, and that later
+        reads are served from the ring buffer: the account's high-water mark still counts its archived transactions
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+        db.session.execute(db.update(Transactions).where(Transactions.id == 1).values(date_time=datetime(2024, 1, 2)))
+        db.session.execute(db.update(Posting).where(Posting.txn_id == 1).values(date_time=datetime(2024, 1, 2)))
+        db.session.commit()
+        self.record(1, 1, 10, 'Deposit', datetime(2024, 1, 15))
+        self.record(1, 2, 4, 'Transfer', datetime(2024, 2, 10))
+        checkpoint = projections.checkpoint()
+        archive.archive_transactions(checkpoint.txn_id, before=datetime(2024, 3, 1), compress=False)
+        self.assertEqual(sorted(id for id, in db.session.execute(db.select(Transactions.id))), [2])
+
+        response = self.client.get('http://localhost:5000/api/users/1/accounts/1/recent_transactions', headers=jane)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(txn['id'], txn['amount']) for txn in response.json['transactions']], [(4, 4), (3, 10), (1, 0)])
+        self.assertEqual([txn.id for txn in queries.transactions(2, 10)], [2, 4])
+        self.assertEqual([txn.id for txn in queries.transactions(1, 2)], [4, 3])
+        self.assertEqual([(account_num, latest_id) for account_num, _, latest_id in Accounts.ledger_marks(1)], [(1, 4)])
+        misses = recent.get_cache().misses
+        response = self.client.get('http://localhost:5000/api/users/1/accounts/1/recent_transactions', headers=jane)
+        self.assertEqual(len(response.json['transactions']), 3)
+        self.assertEqual(recent.get_cache().misses, misses)
+
+        # The dashboard lists them too
+        self.client.post('/auth/login', data={'email': 'janedoe@email.com', 'password': 'testpassword'})
+        self.assertEqual(self.client.get('/index').data.count(b'<li class="transaction">'), 3)
+
+    def test_archive_month_with_interbank_transfers(self):
+        """
+        Given two transfers to another bank in January 2024, only the first one exported in a clearing file
+
+        # 1
+        When January is archived
+        Then verify that the exported transfer leaves with its clearing entry, the pending one stays hot with its
+        entry, and no clearing entry refers to a transaction missing from its database
+
+        # 2
+        When the pending transfer is exported and the balances replayed from the whole journal
+        Then verify that it is exported once and the archived transfer is still counted
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.record(1, 1, 100, 'Deposit', datetime(2024, 1, 5))
+        url = 'http://localhost:5000/api/users/1/accounts/1/interbank_transfer'
+        for amount in (30, 20):
+            response = self.client.post(url, headers=jane, json={'bank_code': 'OTHERBANK', 'amount': amount,
+                                                                 'to_account': 'GB29NWBK60161331926819'})
+            self.assertEqual(response.status_code, 201)
+            if amount == 30:
+                clearing.export_file(os.path.join(self.directory, 'outbound-1.txt'))
+        db.session.execute(db.update(Transactions).where(Transactions.id.in_([3, 4])).values(date_time=datetime(2024, 1, 20)))
+        db.session.execute(db.update(Posting).where(Posting.txn_id.in_([3, 4])).values(date_time=datetime(2024, 1, 20)))
+        db.session.commit()
+
+        # 1
+        checkpoint = projections.checkpoint()
+        partitions = archive.archive_transactions(checkpoint.txn_id, before=datetime(2024, 2, 15), compress=False)
+        self.assertEqual([partition.transactions for partition in partitions], [2])
+        self.assertEqual(sorted(id for id, in db.session.execute(db.select(Transactions.id))), [1, 4])
+        self.assertEqual([(entry.txn_id, entry.amount) for entry in ClearingEntry.query], [(4, 20)])
+        archived = archive.execute(db.select(ClearingEntry.txn_id, ClearingEntry.amount, ClearingEntry.clearing_file_id),
+                                   partitions)
+        self.assertEqual([tuple(row) for row in archived], [(3, 30, 1)])
+        dangling = db.select(ClearingEntry.id).where(~ClearingEntry.txn_id.in_(db.select(Transactions.id)))
+        self.assertEqual(db.session.execute(dangling).all(), [])
+
+        # 2
+        exported = clearing.export_file(os.path.join(self.directory, 'outbound-2.txt'))
+        self.assertEqual((exported.entries, exported.total), (1, 20))
+        result, mismatches = projections.rebuild_balances(full=True, dry_run=True)
+        self.assertEqual(mismatches, [])
+        self.assertEqual(result.balances, {1: 50})
@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, tenancy
+from app.models import Role, TransactionType, User, Accounts
+
+
+class BloomFilterAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, first_name, last_name, email):
+        return self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+
+    def get_token(self, email):
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return response.json['token']
+
+
+    def test_registration_and_transfer_checks(self):
+        """
+        Given an administrator and a registered user with a funded account
+
+        # 1
+        When an email is registered twice
+        Then verify that the second registration is rejected (400)
+
+        # 2
+        When money is transferred to an account number that does not exist
+        Then verify that the transfer is rejected (404) and no balance changes
+
+        # 3
+        When the administrator reads the metrics
+        Then verify that the size and false positive rate of both filters are reported
+        """
+        self.assertEqual(self.register('admin', 'staff', 'admin@bank.com').status_code, 201)
+        self.assertEqual(self.register('Jane', 'Doe', 'janedoe@email.com').status_code, 201)
+        admin = User.query.filter_by(email='admin@bank.com').first()
+        admin.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        token = self.get_token('janedoe@email.com')
+        headers = {'Authorization': 'Bearer '+token}
+        self.client.post('http://localhost:5000/api/users/2/accounts/2/deposit', headers=headers, json={'deposit_amount': 10})
+
+        # 1
+        response = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.assertEqual(response.status_code, 400)
+
+        # 2
+        response = self.client.post('http://localhost:5000/api/users/2/accounts/2/transfer', headers=headers,
+                                    json={'to_account_num': 99, 'amount': 5})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('http://localhost:5000/api/users/2/accounts', headers=headers)
+        self.assertEqual(response.json['_meta']['total_balance'], 10)
+
+        # 3
+        response = self.client.get('http://localhost:5000/api/admin/metrics', headers=headers)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('http://localhost:5000/api/admin/metrics',
+                                   headers={'Authorization': 'Bearer '+self.get_token('admin@bank.com')})
+        self.assertEqual(response.status_code, 200)
+        for name in ['emails', 'accounts']:
+            metrics = response.json['bloom_filters'][name]
+            self.assertTrue(metrics['built'])
+            self.assertGreater(metrics['size_bytes'], 0)
+            self.assertLess(metrics['estimated_false_positive_rate'], 0.01)
+        self.assertEqual(response.json['bloom_filters']['accounts']['definite_negatives'], 1)
+
+
+    def test_email_changed_by_another_process(self):
+        """
+        Given a registered user whose email is changed by another process, unseen by this process' email filter
+
+        # 1
+        When the new email is registered through the API, then through the registration form
+        Then verify that both registrations are rejected as a taken email (400, form error) rather than failing
+
+        # 2
+        When another user changes their email to it
+        Then verify that the change is rejected (400)
+        """
+        self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+        db.session.execute(db.update(User.__table__).where(User.__table__.c.id == 1).values(email='jane@email.com'))
+        db.session.commit()
+
+        # 1
+        response = self.register('Jane', 'Doe', 'jane@email.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['message'], 'please use a different email address')
+        response = self.client.post('/auth/register', data={'first_name': 'Jane', 'last_name': 'Doe',
+                                                             'email': 'jane@email.com', 'password': 'testpassword',
+                                                             'password2': 'testpassword'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Please use a different email address.', response.data)
+        self.assertEqual(User.query.count(), 2)
+
+        # 2
+        db.session.execute(db.update(User.__table__).where(User.__table__.c.id == 1).values(email='j@email.com'))
+        db.session.commit()
+        response = self.client.put('http://localhost:5000/api/users/2/change_email',
+                                   headers={'Authorization': 'Bearer '+self.get_token('johndoe@email.com')},
+                                   json={'new_email': 'j@email.com'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.query.filter_by(email='j@email.com').count(), 1)
+
+
+    def test_account_created_by_another_instance(self):
+        """
+        Given two application instances (worker processes) sharing one bank database, and a user of the first one
+        whose transfer to account number 2 was just rejected because it does not exist
+
+        # 1
+        When the second instance registers a user owning account 2
+        Then verify that the first instance accepts transfers to it at once, through the API and the web form
+        """
+        directory = tempfile.mkdtemp()
+        instances = []
+        try:
+            for _ in range(2):
+                app = create_app('testing')
+                app.config.update(TENANTS=('acme',),
+                                  TENANT_DATABASE_URL='sqlite:///' + os.path.join(directory, 'tenant-{}.sqlite'))
+                tenancy.init_app(app)
+                instances.append(app)
+            with instances[0].app_context(), tenancy.use('acme'):
+                db.metadata.create_all(db.session.get_bind())
+                Role.insert_roles()
+                TransactionType.insert_transaction_types()
+            first, second = (app.test_client(use_cookies=True) for app in instances)
+            first.post('http://acme.localhost/api/users', json={
+                'first_name': 'Jane', 'last_name': 'Doe', 'email': 'janedoe@email.com', 'password': 'testpassword'})
+            response = first.post('http://acme.localhost/api/tokens', auth=('janedoe@email.com', 'testpassword'))
+            headers = {'Authorization': 'Bearer '+response.json['token']}
+            first.post('http://acme.localhost/api/users/1/accounts/1/deposit', headers=headers, json={'deposit_amount': 10})
+            response = first.post('http://acme.localhost/api/users/1/accounts/1/transfer', headers=headers,
+                                  json={'to_account_num': 2, 'amount': 5})
+            self.assertEqual(response.status_code, 404)
+
+            # 1
+            response = second.post('http://acme.localhost/api/users', json={
+                'first_name': 'John', 'last_name': 'Doe', 'email': 'johndoe@email.com', 'password': 'testpassword'})
+            self.assertEqual(response.status_code, 201)
+            response = first.post('http://acme.localhost/api/users/1/accounts/1/transfer', headers=headers,
+                                  json={'to_account_num': 2, 'amount': 5})
+            self.assertEqual(response.status_code, 201)
+            first.post('http://acme.localhost/auth/login', data={'email': 'janedoe@email.com', 'password': 'testpassword'})
+            first.post('http://acme.localhost/auth/transfer', data={'recipient_acc_num': 2, 'amount': 2})
+            with instances[0].app_context(), tenancy.use('acme'):
+                self.assertEqual([account.balance for account in Accounts.query.order_by(Accounts.account_num)],
+                                 [3, 7])
+        finally:
+            for app in instances:
+                app.extensions['tenant_engines'].dispose()
+            shutil.rmtree(directory)
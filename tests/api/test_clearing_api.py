@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, clearing, ledger, projections
+from app.models import Role, TransactionType, Accounts, ClearingEntry, ClearingFile
+
+
+class ClearingAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        Clearing files are written to a temporary directory and posted two records per chunk.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(CLEARING_BANK_CODE='HOMEBANK', CLEARING_CHUNK_SIZE=2)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.jane = self.register('Jane', 'janedoe@email.com')
+        self.register('John', 'johndoe@email.com')
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, first_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': 'Doe', 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def send(self, amount, bank_code='OTHERBANK', to_account='GB29NWBK60161331926819'):
+        return self.client.post('http://localhost:5000/api/users/1/accounts/1/interbank_transfer', headers=self.jane,
+                                json={'bank_code': bank_code, 'to_account': to_account, 'amount': amount})
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+
+    def balances(self):
+        db.session.expire_all()
+        return [account.balance for account in Accounts.query.order_by(Accounts.account_num)]
+
+
+    def test_outbound_transfers_are_exported_once(self):
+        """
+        Given Jane with a balance of 100
+        When she sends 30 and 20.5 to another bank, refused details and amounts aside, and the postings are exported
+        Then her balance is debited at once, the fixed-width file holds both postings between a header and a trailer,
+        and the next export has nothing left to write
+        """
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=self.jane,
+                         json={'deposit_amount': 100})
+        self.assertEqual(self.send(30).status_code, 201)
+        response = self.send(20.5)
+        self.assertEqual(response.json['transaction']['type'], 'Withdrawal')
+        self.assertEqual(response.json['clearing']['status'], 'pending')
+        self.assertEqual(self.send(5, bank_code='HOMEBANK').status_code, 400)
+        self.assertEqual(self.send(5, to_account='not-an-account').status_code, 400)
+        self.assertEqual(self.send(1000).status_code, 400)
+        self.assertEqual(self.balances(), [49.5, 0])
+
+        path = os.path.join(self.directory, 'outbound.txt')
+        exported = clearing.export_file(path)
+        self.assertEqual((exported.entries, exported.total, exported.format), (2, 50.5, 'fixed'))
+        with open(path) as file:
+            lines = file.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('HHOMEBANK   '))
+        self.assertEqual(lines[2][1 + 8:1 + 8 + 12], '000000000001')
+        self.assertEqual(lines[2][1 + 8 + 12:1 + 8 + 12 + 11 + 34].split(), ['OTHERBANK', 'GB29NWBK60161331926819'])
+        self.assertEqual(lines[2][1 + 8 + 12 + 11 + 34:1 + 8 + 12 + 11 + 34 + 15], '000000000002050')
+        self.assertEqual(lines[3], 'T000000000002000000000000005050')
+        self.assertIsNone(clearing.export_file(path))
+        self.assertEqual({entry.to_dict()['status'] for entry in ClearingEntry.query}, {'exported'})
+        self.assertFalse(projections.rebuild_balances(dry_run=True)[1])
+
+    def test_inbound_file_is_posted_in_chunks(self):
+        """
+        Given a CSV clearing file of three credits, to Jane, John and Jane again
+        When it is imported, twice
+        Then both balances are credited with "Deposit" transactions over two chunks, the journal agrees with the
+        balances, and the second import is refused
+        """
+        path = self.write('inbound.csv', [
+            'H,HOMEBANK,20231001',
+            'D,20231001,1,OTHERBANK,DE89370400440532013000,1250,REF1',
+            'D,20231001,2,OTHERBANK,DE89370400440532013000,500,REF2',
+            'D,20231002,1,OTHERBANK,DE89370400440532013000,99,REF3',
+            'T,3,1849',
+        ])
+        imported = clearing.import_file(path)
+        self.assertEqual((imported.entries, imported.total, imported.format), (3, 18.49, 'csv'))
+        self.assertEqual(self.balances(), [13.49, 5])
+        self.assertEqual([entry.to_dict()['status'] for entry in ClearingEntry.query], ['imported'] * 3)
+        self.assertFalse(projections.rebuild_balances(dry_run=True)[1])
+        with self.assertRaises(ValueError):
+            clearing.import_file(path)
+
+    def test_invalid_inbound_file_posts_nothing(self):
+        """
+        Given fixed-width clearing files with an unknown account past the first chunk, a wrong trailer, or a
+        reference already posted
+        When they are imported
+        Then each import fails with the offending line and no balance, transaction or file is recorded
+        """
+        record = 'D20231001{:012d}OTHERBANK  ' + 'DE89370400440532013000'.ljust(34) + '{:015d}{}'
+        header = 'HHOMEBANK   20231001'
+        unknown = self.write('unknown.txt', [header, record.format(1, 100, 'A1'), record.format(2, 100, 'A2'),
+                                             record.format(9, 100, 'A3'), 'T000000000003000000000000000300'])
+        with self.assertRaisesRegex(ValueError, 'Line 4: account 9'):
+            clearing.import_file(unknown)
+        trailer = self.write('trailer.txt', [header, record.format(1, 100, 'B1'), 'T000000000001000000000000000101'])
+        with self.assertRaisesRegex(ValueError, 'Line 3: trailer'):
+            clearing.import_file(trailer)
+        clearing.import_file(self.write('first.txt', [header, record.format(1, 100, 'C1'), 'T000000000001000000000000000100']))
+        with self.assertRaisesRegex(ValueError, 'already posted'):
+            clearing.import_file(self.write('again.txt', [header, record.format(2, 100, 'C1'), 'T000000000001000000000000000100']))
+        self.assertEqual(self.balances(), [1, 0])
+        self.assertEqual(ClearingFile.query.count(), 1)
+        self.assertEqual(ClearingEntry.query.count(), 1)
+
+
+    def test_reserved_funds_cannot_be_sent_to_another_bank(self):
+        """
+        Given Jane with a balance of 100 and transfer netting on
+        When she reserves 80 for a transfer to John, then sends 30 and 20 to another bank before settlement
+        Then the first inter-bank transfer is refused, the second one is debited, and after settlement her balance is
+        0 rather than negative
+        """
+        self.app.config['TRANSFER_NETTING'] = True
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=self.jane,
+                         json={'deposit_amount': 100})
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=self.jane,
+                                    json={'to_account_num': 2, 'amount': 80})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.send(30).status_code, 400)
+        self.assertEqual(self.balances(), [100, 0])
+        self.assertEqual(ClearingEntry.query.count(), 0)
+        response = self.send(20)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['account']['balance'], 80)
+        self.assertEqual(ledger.settle(), 1)
+        self.assertEqual(self.balances(), [0, 80])
@@ -0,0 +1,111 @@
+import gzip
+import json
+import unittest
+import zlib
+from datetime import datetime
+from app import create_app, db
+from app.models import Role, TransactionType, Accounts, Transactions
+from app.api.compression import compress_response
+
+
+class CompressionAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register_and_get_token(self):
+        # Registers a user through the API, gives it 200 deposits and returns a bearer token for it
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': 'loreum',
+            'last_name': 'ipsum',
+            'email': 'loreumipsum@email.com',
+            'password': 'testpassword'
+        })
+        account = db.session.get(Accounts, 1)
+        deposit = TransactionType.query.filter_by(name="Deposit").first()
+        db.session.add_all([Transactions(receiver_account=account, sender_account=account, amount=1, date_time=datetime.utcnow(),
+                                         transaction_type=deposit) for _ in range(200)])
+        db.session.commit()
+        response = self.client.post('http://localhost:5000/api/tokens', auth=('loreumipsum@email.com', 'testpassword'))
+        return response.json['token']
+
+
+    def test_negotiated_compression(self):
+        """
+        Given a user with a large transaction history
+
+        # 1
+        When the history is requested accepting gzip or deflate
+        Then verify that the body is compressed with the negotiated encoding and decompresses to the plain body
+
+        # 2
+        When a small resource is requested accepting gzip
+        Then verify that the body is sent uncompressed
+        """
+        token = self.register_and_get_token()
+        url = 'http://localhost:5000/api/users/1/transactions'
+        plain = self.client.get(url, headers={'Authorization': 'Bearer '+token})
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        # 1
+        response = self.client.get(url, headers={'Authorization': 'Bearer '+token, 'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+        response = self.client.get(url, headers={'Authorization': 'Bearer '+token, 'Accept-Encoding': 'gzip;q=0.5, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.data), plain.data)
+
+        # 2
+        response = self.client.get('http://localhost:5000/api/users/1', headers={'Authorization': 'Bearer '+token, 'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json['id'], 1)
+
+
+    def test_compression_disabled(self):
+        """
+        Given API compression disabled with a level of 0
+        When a large history is requested accepting gzip
+        Then verify that the body is sent uncompressed
+        """
+        self.app.config['API_COMPRESSION_LEVEL'] = 0
+        token = self.register_and_get_token()
+        response = self.client.get('http://localhost:5000/api/users/1/transactions',
+                                   headers={'Authorization': 'Bearer '+token, 'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json['_meta']['total_transactions'], 201)
+
+
+    def test_streamed_response(self):
+        """
+        Given a streamed JSON response with a Content-Length and a strong ETag
+        When it is compressed for a client accepting gzip
+        Then verify that it is compressed chunk by chunk, drops its Content-Length and carries a weak ETag
+        """
+        rows = [json.dumps({'id': i, 'type': 'Deposit'}) for i in range(100)]
+        with self.app.test_request_context('/api/users/1/transactions', headers={'Accept-Encoding': 'gzip'}):
+            response = self.app.response_class((row for row in rows), mimetype='application/json')
+            response.headers['Content-Length'] = '10'
+            response.set_etag('abc')
+            response = compress_response(response)
+            self.assertTrue(response.is_streamed)
+            self.assertNotIn('Content-Length', response.headers)
+            self.assertEqual(response.get_etag(), ('abc', True))
+            self.assertEqual(gzip.decompress(b''.join(response.response)), ''.join(rows).encode('utf-8'))
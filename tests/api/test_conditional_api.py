@@ -0,0 +1,83 @@
+import unittest
+from app import create_app, db
+from app.models import Role, TransactionType, Accounts
+
+
+class ConditionalAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register_and_get_token(self):
+        # Registers a user through the API and returns a bearer token for it
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': 'loreum',
+            'last_name': 'ipsum',
+            'email': 'loreumipsum@email.com',
+            'password': 'testpassword'
+        })
+        response = self.client.post('http://localhost:5000/api/tokens', auth=('loreumipsum@email.com', 'testpassword'))
+        return response.json['token']
+
+
+    def test_conditional_get_collections(self):
+        """
+        Given a valid user account and its accounts / transactions collections
+
+        # 1
+        When the collections are requested again with the ETag received
+        Then verify that the response is not modified (304) without a body
+
+        # 2
+        When a deposit is made and the collections are requested with the old ETag
+        Then verify that the full representation is returned with a new ETag
+        """
+        token = self.register_and_get_token()
+        for url in ['http://localhost:5000/api/users/1/accounts', 'http://localhost:5000/api/users/1/transactions']:
+            headers = {'Authorization': 'Bearer '+token}
+            response = self.client.get(url, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            self.assertTrue(etag.startswith('W/'))
+
+            # 1
+            headers['If-None-Match'] = etag
+            response = self.client.get(url, headers=headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+            # 2
+            self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit',
+                             headers={'Authorization': 'Bearer '+token}, json={'deposit_amount': 3})
+            response = self.client.get(url, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+
+    def test_ledger_marks(self):
+        """
+        Given a valid user account with a deposit
+        When the ledger high-water marks are queried
+        Then verify that the balance version and latest transaction id of the account are returned
+        """
+        token = self.register_and_get_token()
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit',
+                         headers={'Authorization': 'Bearer '+token}, json={'deposit_amount': 3})
+        self.assertEqual(Accounts.ledger_marks(1), [(1, 1, 2)])
+        self.assertEqual(Accounts.ledger_marks(2), [])
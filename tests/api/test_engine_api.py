@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, engine
+from app.models import Role, TransactionType, Accounts, Transactions
+
+
+class LedgerEngineAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        The engine's flusher thread is off, postings are committed by explicit flush() calls.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(LEDGER_ENGINE_ENABLED=True, LEDGER_ENGINE_FLUSH_INTERVAL=0, LEDGER_ENGINE_FSYNC=False,
+                               LEDGER_ENGINE_WAL_PATH=os.path.join(self.directory, 'ledger.wal'))
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def balances(self):
+        db.session.expire_all()
+        return [account.balance for account in Accounts.query.order_by(Accounts.account_num)]
+
+
+    def test_engine_deposit_transfer_and_flush(self):
+        """
+        Given two users and the in-memory ledger engine enabled
+
+        # 1
+        When a user deposits and transfers through the API
+        Then verify that both are accepted (202) with the engine's balance, and the database is unchanged
+
+        # 2
+        When a transfer exceeds the engine's balance
+        Then verify that it is rejected
+
+        # 3
+        When the engine flushes
+        Then verify that balances and transactions are committed and the write-ahead log is emptied
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+
+        # 1
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=jane,
+                                    json={'deposit_amount': 10})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['account']['balance'], 10)
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=jane,
+                                    json={'to_account_num': 2, 'amount': 4})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['account']['balance'], 6)
+        self.assertEqual(response.json['posting'], {'seq': 2, 'from_acc': 1, 'to_acc': 2, 'amount': 4, 'status': 'accepted'})
+        self.assertEqual(self.balances(), [0, 0])
+
+        # 2
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=jane,
+                                    json={'to_account_num': 2, 'amount': 7})
+        self.assertEqual(response.status_code, 400)
+
+        # 3
+        ledger_engine = engine.get_engine()
+        self.assertGreater(os.path.getsize(ledger_engine.wal_path), 0)
+        self.assertEqual(ledger_engine.flush(), 2)
+        self.assertEqual(self.balances(), [6, 4])
+        self.assertEqual(Transactions.query.count(), 4)
+        self.assertEqual(os.path.getsize(ledger_engine.wal_path), 0)
+        self.assertEqual(ledger_engine.metrics()['flushed_seq'], 2)
+
+
+    def test_engine_recovers_from_log(self):
+        """
+        Given an engine with logged postings that were never flushed, followed by a torn record
+
+        # 1
+        When a new engine starts on the same database and log
+        Then verify that the logged postings are committed once, the torn record is ignored and sequence numbers continue
+
+        # 2
+        When that engine starts again
+        Then verify that nothing is committed twice
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=jane, json={'deposit_amount': 10})
+        ledger_engine = engine.get_engine()
+        ledger_engine.flush()
+        ledger_engine.transfer(1, 2, 3)
+        ledger_engine.deposit(2, 5)
+        ledger_engine._wal.write(b'\x01\x02\x03')
+        ledger_engine._wal.close()
+        self.assertEqual(self.balances(), [10, 0])
+
+        # 1
+        restarted = engine.LedgerEngine(self.app, ledger_engine.wal_path, flush_interval=0, fsync=False)
+        self.assertEqual(self.balances(), [7, 8])
+        self.assertEqual(Transactions.query.count(), 5)
+        self.assertEqual(restarted.deposit(1, 1).seq, 4)
+        restarted._wal.close()
+
+        # 2
+        engine.LedgerEngine(self.app, ledger_engine.wal_path, flush_interval=0, fsync=False)._wal.close()
+        self.assertEqual(self.balances(), [8, 8])
+        self.assertEqual(Transactions.query.count(), 6)
@@ -0,0 +1,94 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, TransactionType
+
+
+class FieldsetsAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record_statement)
+
+    def tearDown(self) -> None:
+        event.remove(db.engine, 'before_cursor_execute', self.record_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def register_and_get_token(self):
+        # Registers a user through the API and returns a bearer token for it
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': 'loreum',
+            'last_name': 'ipsum',
+            'email': 'loreumipsum@email.com',
+            'password': 'testpassword'
+        })
+        response = self.client.post('http://localhost:5000/api/tokens', auth=('loreumipsum@email.com', 'testpassword'))
+        return response.json['token']
+
+
+    def test_lean_transaction_fields(self):
+        """
+        Given a valid user account with a transaction
+        When the transaction and the transaction collection are requested with fields=id,amount,to_acc
+        Then verify that only those keys are returned and neither users_table nor transaction_type_table is joined
+        """
+        headers = {'Authorization': 'Bearer '+self.register_and_get_token()}
+        for url, key in [('http://localhost:5000/api/users/1/transactions/1?fields=id,amount,to_acc', None),
+                         ('http://localhost:5000/api/users/1/transactions?fields=id,amount,to_acc', 'transactions')]:
+            del self.statements[:]
+            response = self.client.get(url, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            body = response.json[key][0] if key else response.json
+            self.assertEqual(body, {'id': 1, 'amount': 0, 'to_acc': 1})
+            reads = [statement for statement in self.statements if 'transactions_table' in statement]
+            self.assertTrue(reads)
+            for statement in reads:
+                self.assertNotIn('JOIN users_table', statement)
+                self.assertNotIn('transaction_type_table', statement)
+
+        response = self.client.get('http://localhost:5000/api/users/1/transactions/1?fields=id,type', headers=headers)
+        self.assertEqual(response.json, {'id': 1, 'type': 'New Account'})
+
+
+    def test_user_and_account_fields(self):
+        """
+        Given a valid user account
+
+        # 1
+        When the user and its accounts are requested with sparse fieldsets
+        Then verify that only the requested keys are returned
+
+        # 2
+        When an unknown field is requested
+        Then verify that the response is bad request (400) naming the field
+        """
+        headers = {'Authorization': 'Bearer '+self.register_and_get_token()}
+
+        # 1
+        response = self.client.get('http://localhost:5000/api/users/1?fields=email,accounts', headers=headers)
+        self.assertEqual(response.json, {'email': 'loreumipsum@email.com', 'accounts': '/api/users/1/accounts'})
+        response = self.client.get('http://localhost:5000/api/users/1/accounts?fields=account_num', headers=headers)
+        self.assertEqual(response.json, {'accounts': [{'account_num': 1}], '_meta': {'num_accounts': 1, 'total_balance': 0}})
+        response = self.client.get('http://localhost:5000/api/users/1/accounts/1?fields=balance', headers=headers)
+        self.assertEqual(response.json, {'balance': 0})
+
+        # 2
+        response = self.client.get('http://localhost:5000/api/users/1/transactions?fields=id,password', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['message'], 'Unknown fields: password')
@@ -0,0 +1,114 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import Role, TransactionType, Transactions, User
+from app.filters import TransactionSearch
+from app import fragments
+
+
+class FragmentCacheAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.spill_dir = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['TRANSACTION_FRAGMENT_SPILL_PATH'] = os.path.join(self.spill_dir, 'fragments')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        fragments.get_cache().close()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.spill_dir)
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+
+    def test_fragment_responses(self):
+        """
+        Given two users with a few deposits and transfers between them
+
+        # 1
+        When the transaction history is read twice, in full and paginated
+        Then verify that the bodies match the ORM serialisation and the second read is served from cached fragments
+
+        # 2
+        When the memory budget only fits a couple of fragments
+        Then verify that evicted fragments are read back from the spill file instead of the database
+
+        # 3
+        When a single transaction is read, with and without fields=
+        Then verify that both match and that transactions of other users are still rejected (400)
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+        for amount in [10, 20]:
+            self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=jane, json={'deposit_amount': amount})
+            self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=jane, json={'to_account_num': 2, 'amount': 1})
+        cache = fragments.get_cache()
+
+        # 1
+        expected = json.loads(json.dumps(Transactions.to_collection_dict(User.query.get(1))))
+        response = self.client.get('http://localhost:5000/api/users/1/transactions', headers=jane)
+        self.assertEqual(response.json, expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 5))
+        response = self.client.get('http://localhost:5000/api/users/1/transactions', headers=jane)
+        self.assertEqual(response.json, expected)
+        self.assertEqual(cache.hits, 5)
+        response = self.client.get('http://localhost:5000/api/users/1/transactions?limit=2', headers=jane)
+        expected = Transactions.to_collection_dict(User.query.get(1), search=TransactionSearch(limit=2))
+        self.assertEqual(response.json, expected)
+
+        # 2
+        cache.clear()
+        cache.capacity = 2 * len(fragments.transaction_fragments([1])[0])
+        self.client.get('http://localhost:5000/api/users/1/transactions', headers=jane)
+        self.assertLessEqual(cache.used, cache.capacity)
+        response = self.client.get('http://localhost:5000/api/users/1/transactions', headers=jane)
+        self.assertEqual(len(response.json['transactions']), 5)
+        self.assertGreater(cache.spill_hits, 0)
+
+        # 3
+        response = self.client.get('http://localhost:5000/api/users/1/transactions/3', headers=jane)
+        self.assertEqual(response.json, Transactions.query.get(3).to_dict())
+        response = self.client.get('http://localhost:5000/api/users/1/transactions/3?fields=id,type', headers=jane)
+        self.assertEqual(response.json, {'id': 3, 'type': 'Deposit'})
+        response = self.client.get('http://localhost:5000/api/users/1/transactions/2', headers=jane)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('http://localhost:5000/api/users/1/transactions/99', headers=jane)
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_spill_bounded_and_removed(self):
+        """
+        Given a cache holding one fragment in memory and 100 bytes in its spill files
+        When many fragments are evicted, then the cache is closed
+        Then verify that at most two spill files of at most 50 bytes of fragments each are kept, the recent
+        fragments are still read back, and closing deletes the files
+        """
+        cache = fragments.FragmentCache(10, os.path.join(self.spill_dir, 'bounded'), spill_capacity=100)
+        cache.put_many({id: b'0123456789' for id in range(1, 101)})
+        self.assertLessEqual(cache.metrics()['spill_files'], 2)
+        self.assertLessEqual(cache.metrics()['spill_bytes'], 50)
+        self.assertEqual(cache.get_many([99]), {99: b'0123456789'})
+        self.assertEqual(cache.get_many([1]), {})
+        self.assertTrue(any(name.startswith('bounded.') for name in os.listdir(self.spill_dir)))
+        cache.close()
+        self.assertFalse(any(name.startswith('bounded.') for name in os.listdir(self.spill_dir)))
+        self.assertEqual(cache.get_many([98]), {})
@@ -0,0 +1,159 @@
+import unittest
+from app import create_app, db, ledger
+from app.models import Role, TransactionType, Accounts, BalanceSlot
+
+
+class HotAccountAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def slots(self, account_num):
+        return db.session.execute(db.select(BalanceSlot.balance).where(BalanceSlot.account_num == account_num)
+                                  .order_by(BalanceSlot.slot)).scalars().all()
+
+
+    def test_hot_account_credits_and_debits(self):
+        """
+        Given a merchant account flagged hot with 4 slots and a payer with 20 deposited
+
+        # 1
+        When the payer transfers 1 to the merchant 4 times
+        Then verify that the credits are spread over the slots, the merchant's main balance row is left untouched
+        and reads report the balance including the slots
+
+        # 2
+        When the merchant transfers 3 back, more than its main balance
+        Then verify that the slots are folded into the main balance first and the debit succeeds
+
+        # 3
+        When the merchant tries to transfer more than it holds
+        Then verify that the transfer is rejected and the balance is unchanged
+        """
+        merchant = self.register('Shop', 'Keeper', 'shop@email.com')
+        payer = self.register('Jane', 'Doe', 'janedoe@email.com')
+        ledger.set_hot(db.session.get(Accounts, 1), 4)
+        self.client.post('http://localhost:5000/api/users/2/accounts/2/deposit', headers=payer, json={'deposit_amount': 20})
+
+        # 1
+        for _ in range(4):
+            response = self.client.post('http://localhost:5000/api/users/2/accounts/2/transfer', headers=payer,
+                                        json={'to_account_num': 1, 'amount': 1})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.slots(1), [1, 1, 1, 1])
+        account = db.session.get(Accounts, 1)
+        self.assertEqual((account.balance, account.version), (0, 0))
+        response = self.client.get('http://localhost:5000/api/users/1/accounts', headers=merchant)
+        self.assertEqual(response.json['accounts'][0]['balance'], 4)
+        self.assertEqual(response.json['_meta']['total_balance'], 4)
+        response = self.client.get('http://localhost:5000/api/users/1/accounts/1', headers=merchant)
+        self.assertEqual(response.json['balance'], 4)
+
+        # 2
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=merchant,
+                                    json={'to_account_num': 2, 'amount': 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['account']['balance'], 1)
+        self.assertEqual(self.slots(1), [0, 0, 0, 0])
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Accounts, 1).balance, 1)
+        self.assertEqual(db.session.get(Accounts, 2).balance, 19)
+
+        # 3
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=merchant,
+                                    json={'to_account_num': 2, 'amount': 2})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('http://localhost:5000/api/users/1/accounts/1', headers=merchant)
+        self.assertEqual(response.json['balance'], 1)
+
+
+    def test_fold_and_unflag(self):
+        """
+        Given a hot account with 2 slots holding deposits
+
+        # 1
+        When the hot accounts are folded
+        Then verify that the slots are emptied into the main balance
+
+        # 2
+        When the account is turned back to a regular account
+        Then verify that its slots are removed and later deposits update the main balance
+        """
+        headers = self.register('Shop', 'Keeper', 'shop@email.com')
+        ledger.set_hot(db.session.get(Accounts, 1), 2)
+        for amount in (2, 3):
+            self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=headers,
+                             json={'deposit_amount': amount})
+        self.assertEqual(sorted(self.slots(1)), [2, 3])
+
+        # 1
+        self.assertEqual(ledger.fold_all(), 1)
+        self.assertEqual(self.slots(1), [0, 0])
+        self.assertEqual(db.session.get(Accounts, 1).balance, 5)
+        self.assertEqual(ledger.fold_all(), 0)
+
+        # 2
+        ledger.set_hot(db.session.get(Accounts, 1), 0)
+        self.assertEqual(self.slots(1), [])
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=headers,
+                         json={'deposit_amount': 1})
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Accounts, 1).balance, 6)
+
+
+    def test_balance_changes_apply_in_the_database(self):
+        """
+        Given a hot account holding 10 in its main balance and 5 in a slot, loaded by this request
+
+        # 1
+        When another request debits 4 before this one folds the slots
+        Then verify that the fold adds the slots to the balance in the database, keeping the other debit
+
+        # 2
+        When 8 of the balance is reserved by a pending transfer and a direct transfer of 5 is attempted
+        Then verify that it is rejected, and a transfer of 3 goes through
+        """
+        self.register('Shop', 'Keeper', 'shop@email.com')
+        self.register('Jane', 'Doe', 'janedoe@email.com')
+        ledger.set_hot(db.session.get(Accounts, 1), 1)
+        db.session.execute(ledger.APPLY_NET, {'account': 1, 'net': 10})
+        ledger.credit(db.session.get(Accounts, 1), 5)
+        db.session.commit()
+        account = db.session.get(Accounts, 1)
+        self.assertEqual(account.balance, 10)
+
+        # 1
+        db.session.execute(ledger.DEBIT, {'sender': 1, 'amount': 4})
+        self.assertEqual(ledger.fold(account), 5)
+        self.assertEqual(self.slots(1), [0])
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Accounts, 1).balance, 11)
+
+        # 2
+        recipient = db.session.get(Accounts, 2)
+        self.assertIsNotNone(ledger.reserve_transfer(db.session.get(Accounts, 1), recipient, 8))
+        self.assertIsNone(ledger.transfer(db.session.get(Accounts, 1), recipient, 5))
+        self.assertIsNotNone(ledger.transfer(db.session.get(Accounts, 1), recipient, 3))
+        db.session.expire_all()
+        self.assertEqual([db.session.get(Accounts, num).balance for num in (1, 2)], [8, 3])
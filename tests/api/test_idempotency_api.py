@@ -0,0 +1,249 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import Role, TransactionType, Accounts, Transactions, IdempotencyKey
+from app.api.idempotency import IdempotencyStore, get_store
+
+
+class IdempotencyAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register_and_get_token(self, first_name, email):
+        # Registers a user through the API and returns a bearer token for it
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name,
+            'last_name': 'ipsum',
+            'email': email,
+            'password': 'testpassword'
+        })
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return response.json['token']
+
+
+    def test_deposit_replayed_with_same_key(self):
+        """
+        Given a valid user account
+        When the same deposit is POSTed twice with the same Idempotency-Key
+        Then verify that the second response replays the first one and the balance is only credited once
+        """
+        token = self.register_and_get_token('loreum', 'loreumipsum@email.com')
+        url = 'http://localhost:5000/api/users/1/accounts/1/deposit'
+        headers = {'Authorization': 'Bearer '+token, 'Idempotency-Key': 'deposit-1'}
+
+        first = self.client.post(url, headers=headers, json={'deposit_amount': 3})
+        second = self.client.post(url, headers=headers, json={'deposit_amount': 3})
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(first.json, second.json)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(db.session.get(Accounts, 1).balance, 3)
+        self.assertEqual(Transactions.query.count(), 2)
+
+        # A different key is a new deposit
+        headers['Idempotency-Key'] = 'deposit-2'
+        third = self.client.post(url, headers=headers, json={'deposit_amount': 3})
+        self.assertEqual(third.status_code, 201)
+        self.assertEqual(third.json['account']['balance'], 6)
+
+
+    def test_transfer_replayed_from_database_after_eviction(self):
+        """
+        Given two valid user accounts and a transfer made with an Idempotency-Key
+        When the in-memory cache no longer holds the key and the transfer is retried
+        Then verify that the stored response is replayed from the database without moving funds again
+        """
+        token = self.register_and_get_token('loreum', 'loreumipsum@email.com')
+        self.register_and_get_token('dolor', 'dolor@email.com')
+        headers = {'Authorization': 'Bearer '+token}
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=headers, json={'deposit_amount': 10})
+
+        headers['Idempotency-Key'] = 'transfer-1'
+        url = 'http://localhost:5000/api/users/1/accounts/1/transfer'
+        first = self.client.post(url, headers=headers, json={'to_account_num': 2, 'amount': 4})
+        get_store().clear()
+        second = self.client.post(url, headers=headers, json={'to_account_num': 2, 'amount': 4})
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(first.json, second.json)
+        self.assertEqual(db.session.get(Accounts, 1).balance, 6)
+        self.assertEqual(db.session.get(Accounts, 2).balance, 4)
+
+
+    def test_key_reused_for_different_request(self):
+        """
+        Given a deposit made with an Idempotency-Key
+
+        # 1
+        When the key is reused with a different body
+        Then verify that the response is unprocessable entity (422)
+
+        # 2
+        When a request with the key fails validation and is retried with a valid body
+        Then verify that the 400 response was stored and replayed rather than the deposit being applied
+        """
+        token = self.register_and_get_token('loreum', 'loreumipsum@email.com')
+        url = 'http://localhost:5000/api/users/1/accounts/1/deposit'
+        headers = {'Authorization': 'Bearer '+token, 'Idempotency-Key': 'deposit-1'}
+
+        # 1
+        self.client.post(url, headers=headers, json={'deposit_amount': 3})
+        response = self.client.post(url, headers=headers, json={'deposit_amount': 5})
+        self.assertEqual(response.status_code, 422)
+
+        # 2
+        headers['Idempotency-Key'] = 'deposit-2'
+        response = self.client.post(url, headers=headers, json={'deposit_amount': -3})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, headers=headers, json={'deposit_amount': -3})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(db.session.get(Accounts, 1).balance, 3)
+
+
+    def test_aborted_request_releases_key(self):
+        """
+        Given a user account
+        When a deposit with an Idempotency-Key is aborted (404 for a nonexistent account)
+        Then verify that no key is stored so the client may retry it
+        """
+        token = self.register_and_get_token('loreum', 'loreumipsum@email.com')
+        headers = {'Authorization': 'Bearer '+token, 'Idempotency-Key': 'deposit-1'}
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/3/deposit', headers=headers, json={'deposit_amount': 3})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(IdempotencyKey.query.count(), 0)
+
+
+    def test_abandoned_key_reclaimed_after_lease(self):
+        """
+        Given in-flight keys left behind by a crashed worker, one claimed within the lease, one before it and one
+        before it whose request had committed its changes
+
+        # 1
+        When the deposits are retried with those keys
+        Then verify that the key within the lease is still held (409), the uncommitted one is reclaimed and deposits
+        and the committed one is refused (409) without depositing again
+
+        # 2
+        When expired keys are purged
+        Then verify that only the uncommitted in-flight key past its lease and completed keys past the ttl are deleted
+        """
+        self.app.config.update(IDEMPOTENCY_WAIT_TIMEOUT=0.1, IDEMPOTENCY_LEASE=60)
+        token = self.register_and_get_token('loreum', 'loreumipsum@email.com')
+        now = datetime.utcnow()
+        db.session.add_all([
+            IdempotencyKey(user_id=1, key='held', fingerprint='', created_at=now - timedelta(seconds=30)),
+            IdempotencyKey(user_id=1, key='crashed', fingerprint='', created_at=now - timedelta(seconds=120)),
+            IdempotencyKey(user_id=1, key='lost', fingerprint='', created_at=now - timedelta(seconds=120),
+                           committed_at=now - timedelta(seconds=119)),
+        ])
+        db.session.commit()
+        url = 'http://localhost:5000/api/users/1/accounts/1/deposit'
+
+        # 1
+        response = self.client.post(url, headers={'Authorization': 'Bearer '+token, 'Idempotency-Key': 'held'},
+                                    json={'deposit_amount': 3})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(url, headers={'Authorization': 'Bearer '+token, 'Idempotency-Key': 'crashed'},
+                                    json={'deposit_amount': 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(db.session.get(Accounts, 1).balance, 3)
+        response = self.client.post(url, headers={'Authorization': 'Bearer '+token, 'Idempotency-Key': 'lost'},
+                                    json={'deposit_amount': 3})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(db.session.get(Accounts, 1).balance, 3)
+
+        # 2
+        db.session.add_all([
+            IdempotencyKey(user_id=1, key='abandoned', fingerprint='', created_at=now - timedelta(seconds=120)),
+            IdempotencyKey(user_id=1, key='old', fingerprint='', status_code=201, created_at=now - timedelta(days=2)),
+        ])
+        db.session.commit()
+        self.assertEqual(IdempotencyKey.purge_expired(86400, 60), 2)
+        db.session.commit()
+        self.assertEqual(sorted(row.key for row in IdempotencyKey.query), ['crashed', 'held', 'lost'])
+
+    def test_worker_dies_after_route_commits(self):
+        """
+        Given two valid user accounts
+        When the worker dies after a transfer with an Idempotency-Key commits but before its response is stored,
+        and the transfer is retried once the lease has expired
+        Then verify that the key was marked committed with the transfer and the retry is refused (409) without
+        moving funds again
+        """
+        self.app.config.update(IDEMPOTENCY_LEASE=60)
+        token = self.register_and_get_token('loreum', 'loreumipsum@email.com')
+        self.register_and_get_token('ipsum', 'ipsumloreum@email.com')
+        headers = {'Authorization': 'Bearer '+token, 'Idempotency-Key': 'transfer-1'}
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers={'Authorization': 'Bearer '+token},
+                         json={'deposit_amount': 10})
+        url = 'http://localhost:5000/api/users/1/accounts/1/transfer'
+
+        with patch('app.api.idempotency.make_response', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self.client.post(url, headers=headers, json={'to_account_num': 2, 'amount': 4})
+        db.session.remove()
+        row = IdempotencyKey.query.filter_by(key='transfer-1').one()
+        self.assertIsNone(row.status_code)
+        self.assertIsNotNone(row.committed_at)
+        self.assertEqual(db.session.get(Accounts, 1).balance, 6)
+
+        row.created_at = datetime.utcnow() - timedelta(seconds=120)
+        db.session.commit()
+        get_store().clear()
+        response = self.client.post(url, headers=headers, json={'to_account_num': 2, 'amount': 4})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(db.session.get(Accounts, 1).balance, 6)
+        self.assertEqual(db.session.get(Accounts, 2).balance, 4)
+
+
+    def test_store_lru_and_key_locks(self):
+        """
+        Given an idempotency store with a capacity of two
+        When three records are cached and two threads hold the same key
+        Then verify that the least recently used record is evicted and the second holder waits for the first
+        """
+        store = IdempotencyStore(capacity=2)
+        store.put((1, 'a'), 'A')
+        store.put((1, 'b'), 'B')
+        store.get((1, 'a'))
+        store.put((1, 'c'), 'C')
+        self.assertIsNone(store.get((1, 'b')))
+        self.assertEqual(store.get((1, 'a')), 'A')
+
+        order = []
+        def worker(name, delay):
+            with store.hold((1, 'a')):
+                order.append(name + ' start')
+                time.sleep(delay)
+                order.append(name + ' end')
+        first = threading.Thread(target=worker, args=('first', 0.05))
+        first.start()
+        time.sleep(0.01)
+        second = threading.Thread(target=worker, args=('second', 0))
+        second.start()
+        first.join()
+        second.join()
+        self.assertEqual(order, ['first start', 'first end', 'second start', 'second end'])
@@ -0,0 +1,115 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, analytics
+from app.models import Role, TransactionType, Transactions
+
+
+class InsightsAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        The analytics snapshot is written to a temporary directory.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(ANALYTICS_SNAPSHOT_DIR=self.directory)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.jane = self.register('Jane', 'janedoe@email.com')
+        self.john = self.register('John', 'johndoe@email.com')
+        self.register('Jack', 'jackdoe@email.com')
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, first_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': 'Doe', 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def record(self, sender, receiver, amount, type_name, date_time):
+        # Backdated journal row, balances are not read by insights
+        type_id = db.session.execute(db.select(TransactionType.id).where(TransactionType.name == type_name)).scalar()
+        db.session.add(Transactions(sender=sender, receiver=receiver, amount=amount, date_time=date_time,
+                                    transaction_type_id=type_id))
+        db.session.commit()
+
+    def insights(self, query='', headers=None):
+        return self.client.get('http://localhost:5000/api/users/1/insights' + query, headers=headers or self.jane)
+
+
+    def test_monthly_insights(self):
+        """
+        Given Jane's deposit, transfers and withdrawal over this month and the previous one, the last transfer
+        recorded after the snapshot was refreshed
+        When she reads her monthly insights over two months
+        Then each month has her inflow and outflow per type and her transfers, and her counterparties are ranked by
+        amount exchanged
+        """
+        self.assertEqual(self.insights().status_code, 503)
+        this_month = datetime.utcnow().replace(day=1, hour=0, minute=0)
+        previous_month = (this_month - timedelta(days=1)).replace(day=1)
+        self.record(1, 1, 100, 'Deposit', previous_month)
+        self.record(1, 2, 50, 'Transfer', previous_month)
+        self.record(2, 1, 30, 'Transfer', this_month)
+        self.record(1, 1, 20, 'Withdrawal', this_month)
+        self.record(2, 3, 5, 'Transfer', this_month)
+        analytics.refresh()
+        self.record(3, 1, 10, 'Transfer', this_month)
+
+        response = self.insights('?period=month&periods=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['period'], 'month')
+        self.assertEqual(response.json['periods'], [
+            {'period': previous_month.strftime('%Y-%m'), 'inflow': {'Deposit': 100.0}, 'outflow': {'Transfer': 50.0},
+             'transfers': 1, 'average_transfer': 50.0},
+            {'period': this_month.strftime('%Y-%m'), 'inflow': {'New Account': 0.0, 'Transfer': 40.0},
+             'outflow': {'Withdrawal': 20.0}, 'transfers': 2, 'average_transfer': 20.0},
+        ])
+        self.assertEqual(response.json['top_counterparties'], [
+            {'account_num': 2, 'sent': 50.0, 'received': 30.0, 'transactions': 2},
+            {'account_num': 3, 'sent': 0.0, 'received': 10.0, 'transactions': 1},
+        ])
+        self.assertEqual(response.json['average_transfer'], 30.0)
+        self.assertEqual(response.json['_meta']['last_txn_id'], 8)
+
+        response = self.insights('?periods=1&limit=1')
+        self.assertEqual(len(response.json['periods']), 1)
+        self.assertEqual([party['account_num'] for party in response.json['top_counterparties']], [2])
+
+    def test_daily_and_weekly_periods(self):
+        """
+        Given a transfer made today
+        When Jane reads her daily and weekly insights, asks for an unknown period, or reads John's insights
+        Then periods are named after their first day, weeks starting on Monday, the unknown period is refused and
+        John's insights are forbidden to her
+        """
+        today = datetime.utcnow()
+        self.record(1, 2, 8, 'Transfer', today)
+        analytics.refresh()
+        days = self.insights('?period=day&periods=3').json['periods']
+        self.assertEqual([day['period'] for day in days],
+                         [(today - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in (2, 1, 0)])
+        self.assertEqual(days[-1]['outflow'], {'Transfer': 8.0})
+        self.assertEqual(days[0], {'period': days[0]['period'], 'inflow': {}, 'outflow': {}, 'transfers': 0,
+                                   'average_transfer': None})
+        weeks = self.insights('?period=week&periods=1').json['periods']
+        self.assertEqual(weeks[0]['period'], (today - timedelta(days=today.weekday())).strftime('%Y-%m-%d'))
+        self.assertEqual(weeks[0]['transfers'], 1)
+        self.assertEqual(self.insights('?period=year').status_code, 400)
+        self.assertEqual(self.client.get('http://localhost:5000/api/users/2/insights', headers=self.jane).status_code,
+                         403)
+        response = self.client.get('http://localhost:5000/api/users/2/insights?period=day', headers=self.john)
+        self.assertEqual(response.json['periods'][-1]['inflow'], {'New Account': 0.0, 'Transfer': 8.0})
@@ -0,0 +1,72 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, TransactionType
+
+
+class OwnershipLookupAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.statements = []
+        event.listen(db.engine, 'before_cursor_execute', self.record)
+
+    def tearDown(self) -> None:
+        event.remove(db.engine, 'before_cursor_execute', self.record)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def count(self, method, url, headers, **kwargs):
+        # Status code and number of statements executed besides the token lookup
+        self.statements.clear()
+        response = getattr(self.client, method)('http://localhost:5000/api/' + url, headers=headers, **kwargs)
+        return response.status_code, len(self.statements) - 1
+
+
+    def test_single_query_lookups(self):
+        """
+        Given two users with one account each
+
+        # 1
+        When a user reads their account and a transaction, their neighbour's, and ones that do not exist
+        Then verify that each answer (200, 400, 404) takes a single query
+
+        # 2
+        When a user deposits into or transfers from an account that is not theirs or does not exist
+        Then verify that the request is rejected (400, 404) after a single query
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+
+        # 1
+        self.assertEqual(self.count('get', 'users/1/accounts/1', jane), (200, 1))
+        self.assertEqual(self.count('get', 'users/1/accounts/2', jane), (400, 1))
+        self.assertEqual(self.count('get', 'users/1/accounts/9', jane), (404, 1))
+        self.assertEqual(self.count('get', 'users/1/transactions/1?fields=id,type', jane), (200, 1))
+        self.assertEqual(self.count('get', 'users/1/transactions/2?fields=id,type', jane), (400, 1))
+        self.assertEqual(self.count('get', 'users/1/transactions/9', jane), (404, 1))
+
+        # 2
+        for action, data in [('deposit', {'deposit_amount': 5}), ('transfer', {'to_account_num': 1, 'amount': 5})]:
+            self.assertEqual(self.count('post', 'users/1/accounts/2/' + action, jane, json=data), (400, 1))
+            self.assertEqual(self.count('post', 'users/1/accounts/9/' + action, jane, json=data), (404, 1))
@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import Role, TransactionType, Transactions
+from app import recent
+
+
+class RecentTransactionsAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app.config['RECENT_TRANSACTIONS_SIZE'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def recent(self, headers, user_id=1, account_id=1):
+        return self.client.get('http://localhost:5000/api/users/{}/accounts/{}/recent_transactions'.format(user_id, account_id),
+                               headers=headers)
+
+    def deposit(self, headers, amount):
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=headers, json={'deposit_amount': amount})
+
+
+    def test_ring_buffer(self):
+        """
+        Given a registered user and a ring buffer of 3 transactions per account
+
+        # 1
+        When the recent transactions are read twice around two deposits
+        Then verify that the latest 3 transactions are returned newest first, the second read from memory
+
+        # 2
+        When a transaction is written without going through app.ledger (e.g. by another process)
+        Then verify that the next read notices it and warms the buffer again
+
+        # 3
+        When another user's account is read
+        Then verify that it is not found (404) or forbidden (403)
+        """
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        cache = recent.get_cache()
+
+        # 1
+        self.deposit(jane, 1)
+        response = self.recent(jane)
+        self.assertEqual([txn['amount'] for txn in response.json['transactions']], [1, 0])
+        self.assertEqual(cache.misses, 1)
+        self.deposit(jane, 2)
+        self.deposit(jane, 3)
+        response = self.recent(jane)
+        self.assertEqual([txn['amount'] for txn in response.json['transactions']], [3, 2, 1])
+        self.assertEqual(response.json['transactions'][0]['type'], 'Deposit')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # 2
+        deposit = TransactionType.query.filter_by(name='Deposit').first()
+        db.session.add(Transactions(receiver=1, sender=1, amount=4, date_time=datetime.utcnow(), transaction_type=deposit))
+        db.session.commit()
+        response = self.recent(jane)
+        self.assertEqual([txn['amount'] for txn in response.json['transactions']], [4, 3, 2])
+        self.assertEqual(cache.misses, 2)
+
+        # 3
+        john = self.register('John', 'Doe', 'johndoe@email.com')
+        self.assertEqual(self.recent(john, user_id=2, account_id=1).status_code, 404)
+        self.assertEqual(self.recent(john).status_code, 403)
+
+    def test_memory_budget(self):
+        """
+        Given a memory budget holding the buffers of two single-transaction accounts
+        When three accounts are read in turn
+        Then verify that the least recently used account is evicted and the budget is respected
+        """
+        headers = [self.register('User', str(i), 'user{}@email.com'.format(i)) for i in range(1, 4)]
+        cache = recent.get_cache()
+        self.recent(headers[0], 1, 1)
+        cache.budget = cache.used * 2
+        self.recent(headers[1], 2, 2)
+        self.recent(headers[0], 1, 1)
+        self.recent(headers[2], 3, 3)
+        self.assertEqual((cache.is_warm(1), cache.is_warm(2), cache.is_warm(3)), (True, False, True))
+        self.assertLessEqual(cache.used, cache.budget)
+        self.assertEqual(cache.evictions, 1)
@@ -0,0 +1,99 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db, ledger
+from app.models import Role, TransactionType, Accounts, PendingPosting, Transactions
+
+
+class SettlementAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app.config['TRANSFER_NETTING'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, user_id, first_name, last_name, email, deposit):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        headers = {'Authorization': 'Bearer '+response.json['token']}
+        self.client.post('http://localhost:5000/api/users/{0}/accounts/{0}/deposit'.format(user_id), headers=headers,
+                         json={'deposit_amount': deposit})
+        return headers
+
+    def transfer(self, headers, user_id, to_account_num, amount):
+        return self.client.post('http://localhost:5000/api/users/{0}/accounts/{0}/transfer'.format(user_id),
+                                headers=headers, json={'to_account_num': to_account_num, 'amount': amount})
+
+    def balances(self):
+        db.session.expire_all()
+        return [account.balance for account in db.session.execute(db.select(Accounts).order_by(Accounts.account_num)).scalars()]
+
+
+    def test_netting_settlement(self):
+        """
+        Given three users holding 10 each, with transfer netting on
+
+        # 1
+        When they send each other transfers
+        Then verify that each is accepted as a pending posting (202) and no balance changes yet
+
+        # 2
+        When a sender transfers more than its balance less its pending postings
+        Then verify that the transfer is rejected
+
+        # 3
+        When a settlement cycle runs
+        Then verify that balances are updated once per account by their net, every transfer becomes a transaction
+        with its original time, and no posting is left
+        """
+        jane = self.register(1, 'Jane', 'Doe', 'janedoe@email.com', 10)
+        john = self.register(2, 'John', 'Doe', 'johndoe@email.com', 10)
+        self.register(3, 'Jim', 'Doe', 'jimdoe@email.com', 10)
+
+        # 1
+        for headers, user_id, to_account_num, amount in [(jane, 1, 2, 4), (john, 2, 1, 3), (jane, 1, 3, 5), (john, 2, 3, 1)]:
+            response = self.transfer(headers, user_id, to_account_num, amount)
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json['posting']['status'], 'pending')
+            self.assertEqual(response.json['account']['balance'], 10)
+        self.assertEqual(self.balances(), [10, 10, 10])
+
+        # 2
+        self.assertEqual(self.transfer(jane, 1, 2, 2).status_code, 400)
+        self.assertEqual(self.transfer(jane, 1, 2, 1).status_code, 202)
+
+        # 3
+        posted = db.session.execute(db.select(PendingPosting.date_time).order_by(PendingPosting.id)).scalars().all()
+        updates = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE accounts_table'):
+                updates.append(len(parameters) if executemany else 1)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(ledger.settle(), 5)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(sum(updates), 3)
+        self.assertEqual(self.balances(), [3, 11, 16])
+        self.assertEqual(db.session.execute(db.select(PendingPosting)).first(), None)
+        settled = db.session.execute(db.select(Transactions.date_time).where(Transactions.transaction_type_id ==
+                                     TransactionType.query.filter_by(name="Transfer").first().id)
+                                     .order_by(Transactions.id)).scalars().all()
+        self.assertEqual(settled, posted)
+        self.assertEqual(ledger.settle(), 0)
+        response = self.client.get('http://localhost:5000/api/users/1/transactions', headers=jane)
+        self.assertEqual(response.json['_meta']['total_transactions'], 6)
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, shards
+from app.models import Role, TransactionType, Accounts, Transactions
+
+
+class ShardsAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        Balances are split over two shard files: accounts 1 and 4 share shard 1, accounts 2 and 3 are in shard 0.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(LEDGER_SHARDS=2, LEDGER_SHARD_URL='sqlite:///' + os.path.join(self.directory, 'shard-{}.sqlite'))
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+        self.jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        for name in ('John', 'Jack', 'Jill'):
+            self.register(name, 'Doe', name.lower() + 'doe@email.com')
+        self.router = shards.get_router()
+
+    def tearDown(self) -> None:
+        self.router.dispose()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+    def transfer(self, to_account_num, amount):
+        return self.client.post('http://localhost:5000/api/users/1/accounts/1/transfer', headers=self.jane,
+                                json={'to_account_num': to_account_num, 'amount': amount})
+
+    def count(self, shard, table):
+        with self.router.engines[shard].connect() as connection:
+            return connection.execute(db.select(db.func.count()).select_from(table)).scalar()
+
+    def balances(self):
+        db.session.expire_all()
+        return [account.balance for account in Accounts.query.order_by(Accounts.account_num)]
+
+
+    def test_shard_deposit_and_transfers(self):
+        """
+        Given four users whose accounts are spread over two shards
+
+        # 1
+        When a user deposits, transfers within their shard and across shards through the API
+        Then verify that each is accepted (202) with the shard balances, and the database is unchanged
+
+        # 2
+        When a cross-shard transfer exceeds the sender's balance
+        Then verify that it is rejected and leaves no prepared credit behind
+
+        # 3
+        When the shards are synced
+        Then verify that balances and transactions are published to the database once
+        """
+        self.assertEqual([self.router.shard_of(account_num) for account_num in range(1, 5)], [1, 0, 0, 1])
+
+        # 1
+        response = self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=self.jane,
+                                    json={'deposit_amount': 10})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.json['account']['balance'], response.json['posting']['shard']), (10, 1))
+        response = self.transfer(4, 3)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['account']['balance'], 7)
+        response = self.transfer(2, 2)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['posting'], {'shard': 1, 'id': 3, 'from_acc': 1, 'to_acc': 2, 'amount': 2,
+                                                    'status': 'accepted'})
+        self.assertEqual([self.router.balance(account_num) for account_num in range(1, 5)], [5, 2, 0, 3])
+        self.assertEqual(self.router.transfers, {'local': 1, 'two_phase': 1})
+        self.assertEqual(self.balances(), [0, 0, 0, 0])
+
+        # 2
+        self.assertEqual(self.transfer(2, 100).status_code, 400)
+        self.assertEqual([self.router.balance(account_num) for account_num in range(1, 3)], [5, 2])
+        self.assertEqual(self.count(0, shards.shard_prepared), 0)
+
+        # 3
+        self.assertEqual([self.router.sync(2) for _ in range(3)], [2, 1, 0])
+        self.assertEqual(self.balances(), [5, 2, 0, 3])
+        self.assertEqual(Transactions.query.count(), 7)
+
+
+    def test_shard_recovery(self):
+        """
+        Given a funded account and interrupted cross-shard transfers
+
+        # 1
+        When a transfer stopped after its commit point is recovered
+        Then verify that the prepared credit is applied
+
+        # 2
+        When a credit prepared without a decision is recovered
+        Then verify that the transfer is aborted, and that its sender can no longer commit it
+
+        # 3
+        When recovery finds nothing left to do
+        Then verify that the decisions are pruned
+        """
+        self.router.deposit(1, 10)
+
+        # 1
+        complete, self.router._complete = self.router._complete, lambda *args: None
+        posting = self.router.transfer(1, 2, 4)
+        self.router._complete = complete
+        self.assertIsNotNone(posting.xid)
+        self.assertEqual((self.router.balance(1), self.router.balance(2)), (6, 0))
+        self.assertEqual(self.router.recover(grace=60), (0, 0))
+        self.assertEqual(self.router.recover(grace=0), (1, 0))
+        self.assertEqual((self.router.balance(2), self.count(0, shards.shard_prepared)), (4, 0))
+
+        # 2
+        with self.router.engines[0].begin() as connection:
+            connection.execute(shards.shard_prepared.insert().values(xid='a' * 32, account_num=2, amount=5, sender_shard=1,
+                                                                     created_at=datetime.utcnow() - timedelta(minutes=1)))
+        self.assertEqual(self.router.recover(grace=30), (0, 1))
+        self.assertEqual(self.router.balance(2), 4)
+        with self.router.engines[1].connect() as connection:
+            self.assertEqual(connection.execute(db.select(shards.shard_decisions.c.committed)
+                                                .where(shards.shard_decisions.c.xid == 'a' * 32)).scalar(), False)
+
+        # 3
+        self.router.recover(grace=0)
+        self.assertEqual(self.count(1, shards.shard_decisions), 0)
+        self.assertEqual(self.router.sync(100), 2)
+        self.assertEqual(self.balances(), [6, 4, 0, 0])
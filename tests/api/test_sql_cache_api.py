@@ -0,0 +1,77 @@
+import unittest
+from app import create_app, db
+from app.models import Role, TransactionType, User
+from app import sqlstats
+
+
+class CompiledCacheAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return {'Authorization': 'Bearer '+response.json['token']}
+
+
+    def test_hot_paths_hit_compiled_cache(self):
+        """
+        Given an administrator and two users, one funded
+
+        # 1
+        When the hot API paths (token check, accounts, history, deposit, transfer) are called again after a warm-up
+        Then verify that every statement they execute comes from the compiled cache
+
+        # 2
+        When the administrator reads the metrics
+        Then verify that the compiled cache statistics are reported
+        """
+        admin = self.register('admin', 'staff', 'admin@bank.com')
+        jane = self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johndoe@email.com')
+        user = User.query.filter_by(email='admin@bank.com').first()
+        user.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+
+        def hot_paths():
+            self.client.post('http://localhost:5000/api/users/2/accounts/2/deposit', headers=jane, json={'deposit_amount': 10})
+            self.client.post('http://localhost:5000/api/users/2/accounts/2/transfer', headers=jane, json={'to_account_num': 3, 'amount': 1})
+            self.client.get('http://localhost:5000/api/users/2/accounts', headers=jane)
+            self.client.get('http://localhost:5000/api/users/2/accounts/2', headers=jane)
+            self.client.get('http://localhost:5000/api/users/2/transactions', headers=jane)
+            self.client.get('http://localhost:5000/api/users/2/transactions?limit=2', headers=jane)
+            self.client.get('http://localhost:5000/api/users/2/accounts/2/recent_transactions', headers=jane)
+
+        # 1
+        # Two warm-up rounds: the recent transactions buffer only reads appended rows once it is warm
+        hot_paths()
+        hot_paths()
+        stats = sqlstats.get_stats()
+        stats.reset()
+        hot_paths()
+        metrics = stats.metrics()
+        self.assertEqual(metrics['top_misses'], [])
+        self.assertEqual(metrics['misses'], 0)
+        self.assertGreater(metrics['hits'], 20)
+
+        # 2
+        response = self.client.get('http://localhost:5000/api/admin/metrics', headers=admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json['sql_compiled_cache']['cached_statements'], 0)
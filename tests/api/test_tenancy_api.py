@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, tenancy
+from app.models import Role, TransactionType, User
+
+
+class TenancyAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Two tenants, acme and globex, each get a brand new database created with create_all().
+        acme is also served from bank.acme.test, the default database keeps serving localhost.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(TENANTS=('acme', 'globex'), TENANT_HOSTS={'bank.acme.test': 'acme'},
+                               TENANT_DATABASE_URL='sqlite:///' + os.path.join(self.directory, 'tenant-{}.sqlite'))
+        tenancy.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        for tenant in (None, 'acme', 'globex'):
+            with tenancy.use(tenant):
+                db.metadata.create_all(db.session.get_bind())
+                Role.insert_roles()
+                TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        self.app.extensions['tenant_engines'].dispose()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def register(self, host, first_name):
+        email = first_name.lower() + 'doe@email.com'
+        response = self.client.post('http://{}/api/users'.format(host), json={
+            'first_name': first_name, 'last_name': 'Doe', 'email': email, 'password': 'testpassword'})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('http://{}/api/tokens'.format(host), auth=(email, 'testpassword'))
+        return response.json['token']
+
+    def users(self, tenant):
+        with tenancy.use(tenant):
+            return [user.email for user in User.query.order_by(User.id)]
+
+
+    def test_tenants_have_separate_databases(self):
+        """
+        Given two tenants and the default database
+        When the same email registers with both tenants, and another user with the default database
+        Then each database holds only its own user, tokens carry the tenant that issued them and resolve its
+        database from any host
+        """
+        acme = self.register('acme.localhost', 'Jane')
+        globex = self.register('globex.localhost', 'Jane')
+        default = self.register('localhost', 'John')
+        self.assertEqual(self.users('acme'), ['janedoe@email.com'])
+        self.assertEqual(self.users('globex'), ['janedoe@email.com'])
+        self.assertEqual(self.users(None), ['johndoe@email.com'])
+        self.assertTrue(acme.startswith('acme.'))
+        self.assertTrue(globex.startswith('globex.'))
+        self.assertNotIn('.', default)
+
+        response = self.client.get('http://localhost/api/users/1', headers={'Authorization': 'Bearer ' + acme})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['email'], 'janedoe@email.com')
+        response = self.client.get('http://bank.acme.test/api/users/1', headers={'Authorization': 'Bearer ' + acme})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('http://localhost/api/users/1', headers={'Authorization': 'Bearer ' + default})
+        self.assertEqual(response.json['email'], 'johndoe@email.com')
+
+    def test_tokens_are_bound_to_their_tenant(self):
+        """
+        Given a token issued by acme
+        When it is sent to globex's host, with its prefix swapped for globex, or with an unknown tenant
+        Then globex's host refuses it, the swapped token matches no globex user and unknown tenants are not found
+        """
+        acme = self.register('acme.localhost', 'Jane')
+        self.register('globex.localhost', 'John')
+        response = self.client.get('http://globex.localhost/api/users/1', headers={'Authorization': 'Bearer ' + acme})
+        self.assertEqual(response.status_code, 401)
+        swapped = 'globex.' + tenancy.token_secret(acme)
+        response = self.client.get('http://localhost/api/users/1', headers={'Authorization': 'Bearer ' + swapped})
+        self.assertEqual(response.status_code, 401)
+        unknown = 'initech.' + tenancy.token_secret(acme)
+        response = self.client.get('http://localhost/api/users/1', headers={'Authorization': 'Bearer ' + unknown})
+        self.assertEqual(response.status_code, 404)
+
+    def test_engine_cache_evicts_least_recently_used(self):
+        """
+        Given an engine cache holding one engine
+        When both tenants are used in turn
+        Then each switch disposes the other tenant's engine and creates it again on its next use
+        """
+        cache = tenancy.EngineCache(self.app.config['TENANT_DATABASE_URL'], 1)
+        self.app.extensions['tenant_engines'].dispose()
+        self.app.extensions['tenant_engines'] = cache
+        self.register('acme.localhost', 'Jane')
+        self.register('globex.localhost', 'John')
+        self.assertEqual(self.users('acme'), ['janedoe@email.com'])
+        self.assertEqual(cache.metrics(), {'engines': 1, 'capacity': 1, 'created': 3, 'evictions': 2})
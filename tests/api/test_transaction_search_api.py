@@ -0,0 +1,143 @@
+import itertools
+import unittest
+from datetime import datetime
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Role, TransactionType, User, Accounts, Transactions
+from app.encoders import TRANSACTION_FIELDS
+from app.filters import TransactionSearch
+
+
+class TransactionSearchAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def seed(self):
+        """
+        Registers loreum (account 1) and dolor (account 2) through the API, backdates their New Account
+        transactions (1 and 2) to 2022-12-31, then adds for account 1:
+            - transactions 3-7: deposits of 10, 20, 30, 40, 50 on 2023-01-01 .. 2023-01-05
+            - transactions 8-9: transfers of 5 to account 2 on 2023-01-06 and from account 2 on 2023-01-07
+        Returns a bearer token for loreum.
+        """
+        for first_name, email in [('loreum', 'loreumipsum@email.com'), ('dolor', 'dolor@email.com')]:
+            self.client.post('http://localhost:5000/api/users', json={
+                'first_name': first_name, 'last_name': 'ipsum', 'email': email, 'password': 'testpassword'})
+        deposit = TransactionType.query.filter_by(name="Deposit").first()
+        transfer = TransactionType.query.filter_by(name="Transfer").first()
+        db.session.execute(db.update(Transactions).values(date_time=datetime(2022, 12, 31)))
+        rows = [Transactions(sender=1, receiver=1, amount=10 * day, date_time=datetime(2023, 1, day), transaction_type=deposit)
+                for day in range(1, 6)]
+        rows.append(Transactions(sender=1, receiver=2, amount=5, date_time=datetime(2023, 1, 6), transaction_type=transfer))
+        rows.append(Transactions(sender=2, receiver=1, amount=5, date_time=datetime(2023, 1, 7), transaction_type=transfer))
+        db.session.add_all(rows)
+        db.session.commit()
+        response = self.client.post('http://localhost:5000/api/tokens', auth=('loreumipsum@email.com', 'testpassword'))
+        return response.json['token']
+
+    def search(self, token, query):
+        response = self.client.get('http://localhost:5000/api/users/1/transactions?fields=id&' + query,
+                                   headers={'Authorization': 'Bearer '+token})
+        return response
+
+    def query_plan(self, stmt):
+        # EXPLAIN QUERY PLAN details of stmt, run with the exact SQL and parameters SQLAlchemy sends
+        captured = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            captured.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            db.session.execute(stmt).all()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        statement, parameters = captured[-1]
+        return [row[3] for row in db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+    def test_filters(self):
+        """
+        Given a user with deposits and transfers on known dates
+        When the transaction history is requested with each filter
+        Then verify that only the matching transactions are returned in the requested order
+        """
+        token = self.seed()
+        ids = lambda response: [txn['id'] for txn in response.json['transactions']]
+        self.assertEqual(ids(self.search(token, '')), [9, 8, 7, 6, 5, 4, 3, 1])
+        self.assertEqual(ids(self.search(token, 'from=2023-01-02&to=2023-01-04')), [6, 5, 4])
+        self.assertEqual(ids(self.search(token, 'from=2023-01-02&to=2023-01-04&sort=asc')), [4, 5, 6])
+        self.assertEqual(ids(self.search(token, 'to=2023-01-03T00:00:00')), [5, 4, 3, 1])
+        self.assertEqual(ids(self.search(token, 'type=Transfer')), [9, 8])
+        self.assertEqual(ids(self.search(token, 'counterparty_account=2')), [9, 8])
+        self.assertEqual(ids(self.search(token, 'min_amount=20&max_amount=40')), [6, 5, 4])
+        self.assertEqual(ids(self.search(token, 'type=Deposit&min_amount=35&sort=asc')), [6, 7])
+        self.assertEqual(ids(self.search(token, 'type=Withdrawal')), [])
+
+        for query in ['from=yesterday', 'min_amount=lots', 'sort=up', 'limit=0', 'cursor=nope']:
+            response = self.search(token, query)
+            self.assertEqual(response.status_code, 400)
+
+
+    def test_cursor_pagination(self):
+        """
+        Given a user with eight transactions
+        When the history is walked three at a time following next_cursor, in both sort orders
+        Then verify that every transaction is returned exactly once and the last page has no next cursor
+        """
+        token = self.seed()
+        for sort, expected in [('desc', [9, 8, 7, 6, 5, 4, 3, 1]), ('asc', [1, 3, 4, 5, 6, 7, 8, 9])]:
+            seen, query = [], 'limit=3&sort=' + sort
+            while True:
+                response = self.search(token, query)
+                self.assertEqual(response.status_code, 200)
+                seen += [txn['id'] for txn in response.json['transactions']]
+                cursor = response.json['_meta']['next_cursor']
+                if cursor is None:
+                    break
+                query = 'limit=3&sort={}&cursor={}'.format(sort, cursor)
+            self.assertEqual(seen, expected)
+
+
+    def test_query_plans_use_indexes(self):
+        """
+        Given every combination of filters, sort orders and cursor positions
+        When the history query plan is inspected
+        Then verify that transactions_table is always searched through an index and never scanned
+        """
+        self.seed()
+        filters = [
+            {'date_from': datetime(2023, 1, 2)},
+            {'date_to': datetime(2023, 1, 4)},
+            {'type_name': 'Transfer'},
+            {'counterparty': 2},
+            {'min_amount': 5},
+            {'max_amount': 40},
+        ]
+        accounts = db.select(Accounts.account_num).where(Accounts.owner == 1)
+        for size in range(len(filters) + 1):
+            for combination in itertools.combinations(filters, size):
+                for descending, after in itertools.product([True, False], [None, (datetime(2023, 1, 5), 7)]):
+                    options = dict(descending=descending, after=after, limit=3 if after else None)
+                    for item in combination:
+                        options.update(item)
+                    search = TransactionSearch(**options)
+                    plan = self.query_plan(search.apply(TRANSACTION_FIELDS.select(('id',), Transactions.date_time, Transactions.id), accounts))
+                    searches = [step for step in plan if 'transactions_table' in step]
+                    self.assertTrue(searches, options)
+                    for step in searches:
+                        self.assertTrue(step.startswith('SEARCH transactions_table USING'), (options, plan))
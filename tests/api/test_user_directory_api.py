@@ -0,0 +1,108 @@
+import unittest
+from app import create_app, db
+from app.models import Role, TransactionType, User
+
+
+class UserDirectoryAPITestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create an environment for the test that is close to a running application.
+        Application is configured for testing and context is activated to ensure that tests have access to current_app like requests do.
+        Brand new database gets created for tests with create_all().
+        """
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def register(self, first_name, last_name, email):
+        self.client.post('http://localhost:5000/api/users', json={
+            'first_name': first_name, 'last_name': last_name, 'email': email, 'password': 'testpassword'})
+
+    def get_token(self, email):
+        response = self.client.post('http://localhost:5000/api/tokens', auth=(email, 'testpassword'))
+        return response.json['token']
+
+    def search(self, token, query):
+        return self.client.get('http://localhost:5000/api/users?' + query, headers={'Authorization': 'Bearer '+token})
+
+
+    def test_prefix_search(self):
+        """
+        Given an administrator and a few registered users
+
+        # 1
+        When the directory is searched by partial names and emails
+        Then verify that every user matching all words as prefixes is returned
+
+        # 2
+        When a user's email is changed
+        Then verify that the directory follows the change
+
+        # 3
+        When a regular user searches the directory
+        Then verify that the response is forbidden (403)
+        """
+        self.register('admin', 'staff', 'admin@bank.com')
+        self.register('Jane', 'Doe', 'janedoe@email.com')
+        self.register('John', 'Doe', 'johnd@email.com')
+        self.register('Janet', 'Smith', 'jsmith@email.com')
+        admin = User.query.filter_by(email='admin@bank.com').first()
+        admin.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        token = self.get_token('admin@bank.com')
+        ids = lambda response: sorted(user['id'] for user in response.json['users'])
+
+        # 1
+        self.assertEqual(ids(self.search(token, 'q=jan')), [2, 4])
+        self.assertEqual(ids(self.search(token, 'q=do')), [2, 3])
+        self.assertEqual(ids(self.search(token, 'q=jan+do')), [2])
+        self.assertEqual(ids(self.search(token, 'q=jsmi')), [4])
+        self.assertEqual(ids(self.search(token, 'q=zed')), [])
+        response = self.search(token, 'q=john&fields=id,email')
+        self.assertEqual(response.json['users'], [{'id': 3, 'email': 'johnd@email.com'}])
+        self.assertEqual(self.search(token, 'q=%2A%22').status_code, 400)
+
+        # 2
+        User.query.filter_by(id=3).update(dict(email='zed@email.com'))
+        db.session.commit()
+        self.assertEqual(ids(self.search(token, 'q=zed')), [3])
+        self.assertEqual(ids(self.search(token, 'q=johnd')), [])
+
+        # 3
+        response = self.search(self.get_token('janedoe@email.com'), 'q=jan')
+        self.assertEqual(response.status_code, 403)
+
+
+    def test_ranked_keyset_pagination(self):
+        """
+        Given an administrator and twelve users sharing a last name
+        When the directory is walked five users at a time following next_cursor
+        Then verify that every user is returned exactly once and the last page has no next cursor
+        """
+        self.register('admin', 'staff', 'admin@bank.com')
+        for i in range(12):
+            self.register('user{}'.format(i), 'Tan', 'tan{}@email.com'.format(i))
+        admin = User.query.filter_by(email='admin@bank.com').first()
+        admin.role = Role.query.filter_by(name='Administrator').first()
+        db.session.commit()
+        token = self.get_token('admin@bank.com')
+
+        seen, query, pages = [], 'q=tan&limit=5', 0
+        while query:
+            response = self.search(token, query)
+            self.assertEqual(response.status_code, 200)
+            seen += [user['id'] for user in response.json['users']]
+            cursor = response.json['_meta']['next_cursor']
+            query = 'q=tan&limit=5&cursor=' + cursor if cursor else None
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), list(range(2, 14)))
@@ -5,6 +5,7 @@ from app.models import User, Role, TransactionType
 from flask import jsonify
 import json, requests
 from base64 import b64encode
+from datetime import datetime, timedelta
 
 class UsersAPITestCase(unittest.TestCase):
     def setUp(self)->None:
@@ -494,6 +495,35 @@ class UsersAPITestCase(unittest.TestCase):
         self.assertEqual(response.json, expected_json)
     
     
+    def test_get_user_account_balance_as_of_api(self):
+        """
+        Given a user account with a deposit made today
+        When the account is requested with as_of dates before and including today, and an invalid one
+        Then verify that the balance is the one at that time, and the invalid date is rejected
+        """
+        url = 'http://localhost:5000/api/users'
+        data = {
+            'first_name': 'loreum',
+            'last_name': 'ipsum',
+            'email': 'loreumipsum@email.com',
+            'password': 'testpassword'
+        }
+        response = self.client.post(url, json=data)
+        url_token = 'http://localhost:5000/api/tokens'
+        response = self.client.post(url_token, auth=('loreumipsum@email.com', 'testpassword'))
+        headers = {'Authorization': 'Bearer '+response.json['token']}
+        self.client.post('http://localhost:5000/api/users/1/accounts/1/deposit', headers=headers, json={'deposit_amount': 5})
+        
+        today = datetime.utcnow().date()
+        url_get_user_account = 'http://localhost:5000/api/users/1/accounts/1?as_of='
+        response = self.client.get(url_get_user_account + (today - timedelta(days=1)).isoformat(), headers=headers)
+        self.assertEqual(response.json['balance'], 0)
+        response = self.client.get(url_get_user_account + today.isoformat(), headers=headers)
+        self.assertEqual(response.json, {"account_num": 1, "balance": 5, "owner": 1})
+        response = self.client.get(url_get_user_account + 'yesterday', headers=headers)
+        self.assertEqual(response.status_code, 400)
+    
+    
     def test_get_user_account_api_fail(self):
         """
         Given an API for request a user's specific bank account information and a valid user account
@@ -309,4 +309,110 @@ class TransactionsCase(unittest.TestCase):
         self.assertEqual(transaction.amount, 10)
         self.assertEqual(transaction.transaction_type.name, "Deposit")
         
-        
\ No newline at end of file
+            
+    
+    def test_index_conditional_get(self) -> None:
+        """
+        GIVEN a logged in user viewing the index page
+        WHEN the page is requested again with the ETag received and then again after a deposit
+        THEN validate that the first revalidation is not modified (304) and the second returns the updated page
+        """
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword'
+        })
+        # The first page shows the registration message and is not cached
+        self.assertEqual(self.client.get('/index').headers['Cache-Control'], 'no-store')
+        response = self.client.get('/index')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        
+        response = self.client.get('/index', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        self.client.post('/auth/deposit', data={'amount': 10})
+        response = self.client.get('/index', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Balance: 10.0', response.data)
+    
+    
+    def test_index_conditional_get_after_flash(self) -> None:
+        """
+        GIVEN a logged in user holding the index page's ETag
+        WHEN the password is changed, then the email, each flashing a message and redirecting to the index page
+        THEN validate that both revalidations return the page (200) with the message, the second one with the new email
+        changing the ETag
+        """
+        self.client.post('/auth/register', data={
+            'first_name': 'devone',
+            'last_name': 'doe',
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword',
+            'password2': 'testpassword'
+        })
+        self.client.post('/auth/login', data={
+            'email': 'devonedoe@email.com',
+            'password': 'testpassword'
+        })
+        self.client.get('/index')
+        etag = self.client.get('/index').headers['ETag']
+        
+        self.client.post('/auth/change_password', data={
+            'old_password': 'testpassword',
+            'new_password': 'testpassword2',
+            'new_password_2': 'testpassword2'
+        })
+        response = self.client.get('/index', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Password changed successful!', response.data)
+        self.assertEqual(self.client.get('/index', headers={'If-None-Match': etag}).status_code, 304)
+        
+        self.client.post('/auth/update', data={'new_email': 'one@email.com', 'new_email_2': 'one@email.com', 'password': 'testpassword2'})
+        response = self.client.get('/index', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Email changed successful!', response.data)
+        response = self.client.get('/index', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+    
+    
+    def test_transfer_by_alias(self) -> None:
+        """
+        GIVEN two accounts, the recipient having changed their email after registering
+        WHEN the sender transfers to the recipient's new email typed in a different case, then to the old email
+        THEN validate that the first transfer reaches the recipient's account and the second is rejected
+        """
+        for name in ['devone', 'devtwo']:
+            self.client.post('/auth/register', data={
+                'first_name': name,
+                'last_name': 'doe',
+                'email': name + 'doe@email.com',
+                'password': 'testpassword',
+                'password2': 'testpassword'
+            })
+        self.client.post('/auth/login', data={'email': 'devonedoe@email.com', 'password': 'testpassword'})
+        self.client.post('/auth/update', data={'new_email': 'one@email.com', 'new_email_2': 'one@email.com', 'password': 'testpassword'})
+        self.client.get('/auth/logout')
+        self.client.post('/auth/login', data={'email': 'devtwodoe@email.com', 'password': 'testpassword'})
+        self.client.post('/auth/deposit', data={'amount': 10})
+        
+        response = self.client.post('/auth/transfer', data={
+            'recipient_alias': ' One@Email.com',
+            'amount': 4
+        }, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(db.session.get(Accounts, 1).balance, 4)
+        
+        response = self.client.post('/auth/transfer', data={
+            'recipient_alias': 'devonedoe@email.com',
+            'amount': 4
+        }, follow_redirects=True)
+        self.assertIn(b'User not found', response.data)
+        self.assertEqual(db.session.get(Accounts, 2).balance, 6)
@@ -0,0 +1,101 @@
+import unittest
+from app import create_app, db
+from app.models import Role, TransactionType, User, Accounts
+from app.bloom import BloomFilter, get_filters, email_may_exist, account_may_exist
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app.config['BLOOM_FILTER_MIN_CAPACITY'] = 100
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_user(self, email):
+        user = User(first_name='Jane', last_name='Doe', email=email)
+        user.set_password('testpassword')
+        db.session.add_all([user, Accounts(account_owner=user)])
+        db.session.commit()
+        return user
+
+    def test_false_positive_rate(self):
+        """
+        Given a Bloom filter sized for 1000 items at a 1% error rate, filled to capacity
+        When every added item and 10000 absent items are looked up
+        Then verify that there are no false negatives and the false positive rate stays near the target
+        """
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('user{}@email.com'.format(i))
+        self.assertTrue(all('user{}@email.com'.format(i) in bloom for i in range(1000)))
+        false_positives = sum('other{}@email.com'.format(i) in bloom for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.02)
+        self.assertAlmostEqual(bloom.estimated_false_positive_rate, 0.01, delta=0.005)
+
+    def test_negative_lookups(self):
+        """
+        Given users present before the filters are built
+
+        # 1
+        When the filters are first used
+        Then verify that existing emails and accounts may exist and unknown ones definitely do not
+
+        # 2
+        When users are added or change email afterwards
+        Then verify that the filters pick them up without a rebuild
+
+        # 3
+        When a row is written behind the ORM's back (another process)
+        Then verify that the catch-up sync finds it on a negative lookup
+
+        # 4
+        When more items than the capacity are added
+        Then verify that the filter is rebuilt with a larger capacity
+        """
+        self.add_user('janedoe@email.com')
+        # 1
+        self.assertTrue(email_may_exist('janedoe@email.com'))
+        self.assertTrue(account_may_exist(1))
+        self.assertFalse(email_may_exist('johndoe@email.com'))
+        self.assertFalse(account_may_exist(2))
+        self.assertEqual(get_filters()['emails'].metrics()['definite_negatives'], 1)
+
+        # 2
+        user = self.add_user('johndoe@email.com')
+        self.assertTrue(email_may_exist('johndoe@email.com'))
+        self.assertTrue(account_may_exist(2))
+        user.email = 'john@email.com'
+        db.session.commit()
+        self.assertTrue(email_may_exist('john@email.com'))
+
+        # 3
+        db.session.execute(db.insert(User).values(first_name='Ann', last_name='Lee', email='ann@email.com'))
+        db.session.commit()
+        self.assertTrue(email_may_exist('ann@email.com'))
+
+        # 4
+        emails = get_filters()['emails']
+        capacity = emails.filter.capacity
+        for i in range(capacity):
+            emails.add('bulk{}@email.com'.format(i))
+        self.assertTrue(email_may_exist('janedoe@email.com'))
+        self.assertGreaterEqual(emails.filter.capacity, capacity)
+        self.assertEqual(emails.filter.count, 3)
+
+    def test_disabled(self):
+        """
+        Given the Bloom filters disabled in the configuration
+        When an unknown email is looked up
+        Then verify that the lookup always falls through to the database
+        """
+        self.app.config['BLOOM_FILTER_ENABLED'] = False
+        self.assertTrue(email_may_exist('nobody@email.com'))
+        self.assertNotIn('bloom_filters', self.app.extensions)
@@ -0,0 +1,56 @@
+import json
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from app import json_provider
+from app.encoders import UrlTemplate, RowEncoder, UserEncoder, USER_FIELDS
+
+
+class JSONProviderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.test_request_context()
+        self.app_context.push()
+
+    def tearDown(self) -> None:
+        self.app_context.pop()
+
+    def test_matches_default_provider(self):
+        """
+        Given the application's JSON provider and Flask's default provider
+        When both serialise the same payload, with and without orjson installed
+        Then verify that the decoded documents are identical and keys are sorted
+        """
+        payload = {'b': 1.5, 'a': [1, 'x', None], 'when': datetime(2023, 6, 5, 18, 27, 15), 'c': {'z': True, 'y': 'é'}}
+        expected = json.loads(DefaultJSONProvider(self.app).dumps(payload))
+        self.assertIsInstance(self.app.json, json_provider.FastJSONProvider)
+        for orjson in [json_provider.orjson, None]:
+            with patch.object(json_provider, 'orjson', orjson):
+                dumped = self.app.json.dumps(payload)
+                self.assertEqual(json.loads(dumped), expected)
+                self.assertEqual(list(json.loads(dumped)), ['a', 'b', 'c', 'when'])
+                self.assertEqual(self.app.json.loads(dumped), expected)
+                response = self.app.json.response(payload)
+                self.assertEqual(response.mimetype, 'application/json')
+                self.assertEqual(response.json, expected)
+
+    def test_encoders(self):
+        """
+        Given URL templates and row encoders
+        When they encode column tuples
+        Then verify that the output matches url_for and the model to_dict keys
+        """
+        template = UrlTemplate('api.get_accounts', 'id')
+        self.assertEqual(template(12), '/api/users/12/accounts')
+        self.assertEqual(RowEncoder(['account_num', 'owner', 'balance']).encode_all([(1, 2, 3.0)]),
+                         [{'account_num': 1, 'owner': 2, 'balance': 3.0}])
+        self.assertEqual(UserEncoder(USER_FIELDS.keys).encode((1, 'Jane', 'Doe', 'janedoe@email.com', 1, 1)), {
+            "id": 1,
+            "first_name": "Jane",
+            "last_name": "Doe",
+            "email": "janedoe@email.com",
+            "accounts": "/api/users/1/accounts",
+            "transactions": "/api/users/1/transactions"
+        })
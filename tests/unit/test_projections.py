@@ -0,0 +1,111 @@
+import unittest
+from datetime import datetime
+from app import create_app, db, ledger, projections
+from app.models import Role, TransactionType, User, Accounts, Transactions, LedgerCheckpoint
+
+
+class ProjectionsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app.config['LEDGER_CHECKPOINTS_KEPT'] = 2
+        self.app_context = self.app.test_request_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_user(self, first_name, email):
+        user = User(first_name=first_name, last_name='Doe', email=email)
+        user.set_password('testpassword')
+        db.session.add(user)
+        db.session.commit()
+        return ledger.open_account(user)
+
+    def balances(self):
+        db.session.expire_all()
+        return [account.current_balance for account in Accounts.query.order_by(Accounts.account_num)]
+
+
+    def test_replay_and_rebuild(self):
+        """
+        Given two accounts with deposits, transfers, a hot account credit and a withdrawal in the journal
+
+        # 1
+        When the journal is replayed in small chunks
+        Then verify that the replayed balances match the accounts
+
+        # 2
+        When a balance is corrupted and the ledger rebuilt
+        Then verify that the corruption is reported by a dry run and repaired otherwise
+        """
+        jane_acc, john_acc = self.add_user('Jane', 'janedoe@email.com'), self.add_user('John', 'johndoe@email.com')
+        ledger.set_hot(john_acc, 2)
+        ledger.deposit(jane_acc, 10)
+        ledger.transfer(jane_acc, john_acc, 4)
+        self.assertIsNotNone(ledger.transfer(john_acc, jane_acc, 1))
+        withdrawal = TransactionType.query.filter_by(name='Withdrawal').first()
+        db.session.add(Transactions(sender=1, receiver=1, amount=2, date_time=datetime.utcnow(), transaction_type=withdrawal))
+        jane_acc.update_balance(-2)
+        db.session.commit()
+        self.assertEqual(self.balances(), [5, 3])
+
+        # 1
+        result = projections.replay(chunk_size=2)
+        self.assertEqual(result.balances, {1: 5, 2: 3})
+        self.assertEqual(result.txn_id, 6)
+        self.assertEqual(result.postings, 8)
+
+        # 2
+        db.session.execute(db.update(Accounts).where(Accounts.account_num == 2).values(balance=100))
+        db.session.commit()
+        result, mismatches = projections.rebuild_balances(dry_run=True)
+        self.assertEqual(mismatches, [(2, 100, 3)])
+        self.assertEqual(self.balances(), [5, 100])
+        result, mismatches = projections.rebuild_balances()
+        self.assertEqual(len(mismatches), 1)
+        self.assertEqual(self.balances(), [5, 3])
+        self.assertEqual(projections.rebuild_balances()[1], [])
+
+
+    def test_checkpoints(self):
+        """
+        Given two accounts with a transfer
+
+        # 1
+        When checkpoints are taken before and after more transfers
+        Then verify that each replays only the transactions after the previous one and old checkpoints are dropped
+
+        # 2
+        When a recorded transaction is changed or deleted through the ORM
+        Then verify that the journal refuses it
+        """
+        jane_acc, john_acc = self.add_user('Jane', 'janedoe@email.com'), self.add_user('John', 'johndoe@email.com')
+        ledger.deposit(jane_acc, 10)
+
+        # 1
+        first = projections.checkpoint()
+        self.assertEqual(first.txn_id, 3)
+        self.assertEqual(projections.checkpoint().id, first.id)
+        ledger.transfer(jane_acc, john_acc, 4)
+        second = projections.checkpoint()
+        ledger.transfer(john_acc, jane_acc, 1)
+        result = projections.replay()
+        self.assertEqual((result.balances, result.postings), ({1: 7, 2: 3}, 2))
+        projections.checkpoint()
+        self.assertEqual([checkpoint.txn_id for checkpoint in LedgerCheckpoint.query.order_by(LedgerCheckpoint.id)], [4, 5])
+        self.assertEqual(dict((row.account_num, row.balance) for row in second.balances), {1: 6, 2: 4})
+        self.assertEqual(projections.replay(full=True).balances, {1: 7, 2: 3})
+
+        # 2
+        txn = db.session.get(Transactions, 4)
+        txn.amount = 40
+        self.assertRaises(RuntimeError, db.session.commit)
+        db.session.rollback()
+        db.session.delete(db.session.get(Transactions, 4))
+        self.assertRaises(RuntimeError, db.session.commit)
+        db.session.rollback()
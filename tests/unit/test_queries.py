@@ -0,0 +1,86 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, ledger, queries
+from app.models import Role, TransactionType, User, Accounts, Transactions, Posting
+
+
+class QueriesTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.app = create_app('testing')
+        self.app_context = self.app.test_request_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        TransactionType.insert_transaction_types()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_user(self, first_name, email):
+        user = User(first_name=first_name, last_name='Doe', email=email)
+        user.set_password('testpassword')
+        db.session.add(user)
+        db.session.commit()
+        return ledger.open_account(user)
+
+    def test_rows_match_models(self):
+        """
+        Given two users with a deposit and a transfer between them
+        When users, accounts and transactions are read through app.queries
+        Then verify that the named tuples carry the same data as the ORM models, without adding them to the session
+        """
+        jane_acc, john_acc = self.add_user('Jane', 'janedoe@email.com'), self.add_user('John', 'johndoe@email.com')
+        ledger.deposit(jane_acc, 10)
+        ledger.transfer(jane_acc, john_acc, 4)
+        db.session.expunge_all()
+
+        self.assertEqual(queries.user(1), (1, 'Jane', 'Doe', 'janedoe@email.com'))
+        self.assertIsNone(queries.user(3))
+        self.assertEqual(queries.first_account(1).to_dict(), Accounts.query.get(1).to_dict())
+        self.assertEqual(queries.accounts(2), [queries.AccountRow(2, 2, 4)])
+        db.session.expunge_all()
+
+        rows = queries.transactions(1, 10)
+        self.assertEqual([row.id for row in rows], [4, 3, 1])
+        self.assertEqual(len(db.session.identity_map), 0)
+        for row in rows:
+            txn = Transactions.query.get(row.id)
+            self.assertEqual(row.to_dict(), dict(txn.to_dict(), date_time=txn.date_time))
+        self.assertEqual(queries.transaction(4).to_name, 'John Doe')
+        self.assertEqual(queries.transactions(1, 1), rows[:1])
+
+
+    def test_postings(self):
+        """
+        Given two users with a deposit, a transfer between them and a bulk inserted transfer
+
+        # 1
+        When the postings are read
+        Then verify that every transaction has one signed leg per account and they add up to the balances
+
+        # 2
+        When statements and balances as of a point in time are read
+        Then verify that rows carry the account's signed amount and only earlier postings are summed
+        """
+        jane_acc, john_acc = self.add_user('Jane', 'janedoe@email.com'), self.add_user('John', 'johndoe@email.com')
+        ledger.deposit(jane_acc, 10)
+        ledger.transfer(jane_acc, john_acc, 4)
+        later = datetime.utcnow() + timedelta(days=1)
+        transfer = TransactionType.query.filter_by(name='Transfer').first()
+        db.session.execute(db.insert(Transactions), [{'sender': 2, 'receiver': 1, 'amount': 1, 'date_time': later,
+                                                      'transaction_type_id': transfer.id}])
+        db.session.commit()
+
+        # 1
+        legs = db.session.execute(db.select(Posting.txn_id, Posting.account_num, Posting.amount).order_by(Posting.id)).all()
+        self.assertEqual(legs, [(1, 1, 0), (2, 2, 0), (3, 1, 10), (4, 2, 4), (4, 1, -4), (5, 1, 1), (5, 2, -1)])
+
+        # 2
+        self.assertEqual([(row.id, row.signed_amount) for row in queries.transactions(1, 10)], [(5, 1), (4, -4), (3, 10), (1, 0)])
+        self.assertEqual([(row.id, row.signed_amount) for row in queries.transactions(2, 10)], [(5, -1), (4, 4), (2, 0)])
+        self.assertEqual([(account_num, row.signed_amount) for account_num, row in queries.transaction_legs(4)], [(2, 4), (1, -4)])
+        self.assertEqual(queries.balance_as_of(1, later), 6)
+        self.assertEqual(queries.balance_as_of(1, later + timedelta(seconds=1)), 7)
+        self.assertEqual(queries.balance_as_of(2, datetime(2000, 1, 1)), 0)
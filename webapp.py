@@ -1,7 +1,8 @@
 import os
-from app import create_app, db
-from app.models import User, Role
-from flask_migrate import Migrate
+import click
+from app import create_app, db, ledger, projections, archive, shards, tenancy, clearing, analytics
+from app.models import User, Role, Accounts, TransactionType, IdempotencyKey
+from flask_migrate import Migrate, upgrade, stamp
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
 migrate = Migrate(app, db)
@@ -14,4 +15,161 @@ def make_shell_context():
 def test():
     import unittest
     tests = unittest.TestLoader().discover('tests')
-    unittest.TextTestRunner(verbosity=2).run(tests)
\ No newline at end of file
+    unittest.TextTestRunner(verbosity=2).run(tests)
+
+@app.cli.command('hot-account')
+@click.argument('account_num', type=int)
+@click.option('--slots', type=int, default=None, help='Credit slots, 0 turns the account back to a regular one')
+def hot_account(account_num, slots):
+    """Flags an account receiving many concurrent credits as hot"""
+    account = db.session.get(Accounts, account_num)
+    if account is None:
+        raise click.BadParameter('No account {}'.format(account_num), param_hint='ACCOUNT_NUM')
+    slots = app.config['HOT_ACCOUNT_SLOTS'] if slots is None else slots
+    if slots < 0:
+        raise click.BadParameter('Must not be negative', param_hint='--slots')
+    ledger.set_hot(account, slots)
+    click.echo('Account {}: {} credit slots'.format(account_num, slots))
+
+
+@app.cli.command('fold-balances')
+def fold_balances():
+    """Folds the credit slots of hot accounts into their main balances, run periodically"""
+    click.echo('Folded {} hot accounts'.format(ledger.fold_all()))
+
+
+@app.cli.command('settle-transfers')
+def settle_transfers():
+    """Settles every pending transfer posting, in cycles of SETTLEMENT_BATCH_SIZE, run periodically"""
+    settled = cycles = 0
+    while True:
+        count = ledger.settle()
+        if not count:
+            break
+        settled += count
+        cycles += 1
+    click.echo('Settled {} transfers in {} cycles'.format(settled, cycles))
+
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys():
+    """Deletes expired idempotency keys and in-flight keys past their lease, run periodically"""
+    purged = IdempotencyKey.purge_expired(app.config['IDEMPOTENCY_KEY_TTL'], app.config['IDEMPOTENCY_LEASE'])
+    db.session.commit()
+    click.echo('Purged {} idempotency keys'.format(purged))
+
+
+@app.cli.command('checkpoint-ledger')
+def checkpoint_ledger():
+    """Records the balances replayed from the transaction journal as a checkpoint, run periodically"""
+    checkpoint = projections.checkpoint()
+    click.echo('Checkpoint {} at transaction {}'.format(checkpoint.id, checkpoint.txn_id))
+
+
+@app.cli.command('replay-ledger')
+@click.option('--full', is_flag=True, help='Replay the whole journal instead of starting from the latest checkpoint')
+@click.option('--dry-run', is_flag=True, help='Only report the accounts whose balance disagrees with the journal')
+@click.option('--chunk-size', type=int, default=None, help='Transaction ids per chunk')
+def replay_ledger(full, dry_run, chunk_size):
+    """Rebuilds account balances from the transaction journal"""
+    result, mismatches = projections.rebuild_balances(full=full, dry_run=dry_run, chunk_size=chunk_size)
+    click.echo('Replayed {} postings up to transaction {} in {:.2f} s ({:.0f} postings/s)'.format(
+        result.postings, result.txn_id, result.seconds, result.postings / result.seconds if result.seconds else 0))
+    for account_num, projected, replayed in mismatches:
+        click.echo('Account {}: balance {} journal {}'.format(account_num, projected, replayed))
+    click.echo('{} {} accounts'.format('Found' if dry_run else 'Repaired', len(mismatches)))
+
+
+@app.cli.command('archive-transactions')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Archive the months ending before the month of this date, TRANSACTION_ARCHIVE_HORIZON_DAYS ago by default')
+@click.option('--compress/--no-compress', default=None, help='Gzip the archive files, TRANSACTION_ARCHIVE_COMPRESS by default')
+def archive_transactions(before, compress):
+    """Moves whole months of old transactions into read-only monthly archive files, run periodically"""
+    checkpoint = projections.checkpoint()
+    for partition in archive.archive_transactions(checkpoint.txn_id, before=before, compress=compress):
+        click.echo('Archived {} transactions of {} to {}'.format(partition.transactions, partition.month, partition.path))
+    click.echo('Run VACUUM on the database to return the space freed to the file system')
+
+
+@app.cli.command('refresh-analytics')
+@click.option('--chunk-size', type=int, default=None, help='Transactions per chunk, ANALYTICS_CHUNK_SIZE by default')
+def refresh_analytics(chunk_size):
+    """Appends the transactions recorded since the last refresh to the columnar analytics snapshot, run periodically"""
+    appended = analytics.refresh(chunk_size)
+    click.echo('Appended {} transactions, the snapshot holds {}'.format(appended, analytics.get_snapshot().rows))
+
+
+@app.cli.command('sync-shards')
+def sync_shards():
+    """Recovers interrupted cross-shard transfers and publishes the shard journals to the database, run periodically"""
+    if not shards.enabled():
+        raise click.UsageError('LEDGER_SHARDS is not set')
+    router = shards.get_router()
+    applied, aborted = router.recover(app.config['LEDGER_SHARD_RECOVERY_GRACE'])
+    published = 0
+    while True:
+        count = router.sync(app.config['LEDGER_SHARD_SYNC_BATCH_SIZE'])
+        if not count:
+            break
+        published += count
+    click.echo('Recovered {} transfers ({} aborted), published {} journal rows'.format(applied + aborted, aborted, published))
+
+
+@app.cli.command('tenant-upgrade')
+@click.argument('tenant')
+def tenant_upgrade(tenant):
+    """Runs the database migrations on a tenant's database, flask db upgrade covers the default one"""
+    try:
+        with tenancy.use(tenant):
+            upgrade()
+    except LookupError as e:
+        raise click.BadParameter(str(e), param_hint='TENANT')
+
+
+@app.cli.command('tenant-init')
+@click.argument('tenant')
+def tenant_init(tenant):
+    """Creates a tenant's database: schema stamped at the latest migration, roles and transaction types"""
+    try:
+        with tenancy.use(tenant):
+            db.metadata.create_all(tenancy.get_engine(tenant))
+            stamp()
+            Role.insert_roles()
+            TransactionType.insert_transaction_types()
+    except LookupError as e:
+        raise click.BadParameter(str(e), param_hint='TENANT')
+    click.echo('Tenant {} ready'.format(tenant))
+
+
+@app.cli.group('clearing')
+def clearing_files():
+    """Inter-bank clearing files"""
+
+
+@clearing_files.command('export')
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(clearing.FORMATS), default=None,
+              help='csv for .csv files, CLEARING_FILE_FORMAT otherwise')
+def clearing_export(path, fmt):
+    """Writes the outbound inter-bank postings not exported yet to a clearing file, run periodically"""
+    clearing_file = clearing.export_file(path, fmt)
+    if clearing_file is None:
+        click.echo('Nothing to export')
+        return
+    click.echo('Exported {} postings ({:.2f}) to {}'.format(clearing_file.entries, clearing_file.total, path))
+
+
+@clearing_files.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(clearing.FORMATS), default=None,
+              help='csv for .csv files, CLEARING_FILE_FORMAT otherwise')
+@click.option('--dry-run', is_flag=True, help='Only validate the file, nothing is posted')
+def clearing_import(path, fmt, dry_run):
+    """Posts an inbound clearing file to the accounts it credits, all of it or nothing"""
+    try:
+        clearing_file = clearing.import_file(path, fmt, dry_run=dry_run)
+    except (ValueError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+    click.echo('{} {} postings ({:.2f}) from {}'.format('Validated' if dry_run else 'Imported', clearing_file.entries,
+                                                       clearing_file.total, path))